@@ -0,0 +1,96 @@
+"""
+Dashboard summary endpoint
+
+Runs the independent dashboard queries concurrently and returns them as one payload.
+"""
+from datetime import datetime
+from typing import List
+import asyncio
+import os
+
+from fastapi import APIRouter, Query
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlmodel import Session, select
+
+from app.api.metrics import PERIODS, MetricsResponse, ModelUsageResponse, _compute_metrics, _compute_model_usage
+from app.api.traces import TraceResponse
+from app.db.database import read_engine
+from app.models.trace import Trace
+from app.services.cache import AsyncTTLCache
+from app.services.observability import QUERY_LATENCY
+
+router = APIRouter()
+
+# 同じ (プロジェクト, 期間) の結果を使い回す秒数。0 でキャッシュしない（同時リクエストの集約は常に行う）
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "5"))
+# 一覧に載せる直近トレース数
+DASHBOARD_RECENT_TRACES = int(os.getenv("DASHBOARD_RECENT_TRACES", "50"))
+
+_cache = AsyncTTLCache("dashboard", ttl=DASHBOARD_CACHE_TTL)
+
+
+class DashboardResponse(BaseModel):
+    project_id: str
+    period: str
+    generated_at: datetime
+    metrics: MetricsResponse
+    model_usage: List[ModelUsageResponse]
+    recent_traces: List[TraceResponse]
+
+
+def _in_own_session(name: str, fn, *args):
+    """
+    独立したセッションでクエリを実行（スレッドプールから呼ばれる）
+
+    Session はスレッド間で共有できないので、並列に走るクエリごとに開く。
+    """
+    with QUERY_LATENCY.labels(name).time(), Session(read_engine) as session:
+        return fn(*args, session)
+
+
+def _recent_traces(project_id: str, session: Session) -> List[TraceResponse]:
+    """直近のトレース一覧（セッションを閉じる前にレスポンス型へ変換する）"""
+    query = (
+        select(Trace)
+        .where(Trace.project_id == project_id)
+        .order_by(Trace.created_at.desc())
+        .limit(DASHBOARD_RECENT_TRACES)
+    )
+    return [TraceResponse.model_validate(t, from_attributes=True) for t in session.exec(query).all()]
+
+
+async def _build_dashboard(project_id: str, period: str) -> DashboardResponse:
+    """3つのクエリを同時に投げ、全部揃ったら1つのペイロードにまとめる"""
+    with QUERY_LATENCY.labels("dashboard").time():
+        metrics, model_usage, recent_traces = await asyncio.gather(
+            run_in_threadpool(_in_own_session, "metrics", _compute_metrics, project_id, period),
+            run_in_threadpool(_in_own_session, "model_usage", _compute_model_usage, project_id, period),
+            run_in_threadpool(_in_own_session, "recent_traces", _recent_traces, project_id),
+        )
+    return DashboardResponse(
+        project_id=project_id,
+        period=period,
+        generated_at=datetime.utcnow(),
+        metrics=metrics,
+        model_usage=model_usage,
+        recent_traces=recent_traces,
+    )
+
+
+@router.get("/dashboard", response_model=DashboardResponse)
+async def get_dashboard(
+    project_id: str = Query(..., description="プロジェクトID"),
+    period: str = Query("24h", description="期間 (1h, 24h, 7d, 30d)"),
+):
+    """
+    ダッシュボード表示に必要なデータ（メトリクス・モデル別使用状況・直近トレース）をまとめて取得
+
+    ページ読み込みが集中しても、同じ (プロジェクト, 期間) の集計は DASHBOARD_CACHE_TTL 秒に1回だけ走る。
+    """
+    # 不明な期間は24h扱いなので、キャッシュキーもそろえる
+    if period not in PERIODS:
+        period = "24h"
+    return await _cache.get_or_compute(
+        (project_id, period), lambda: _build_dashboard(project_id, period)
+    )
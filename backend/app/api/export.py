@@ -0,0 +1,53 @@
+"""
+Export API endpoints
+"""
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from app.db.database import read_engine
+from app.services.export import (
+    HAS_PYARROW, EXPORT_FORMATS, EXPORT_TABLES, MEDIA_TYPES, iter_export
+)
+
+router = APIRouter()
+
+
+@router.get("/export")
+def export_data(
+    project_id: str = Query(..., description="プロジェクトID"),
+    table: str = Query("spans", description="エクスポート対象 (spans, traces)"),
+    format: str = Query("parquet", description="出力形式 (arrow, parquet)"),
+    start: Optional[datetime] = Query(None, description="期間の開始（トレースの開始時刻）"),
+    end: Optional[datetime] = Query(None, description="期間の終了（トレースの開始時刻）"),
+    include_payload: bool = Query(False, description="入出力ペイロード列を含める"),
+):
+    """トレース/スパンを列指向形式でストリーミングエクスポート"""
+    if not HAS_PYARROW:
+        raise HTTPException(status_code=501, detail="pyarrow is not installed on the server")
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=400, detail=f"table must be one of {EXPORT_TABLES}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {EXPORT_FORMATS}")
+    
+    def stream():
+        # レスポンス送信中もカーソルを保持するため、セッションはジェネレータ内で開く
+        with Session(read_engine) as session:
+            yield from iter_export(
+                session,
+                project_id=project_id,
+                table=table,
+                fmt=format,
+                start=start,
+                end=end,
+                include_payload=include_payload
+            )
+    
+    extension = "arrows" if format == "arrow" else "parquet"
+    return StreamingResponse(
+        stream(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{project_id}-{table}.{extension}"'}
+    )
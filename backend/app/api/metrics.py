@@ -2,16 +2,45 @@
 Metrics API endpoints
 """
 from datetime import datetime, timedelta
-from typing import Optional
-from fastapi import APIRouter, Depends, Query
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, select, func
 from pydantic import BaseModel
 
-from app.db.database import get_session
+from app.db.database import get_read_session, naive_utc
 from app.models.trace import Trace, Span
+from app.services import analytics, releases, timeseries, topk
+from app.services.observability import QUERY_LATENCY
 
 router = APIRouter()
 
+# period パラメータで指定できる期間
+PERIODS = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30)
+}
+
+
+def _resolve_period(period: str) -> Tuple[datetime, datetime]:
+    """period（1h, 24h, 7d, 30d。不明な値は24h）を (開始, 現在) に変換"""
+    now = datetime.utcnow()
+    return now - PERIODS.get(period, timedelta(hours=24)), now
+
+
+def _resolve_window(start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """
+    start/end（省略時は24時間前/現在）をDBの保存形式（タイムゾーンなしUTC）に揃えて返す
+
+    "2026-10-19T00:00:00Z" のようなタイムゾーン付きの指定も、省略時の現在時刻と比べられるようにする。
+    """
+    end = naive_utc(end) if end is not None else datetime.utcnow()
+    start = naive_utc(start) if start is not None else end - timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
 
 class MetricsResponse(BaseModel):
     """メトリクス集計結果"""
@@ -45,25 +74,164 @@ class ModelUsageResponse(BaseModel):
     total_tokens: int
     total_cost_usd: float
     avg_duration_ms: float
+    cache_hits: int = 0  # SDKの応答キャッシュから返した呼び出し数
+    cache_hit_rate: float = 0.0  # call_count に占める割合
+    saved_cost_usd: float = 0.0  # キャッシュで払わずに済んだコスト
+
+
+class BreakdownPoint(BaseModel):
+    """グループ × 時間バケット1つ分の集計"""
+    bucket_start: datetime
+    count: int
+    error_count: int
+    total_tokens: int
+    total_cost_usd: float
+    avg_duration_ms: Optional[float]
+    p50_duration_ms: Optional[float]
+    p95_duration_ms: Optional[float]
+    p99_duration_ms: Optional[float]
+
+
+class BreakdownSeries(BaseModel):
+    """グループ1つ分の時系列"""
+    group: str
+    count: int
+    error_count: int
+    total_tokens: int
+    total_cost_usd: float
+    points: List[BreakdownPoint]
+
+
+class BreakdownResponse(BaseModel):
+    """グループ別・時間バケット別の集計結果"""
+    level: str
+    group_by: str
+    start: datetime
+    end: datetime
+    interval_seconds: int
+    series: List[BreakdownSeries]
+
+
+class TimeseriesPoint(BaseModel):
+    """時系列の1バケット"""
+    timestamp: datetime
+    trace_count: int
+    error_count: int
+    total_tokens: int
+    total_cost_usd: float
+    avg_duration_ms: Optional[float]
+    max_duration_ms: Optional[float]
+
+
+class LatencyPoint(BaseModel):
+    """間引き後のトレース所要時間（生データの点）"""
+    timestamp: datetime
+    duration_ms: float
+
+
+class TimeseriesResponse(BaseModel):
+    """コスト・トークン・レイテンシの時系列"""
+    start: datetime
+    end: datetime
+    bucket_seconds: int
+    source: str  # "rollup", "raw", "mixed"
+    points: List[TimeseriesPoint]
+    latency: List[LatencyPoint]
+
+
+class TopItem(BaseModel):
+    """上位キーの1件（真の値は value - error 以上 value 以下）"""
+    key: str
+    value: float
+    error: float
+
+
+class TopResponse(BaseModel):
+    """上位K件（Space-Saving サマリーによる見積もり）"""
+    dimension: str
+    metric: str
+    start: datetime
+    end: datetime
+    total: float  # 期間の合計（正確な値）
+    max_error: float  # サマリーに残っていないキーの値の上限（0 なら全キーが正確）
+    items: List[TopItem]
+
+
+class ReleaseSummary(BaseModel):
+    """リリースごとのトレース数"""
+    release: str
+    trace_count: int
+    error_count: int
+    first_seen: Optional[datetime]
+    last_seen: Optional[datetime]
+
+
+class ReleaseSide(BaseModel):
+    """比較する片方のリリースの値"""
+    trace_count: int
+    error_rate: Optional[float]
+    mean_duration_ms: Optional[float]
+    p50_duration_ms: Optional[float]
+    p95_duration_ms: Optional[float]
+    p99_duration_ms: Optional[float]
+    tokens_per_trace: Optional[float]
+    cost_per_trace_usd: Optional[float]
+
+
+class MetricComparison(BaseModel):
+    """1つの指標の比較（change は相対変化。error_rate だけはポイント差）"""
+    metric: str
+    baseline: Optional[float]
+    candidate: Optional[float]
+    change: Optional[float]
+    p_value: Optional[float]  # データ不足で検定しなかったときは None
+    regression: bool
+
+
+class ReleaseComparison(BaseModel):
+    """全体（trace_name が None）またはトレース名ごとの比較"""
+    trace_name: Optional[str]
+    baseline: ReleaseSide
+    candidate: ReleaseSide
+    metrics: List[MetricComparison]
+
+
+class ReleaseCompareResponse(BaseModel):
+    baseline: str
+    candidate: str
+    alpha: float
+    regression: bool  # いずれかの指標で悪化を検出した
+    comparisons: List[ReleaseComparison]
+
+
+def _release_side(stats: releases.Stats) -> ReleaseSide:
+    return ReleaseSide(
+        trace_count=stats.trace_count,
+        error_rate=stats.error_rate,
+        mean_duration_ms=stats.duration.mean(),
+        p50_duration_ms=stats.duration.quantile(0.5),
+        p95_duration_ms=stats.duration.quantile(0.95),
+        p99_duration_ms=stats.duration.quantile(0.99),
+        tokens_per_trace=stats.mean_and_variance("tokens")[0],
+        cost_per_trace_usd=stats.mean_and_variance("cost_usd")[0],
+    )
 
 
 @router.get("/metrics", response_model=MetricsResponse)
-async def get_metrics(
+def get_metrics(
     project_id: str = Query(..., description="プロジェクトID"),
     period: str = Query("24h", description="期間 (1h, 24h, 7d, 30d)"),
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_read_session)
 ):
     """メトリクスを取得"""
+    with QUERY_LATENCY.labels("metrics").time():
+        return _compute_metrics(project_id, period, session)
+
+
+def _compute_metrics(project_id: str, period: str, session: Session) -> MetricsResponse:
+    """期間内のトレースを集計"""
     # 期間を計算
-    now = datetime.utcnow()
-    period_map = {
-        "1h": timedelta(hours=1),
-        "24h": timedelta(hours=24),
-        "7d": timedelta(days=7),
-        "30d": timedelta(days=30)
-    }
-    delta = period_map.get(period, timedelta(hours=24))
-    period_start = now - delta
+    period_start, now = _resolve_period(period)
     
     # トレース統計を取得
     traces_query = select(Trace).where(
@@ -113,21 +281,19 @@ async def get_metrics(
 
 
 @router.get("/metrics/models", response_model=list[ModelUsageResponse])
-async def get_model_usage(
+def get_model_usage(
     project_id: str = Query(..., description="プロジェクトID"),
     period: str = Query("24h", description="期間"),
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_read_session)
 ):
     """モデル別使用状況を取得"""
-    now = datetime.utcnow()
-    period_map = {
-        "1h": timedelta(hours=1),
-        "24h": timedelta(hours=24),
-        "7d": timedelta(days=7),
-        "30d": timedelta(days=30)
-    }
-    delta = period_map.get(period, timedelta(hours=24))
-    period_start = now - delta
+    with QUERY_LATENCY.labels("model_usage").time():
+        return _compute_model_usage(project_id, period, session)
+
+
+def _compute_model_usage(project_id: str, period: str, session: Session) -> list[ModelUsageResponse]:
+    """期間内のLLMスパンをモデル別に集計"""
+    period_start, now = _resolve_period(period)
     
     # LLMスパンを取得
     spans_query = select(Span).join(Trace).where(
@@ -147,7 +313,9 @@ async def get_model_usage(
                 "call_count": 0,
                 "total_tokens": 0,
                 "total_cost": 0.0,
-                "durations": []
+                "durations": [],
+                "cache_hits": 0,
+                "saved_cost": 0.0
             }
         
         stats = model_stats[model]
@@ -156,6 +324,9 @@ async def get_model_usage(
         stats["total_cost"] += span.cost_usd or 0
         if span.duration_ms:
             stats["durations"].append(span.duration_ms)
+        if span.cache_hit:
+            stats["cache_hits"] += 1
+            stats["saved_cost"] += span.saved_cost_usd or 0
     
     # レスポンス構築
     result = []
@@ -166,7 +337,187 @@ async def get_model_usage(
             call_count=stats["call_count"],
             total_tokens=stats["total_tokens"],
             total_cost_usd=round(stats["total_cost"], 4),
-            avg_duration_ms=round(avg_duration, 2)
+            avg_duration_ms=round(avg_duration, 2),
+            cache_hits=stats["cache_hits"],
+            cache_hit_rate=round(stats["cache_hits"] / stats["call_count"], 4),
+            saved_cost_usd=round(stats["saved_cost"], 4)
         ))
     
     return sorted(result, key=lambda x: x.call_count, reverse=True)
+
+
+@router.get("/metrics/breakdown", response_model=BreakdownResponse)
+def get_breakdown(
+    project_id: str = Query(..., description="プロジェクトID"),
+    level: str = Query("trace", description="集計単位 (trace, span)"),
+    group_by: str = Query("name", description="グループ化する列 (trace: name, status / span: name, span_type, status, model)"),
+    start: Optional[datetime] = Query(None, description="期間の開始（デフォルトは24時間前）"),
+    end: Optional[datetime] = Query(None, description="期間の終了（デフォルトは現在）"),
+    interval: Optional[str] = Query(None, description="バケット幅 (例: 5m, 1h, 1d)。省略時は自動"),
+    session: Session = Depends(get_read_session)
+):
+    """トレース/スパンをグループ × 時間バケットで集計（件数・エラー・トークン・コスト・所要時間の分位点）"""
+    if not analytics.HAS_NUMPY:
+        raise HTTPException(status_code=501, detail="numpy is not installed on the server")
+    
+    start, end = _resolve_window(start, end)
+    
+    try:
+        interval_seconds = (
+            analytics.parse_interval(interval) if interval
+            else analytics.choose_interval(start, end, analytics.MAX_BUCKETS // 5)
+        )
+        with QUERY_LATENCY.labels("breakdown").time():
+            series = analytics.breakdown(
+                session,
+                project_id=project_id,
+                level=level,
+                group_by=group_by,
+                start=start,
+                end=end,
+                interval=interval_seconds
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return BreakdownResponse(
+        level=level,
+        group_by=group_by,
+        start=start,
+        end=end,
+        interval_seconds=interval_seconds,
+        series=series
+    )
+
+
+@router.get("/metrics/timeseries", response_model=TimeseriesResponse)
+def get_timeseries(
+    project_id: str = Query(..., description="プロジェクトID"),
+    start: Optional[datetime] = Query(None, description="期間の開始（デフォルトは24時間前）"),
+    end: Optional[datetime] = Query(None, description="期間の終了（デフォルトは現在）"),
+    max_points: int = Query(300, ge=10, le=2000, description="1系列あたりの最大点数"),
+    include_latency: bool = Query(True, description="生のレイテンシ系列（LTTBで間引き）を含める"),
+    session: Session = Depends(get_read_session)
+):
+    """
+    コスト・トークン・レイテンシの時系列を取得
+
+    バケット幅は点数が max_points 以下になるよう自動で選ぶ（1分〜1週間）。
+    """
+    start, end = _resolve_window(start, end)
+    if include_latency and not analytics.HAS_NUMPY:
+        raise HTTPException(status_code=501, detail="numpy is not installed on the server")
+    
+    bucket_seconds = analytics.choose_interval(start, end, max_points)
+    with QUERY_LATENCY.labels("timeseries").time():
+        points, source = timeseries.query_series(session, project_id, start, end, bucket_seconds)
+        latency = (
+            timeseries.latency_series(session, project_id, start, end, max_points)
+            if include_latency else []
+        )
+    
+    return TimeseriesResponse(
+        start=start,
+        end=end,
+        bucket_seconds=bucket_seconds,
+        source=source,
+        points=points,
+        latency=latency
+    )
+
+
+@router.get("/metrics/top", response_model=TopResponse)
+def get_top(
+    project_id: str = Query(..., description="プロジェクトID"),
+    dimension: str = Query("span_name", description="集計するキー (span_name, trace_name, model)"),
+    metric: str = Query("duration", description="並べる指標 (duration, calls, errors, cost)"),
+    k: int = Query(10, ge=1, le=topk.TOPK_SKETCH_CAPACITY, description="件数"),
+    start: Optional[datetime] = Query(None, description="期間の開始（デフォルトは24時間前。時単位に切り下げ）"),
+    end: Optional[datetime] = Query(None, description="期間の終了（デフォルトは現在。時単位に切り上げ）"),
+    session: Session = Depends(get_read_session)
+):
+    """
+    合計所要時間・呼び出し数・エラー数・コストの上位K件
+
+    取り込み時に更新している時バケットのサマリーを合わせるので、データ量によらず
+    期間の時間数に比例した行だけを読む。duration はミリ秒の合計、cost はUSDの合計。
+    """
+    start, end = _resolve_window(start, end)
+    
+    try:
+        with QUERY_LATENCY.labels("top").time():
+            sketch, items = topk.query_top(session, project_id, dimension, metric, start, end, k)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return TopResponse(
+        dimension=dimension,
+        metric=metric,
+        start=start,
+        end=end,
+        total=sketch.total,
+        max_error=sketch.min_count,
+        items=[TopItem(key=key, value=value, error=error) for key, value, error in items]
+    )
+
+
+@router.get("/metrics/releases", response_model=List[ReleaseSummary])
+def get_releases(
+    project_id: str = Query(..., description="プロジェクトID"),
+    session: Session = Depends(get_read_session)
+):
+    """リリースの一覧（最後にトレースを受け取った順）"""
+    with QUERY_LATENCY.labels("releases").time():
+        items = releases.list_releases(session, project_id)
+    return [
+        ReleaseSummary(
+            release=release,
+            trace_count=stats.trace_count,
+            error_count=stats.error_count,
+            first_seen=stats.first_seen,
+            last_seen=stats.last_seen
+        )
+        for release, stats in items
+    ]
+
+
+@router.get("/metrics/releases/compare", response_model=ReleaseCompareResponse)
+def compare_releases(
+    project_id: str = Query(..., description="プロジェクトID"),
+    baseline: str = Query(..., description="比較の基準にするリリース"),
+    candidate: str = Query(..., description="悪化していないか調べるリリース"),
+    trace_name: Optional[str] = Query(None, description="トレース名で絞る（省略すると全体とトレース名ごと）"),
+    alpha: float = Query(0.01, gt=0, lt=1, description="有意水準（検定の数で Bonferroni 補正する）"),
+    min_effect: float = Query(0.05, ge=0, description="悪化とみなす最小の相対変化（所要時間・トークン・コスト）"),
+    min_error_delta: float = Query(0.01, ge=0, description="悪化とみなす最小のエラー率の差"),
+    min_count: int = Query(30, ge=2, description="検定に必要な各リリースのトレース数"),
+    session: Session = Depends(get_read_session)
+):
+    """
+    2つのリリースの所要時間・1トレースあたりのトークンとコスト・エラー率を比べる
+
+    取り込み時に更新しているリリースごとの集計（所要時間はヒストグラム）だけを読むので、
+    デプロイのたびに呼んでも軽い。所要時間は Mann-Whitney U 検定、トークンとコストは Welch 検定、
+    エラー率は比率の検定（いずれも候補が悪い方向の片側）で、有意かつ min_effect 以上の変化を regression にする。
+    """
+    with QUERY_LATENCY.labels("release_compare").time():
+        comparisons = releases.compare_releases(
+            session, project_id, baseline, candidate, trace_name,
+            alpha=alpha, min_effect=min_effect, min_error_delta=min_error_delta, min_count=min_count
+        )
+    items = [
+        ReleaseComparison(
+            trace_name=comparison["trace_name"],
+            baseline=_release_side(comparison["baseline"]),
+            candidate=_release_side(comparison["candidate"]),
+            metrics=[MetricComparison(**metric) for metric in comparison["metrics"]]
+        )
+        for comparison in comparisons
+    ]
+    return ReleaseCompareResponse(
+        baseline=baseline,
+        candidate=candidate,
+        alpha=alpha,
+        regression=any(m.regression for item in items for m in item.metrics),
+        comparisons=items
+    )
@@ -0,0 +1,69 @@
+"""
+OTLP/HTTP trace ingest endpoint
+
+Accepts binary protobuf ExportTraceServiceRequest bodies at the standard
+/v1/traces path so OpenTelemetry SDKs and collectors can export directly.
+"""
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response
+from sqlmodel import Session
+from time import perf_counter
+
+from app.api.traces import MAX_BATCH_SIZE, verify_api_key
+from app.db.database import get_session
+from app.services import otlp
+from app.services.ingest import TraceConflictError, ingest_traces
+from app.services.observability import INGEST_REJECTED, observe_phase, request_elapsed
+
+PROTOBUF_CONTENT_TYPE = "application/x-protobuf"
+
+router = APIRouter()
+
+
+async def _raw_body(request: Request) -> bytes:
+    """生のリクエストボディ（gzip は GzipRequestMiddleware が展開済み）"""
+    return await request.body()
+
+
+@router.post("/v1/traces")
+def export_traces(
+    request: Request,
+    body: bytes = Depends(_raw_body),
+    session: Session = Depends(get_session),
+    x_api_key: str = Header(...),
+    x_project_id: Optional[str] = Header(None)
+):
+    """
+    OTLP/HTTP (protobuf) でトレースを受け取る
+
+    プロジェクトIDはリソース属性 agentscope.project_id、なければ X-Project-ID ヘッダーで指定する。
+    Pydanticモデルを経由せず、protobuf から直接 ingest 用の辞書を組み立てる。
+    """
+    if not otlp.HAS_OTLP:
+        raise HTTPException(status_code=501, detail="opentelemetry-proto is not installed on the server")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type != PROTOBUF_CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail=f"Content-Type must be {PROTOBUF_CONTENT_TYPE}")
+
+    try:
+        traces_data = otlp.decode_export_request(body, default_project_id=x_project_id)
+    except ValueError as e:
+        INGEST_REJECTED.labels("invalid_otlp").inc()
+        raise HTTPException(status_code=400, detail=str(e))
+    observe_phase("otlp", "parse", request_elapsed(request.scope))
+    if len(traces_data) > MAX_BATCH_SIZE:
+        INGEST_REJECTED.labels("batch_too_large").inc()
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} traces)")
+
+    started = perf_counter()
+    for project_id in {t["project_id"] for t in traces_data}:
+        verify_api_key(project_id, x_api_key, session)
+    observe_phase("otlp", "auth", perf_counter() - started)
+
+    if traces_data:
+        try:
+            ingest_traces(session, traces_data, endpoint="otlp")
+        except TraceConflictError:
+            INGEST_REJECTED.labels("trace_id_conflict").inc()
+            raise HTTPException(status_code=409, detail="Trace ID belongs to another project")
+    return Response(content=otlp.export_response(), media_type=PROTOBUF_CONTENT_TYPE)
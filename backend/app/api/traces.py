@@ -3,19 +3,33 @@ Traces API endpoints
 """
 from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
+from time import perf_counter
+import asyncio
 import json
 import uuid
 
-from app.db.database import get_session
+from app.db.database import get_read_session, get_session
+from app.db import search as search_index
 from app.models.trace import Trace, Span, Project
+from app.services.ingest import TraceConflictError, ingest_traces
+from app.services.live import broker, LiveSubscriber, DROPPED
+from app.services.observability import INGEST_REJECTED, QUEUE_DEPTH, observe_phase, request_elapsed
 from pydantic import BaseModel
 
+# SSEのキープアライブ間隔（秒）
+LIVE_HEARTBEAT_SECONDS = 15.0
+
+# バッチ取り込みの最大件数
+MAX_BATCH_SIZE = 1000
+
 router = APIRouter()
 
 
-async def verify_api_key(
+def verify_api_key(
     project_id: str,
     api_key: str,
     session: Session
@@ -28,11 +42,19 @@ async def verify_api_key(
         # プロジェクトが存在しない場合は自動作成（開発者の利便性のため）
         new_project = Project(id=project_id, name=project_id, api_key=api_key)
         session.add(new_project)
-        session.commit()
-        session.refresh(new_project)
-        project = new_project
+        try:
+            session.commit()
+            session.refresh(new_project)
+            project = new_project
+        except IntegrityError:
+            # 並行リクエストが先に作成した場合はそちらを使う
+            session.rollback()
+            project = session.exec(statement).first()
+            if not project:
+                raise HTTPException(status_code=401, detail="Invalid API Key")
         
     if project.api_key != api_key:
+        INGEST_REJECTED.labels("invalid_api_key").inc()
         raise HTTPException(status_code=401, detail="Invalid API Key")
     return project
 
@@ -46,11 +68,14 @@ class SpanCreate(BaseModel):
     span_type: str
     start_time: datetime
     end_time: Optional[datetime] = None
-    duration_ms: Optional[int] = None
+    duration_ms: Optional[float] = None
     model: Optional[str] = None
     input_tokens: Optional[int] = None
     output_tokens: Optional[int] = None
     cost_usd: Optional[float] = None
+    cache_hit: Optional[bool] = None
+    saved_cost_usd: Optional[float] = None
+    saved_duration_ms: Optional[float] = None
     input_data: Optional[dict] = None
     output_data: Optional[dict] = None
     status: str = "success"
@@ -63,10 +88,14 @@ class TraceCreate(BaseModel):
     name: str
     start_time: datetime
     end_time: Optional[datetime] = None
-    duration_ms: Optional[int] = None
+    duration_ms: Optional[float] = None
     status: str = "success"
     error_message: Optional[str] = None
     extra_metadata: Optional[dict] = None
+    # デプロイしたバージョン（リリース間の比較に使う）
+    release: Optional[str] = None
+    # 他サービスから traceparent で引き継いだトレースのチャンク（呼び出し元のスパンID）
+    remote_parent_span_id: Optional[str] = None
     spans: List[SpanCreate] = []
 
 
@@ -78,11 +107,14 @@ class SpanResponse(BaseModel):
     span_type: str
     start_time: datetime
     end_time: Optional[datetime]
-    duration_ms: Optional[int]
+    duration_ms: Optional[float]
     model: Optional[str]
     input_tokens: Optional[int]
     output_tokens: Optional[int]
     cost_usd: Optional[float]
+    cache_hit: Optional[bool]
+    saved_cost_usd: Optional[float]
+    saved_duration_ms: Optional[float]
     input_data: Optional[dict]
     output_data: Optional[dict]
     status: str
@@ -95,15 +127,35 @@ class TraceResponse(BaseModel):
     name: str
     start_time: datetime
     end_time: Optional[datetime]
-    duration_ms: Optional[int]
+    duration_ms: Optional[float]
     status: str
     error_message: Optional[str]
+    release: Optional[str]
     total_tokens: Optional[int]
     total_cost_usd: Optional[float]
     span_count: int
     created_at: datetime
 
 
+class BatchIngestResponse(BaseModel):
+    accepted: int
+    span_count: int
+
+
+class SearchHit(BaseModel):
+    trace_id: str
+    span_id: Optional[str]
+    trace_name: str
+    name: str
+    span_type: Optional[str]
+    model: Optional[str]
+    status: str
+    error_message: Optional[str]
+    duration_ms: Optional[float]
+    cost_usd: Optional[float]
+    start_time: datetime
+
+
 class TraceDetailResponse(TraceResponse):
     spans: List[SpanResponse]
     metadata: Optional[dict]
@@ -111,78 +163,72 @@ class TraceDetailResponse(TraceResponse):
 
 # ===== API Endpoints =====
 
+# 取り込みはDB処理でブロックするため同期関数として定義し、スレッドプールで実行させる
+# （async def のままだとコネクションプール待ちでイベントループ全体が止まる）
 @router.post("/traces", response_model=TraceResponse)
-async def create_trace(
+def create_trace(
     trace_data: TraceCreate, 
+    request: Request,
     session: Session = Depends(get_session),
     x_api_key: str = Header(...)
 ):
-    # APIキーの検証
-    await verify_api_key(trace_data.project_id, x_api_key, session)
     """新しいトレースを作成"""
-    # トレースを作成
-    trace = Trace(
-        id=trace_data.id,
-        project_id=trace_data.project_id,
-        name=trace_data.name,
-        start_time=trace_data.start_time,
-        end_time=trace_data.end_time,
-        duration_ms=trace_data.duration_ms,
-        status=trace_data.status,
-        error_message=trace_data.error_message,
-        extra_metadata=json.dumps(trace_data.extra_metadata) if trace_data.extra_metadata else None,
-        span_count=len(trace_data.spans)
-    )
-    
-    # 集計値を計算
-    total_tokens = 0
-    total_cost = 0.0
-    
-    for span_data in trace_data.spans:
-        span = Span(
-            id=span_data.id,
-            trace_id=trace.id,
-            parent_span_id=span_data.parent_span_id,
-            name=span_data.name,
-            span_type=span_data.span_type,
-            start_time=span_data.start_time,
-            end_time=span_data.end_time,
-            duration_ms=span_data.duration_ms,
-            model=span_data.model,
-            input_tokens=span_data.input_tokens,
-            output_tokens=span_data.output_tokens,
-            cost_usd=span_data.cost_usd,
-            input_data=json.dumps(span_data.input_data) if span_data.input_data else None,
-            output_data=json.dumps(span_data.output_data) if span_data.output_data else None,
-            status=span_data.status,
-            error_message=span_data.error_message
-        )
-        session.add(span)
-        
-        if span_data.input_tokens:
-            total_tokens += span_data.input_tokens
-        if span_data.output_tokens:
-            total_tokens += span_data.output_tokens
-        if span_data.cost_usd:
-            total_cost += span_data.cost_usd
+    # ボディの読み込み・検証にかかった時間
+    observe_phase("traces", "parse", request_elapsed(request.scope))
     
-    trace.total_tokens = total_tokens if total_tokens > 0 else None
-    trace.total_cost_usd = total_cost if total_cost > 0 else None
+    # APIキーの検証
+    started = perf_counter()
+    verify_api_key(trace_data.project_id, x_api_key, session)
+    observe_phase("traces", "auth", perf_counter() - started)
     
-    session.add(trace)
-    session.commit()
+    try:
+        trace = ingest_traces(session, [trace_data.model_dump()], endpoint="traces")[0]
+    except TraceConflictError:
+        INGEST_REJECTED.labels("trace_id_conflict").inc()
+        raise HTTPException(status_code=409, detail="Trace ID belongs to another project")
     session.refresh(trace)
-    
     return trace
 
 
+@router.post("/traces/batch", response_model=BatchIngestResponse)
+def create_traces_batch(
+    traces_data: List[TraceCreate],
+    request: Request,
+    session: Session = Depends(get_session),
+    x_api_key: str = Header(...)
+):
+    """複数のトレースを1リクエスト・1コミットで作成"""
+    observe_phase("batch", "parse", request_elapsed(request.scope))
+    if len(traces_data) > MAX_BATCH_SIZE:
+        INGEST_REJECTED.labels("batch_too_large").inc()
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} traces)")
+    
+    # APIキーの検証（プロジェクトごとに1回）
+    started = perf_counter()
+    for project_id in {t.project_id for t in traces_data}:
+        verify_api_key(project_id, x_api_key, session)
+    observe_phase("batch", "auth", perf_counter() - started)
+    
+    try:
+        ingest_traces(session, [t.model_dump() for t in traces_data], endpoint="batch")
+    except TraceConflictError:
+        INGEST_REJECTED.labels("trace_id_conflict").inc()
+        raise HTTPException(status_code=409, detail="Trace ID belongs to another project")
+    # コミット後のORMオブジェクトを触ると再読込が走るので、受信データから数える
+    return BatchIngestResponse(
+        accepted=len(traces_data),
+        span_count=sum(len(t.spans) for t in traces_data)
+    )
+
+
 @router.get("/traces", response_model=List[TraceResponse])
-async def list_traces(
+def list_traces(
     project_id: str = Query(..., description="プロジェクトID"),
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
     status: Optional[str] = Query(None, description="ステータスでフィルタ"),
-    session: Session = Depends(get_session),
+    release: Optional[str] = Query(None, description="リリースでフィルタ"),
+    session: Session = Depends(get_read_session),
     # project: Project = Depends(verify_api_key) # フロントエンドからの取得は一旦パススルーか、別の認証にするが、MVPでは簡易化
 ):
     """トレース一覧を取得"""
@@ -190,6 +236,8 @@ async def list_traces(
     
     if status:
         query = query.where(Trace.status == status)
+    if release:
+        query = query.where(Trace.release == release)
     
     query = query.order_by(Trace.created_at.desc()).offset(offset).limit(limit)
     traces = session.exec(query).all()
@@ -197,10 +245,92 @@ async def list_traces(
     return traces
 
 
+@router.get("/traces/search", response_model=List[SearchHit])
+def search_traces(
+    project_id: str = Query(..., description="プロジェクトID"),
+    q: str = Query(..., min_length=1, description="検索語（名前・エラーメッセージ・ペイロード）"),
+    model: Optional[str] = Query(None, description="モデルでフィルタ"),
+    span_type: Optional[str] = Query(None, description="スパンタイプでフィルタ"),
+    min_duration_ms: Optional[float] = Query(None, ge=0),
+    max_duration_ms: Optional[float] = Query(None, ge=0),
+    min_cost_usd: Optional[float] = Query(None, ge=0),
+    max_cost_usd: Optional[float] = Query(None, ge=0),
+    start: Optional[datetime] = Query(None, description="開始時刻（以降）"),
+    end: Optional[datetime] = Query(None, description="開始時刻（以前）"),
+    limit: int = Query(50, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    session: Session = Depends(get_read_session),
+):
+    """全文検索インデックスからトレース/スパンを検索"""
+    if not search_index.is_supported(session.get_bind().dialect.name):
+        raise HTTPException(status_code=501, detail="Search is not supported on this database")
+    
+    return search_index.search(
+        session,
+        project_id=project_id,
+        query=q,
+        model=model,
+        span_type=span_type,
+        min_duration_ms=min_duration_ms,
+        max_duration_ms=max_duration_ms,
+        min_cost_usd=min_cost_usd,
+        max_cost_usd=max_cost_usd,
+        start=start,
+        end=end,
+        limit=limit,
+        offset=offset
+    )
+
+
+@router.get("/traces/live")
+async def live_traces(
+    request: Request,
+    project_id: str = Query(..., description="プロジェクトID"),
+    status: Optional[str] = Query(None, description="ステータスでフィルタ"),
+    name: Optional[str] = Query(None, description="トレース名でフィルタ"),
+    min_duration_ms: Optional[float] = Query(None, ge=0, description="最小実行時間（ms）"),
+):
+    """新着トレースをServer-Sent Eventsでストリーミング（DBには問い合わせない）"""
+    subscriber = LiveSubscriber(
+        project_id=project_id,
+        status=status,
+        name=name,
+        min_duration_ms=min_duration_ms
+    )
+    broker.subscribe(subscriber)
+    
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    data = await asyncio.wait_for(subscriber.queue.get(), timeout=LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                
+                QUEUE_DEPTH.labels("live").dec()
+                if data is DROPPED:
+                    # バッファ溢れ。クライアントは再接続して一覧を取り直す
+                    yield "event: dropped\ndata: {}\n\n"
+                    break
+                yield f"event: trace\ndata: {data}\n\n"
+        finally:
+            broker.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/traces/{trace_id}", response_model=TraceDetailResponse)
-async def get_trace(
+def get_trace(
     trace_id: str,
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     # project: Project = Depends(verify_api_key) # フロントエンドからの取得は一旦パススルーか、別の認証にするが、MVPでは簡易化
 ):
     """トレース詳細を取得（スパン含む）"""
@@ -228,6 +358,9 @@ async def get_trace(
             input_tokens=span.input_tokens,
             output_tokens=span.output_tokens,
             cost_usd=span.cost_usd,
+            cache_hit=span.cache_hit,
+            saved_cost_usd=span.saved_cost_usd,
+            saved_duration_ms=span.saved_duration_ms,
             input_data=json.loads(span.input_data) if span.input_data else None,
             output_data=json.loads(span.output_data) if span.output_data else None,
             status=span.status,
@@ -243,10 +376,11 @@ async def get_trace(
         duration_ms=trace.duration_ms,
         status=trace.status,
         error_message=trace.error_message,
+        release=trace.release,
         total_tokens=trace.total_tokens,
         total_cost_usd=trace.total_cost_usd,
         span_count=trace.span_count,
         created_at=trace.created_at,
         spans=spans_response,
-        extra_metadata=json.loads(trace.extra_metadata) if trace.extra_metadata else None
+        metadata=json.loads(trace.extra_metadata) if trace.extra_metadata else None
     )
@@ -1,4 +1,4 @@
 # DBパッケージ
-from app.db.database import get_session, create_db_and_tables
+from app.db.database import get_session, get_read_session, create_db_and_tables
 
-__all__ = ["get_session", "create_db_and_tables"]
+__all__ = ["get_session", "get_read_session", "create_db_and_tables"]
@@ -1,30 +1,227 @@
 """
 Database connection and session management
+
+Ingest writes through `engine`; dashboard and query endpoints read through
+`read_engine`, which has its own connection pool so a slow analytics query
+cannot take connections away from ingest (and vice versa). The reader points
+at DATABASE_READ_URL when a replica is configured, otherwise at the primary
+with read-only connections.
 """
+from sqlalchemy import Integer, event, inspect
+from sqlalchemy.engine import make_url
 from sqlmodel import SQLModel, create_engine, Session
 from contextlib import contextmanager
+from datetime import datetime, timezone
+from time import perf_counter
+import math
 import os
 
 # データベースURL（環境変数から取得、デフォルトはSQLite）
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./agentscope.db")
 
-# SQLite用の接続引数
-connect_args = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+# 読み取り用のレプリカ（未設定なら DATABASE_URL に読み取り専用で接続する）
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
+
+# コネクションプールの大きさ（書き込み用・読み取り用で別々）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "5"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "10"))
+
+# 1ステートメントの上限（ミリ秒、0 で無制限）。重い集計クエリを読み取り側だけで打ち切る
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+DB_READ_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_READ_STATEMENT_TIMEOUT_MS", "30000"))
+
+# SQLite の進行ハンドラを呼ぶ間隔（VM命令数）
+_SQLITE_PROGRESS_STEPS = 1000
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _create_engine(url: str, pool_size: int, max_overflow: int, statement_timeout_ms: int, read_only: bool):
+    """
+    プールの大きさ・ステートメントのタイムアウト・読み取り専用を設定したエンジン
+
+    PostgreSQL はセッション設定（statement_timeout, default_transaction_read_only）で、
+    SQLite は接続ごとの PRAGMA（query_only）と進行ハンドラで制限する。SQLite は WAL にして、
+    読み取りが書き込み（取り込みのコミット）を待たせないようにする。
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    connect_args = {}
+    options = {}
+    if backend == "sqlite":
+        connect_args["check_same_thread"] = False
+    elif backend == "postgresql":
+        settings = []
+        if statement_timeout_ms > 0:
+            settings.append(f"-c statement_timeout={statement_timeout_ms}")
+        if read_only:
+            settings.append("-c default_transaction_read_only=on")
+        if settings:
+            connect_args["options"] = " ".join(settings)
+    if not _is_memory_sqlite(parsed):
+        options.update(pool_size=pool_size, max_overflow=max_overflow)
+    
+    db_engine = create_engine(url, echo=False, connect_args=connect_args, **options)
+    if backend == "sqlite":
+        _configure_sqlite(db_engine, read_only)
+        if statement_timeout_ms > 0:
+            _limit_sqlite_statements(db_engine, statement_timeout_ms)
+    return db_engine
+
+
+def _configure_sqlite(db_engine, read_only: bool):
+    @event.listens_for(db_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        else:
+            # WAL はDBファイルに保存される設定なので、書き込み側で1回設定すれば読み取り側にも効く
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+
+
+def _limit_sqlite_statements(db_engine, timeout_ms: int):
+    """
+    SQLite にはステートメントのタイムアウトがないので、期限を過ぎたら進行ハンドラで中断する
+    （sqlite3.OperationalError: interrupted になる）
+
+    期限はステートメントの実行開始ごとに設定し、コミット・ロールバックとプールへの返却の前に外す
+    （トランザクションの終了は中断しない）。
+    """
+    limit = timeout_ms / 1000
+
+    @event.listens_for(db_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        deadline = connection_record.info["deadline"] = [math.inf]
+        dbapi_connection.set_progress_handler(lambda: perf_counter() > deadline[0], _SQLITE_PROGRESS_STEPS)
+
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        # execution_options(no_statement_timeout=True) のステートメント（エクスポートのストリーミング）は打ち切らない
+        if conn.get_execution_options().get("no_statement_timeout"):
+            conn.info["deadline"][0] = math.inf
+        else:
+            conn.info["deadline"][0] = perf_counter() + limit
+
+    def clear(info):
+        deadline = info.get("deadline")
+        if deadline is not None:
+            deadline[0] = math.inf
+
+    @event.listens_for(db_engine, "commit")
+    def on_commit(conn):
+        clear(conn.info)
+
+    @event.listens_for(db_engine, "rollback")
+    def on_rollback(conn):
+        clear(conn.info)
 
-engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
+    @event.listens_for(db_engine, "reset")
+    def on_reset(dbapi_connection, connection_record, reset_state):
+        clear(connection_record.info)
+
+
+def is_statement_timeout(error: Exception) -> bool:
+    """ステートメントのタイムアウトで打ち切られたエラーか（SQLite の中断・PostgreSQL のキャンセル）"""
+    message = str(getattr(error, "orig", error))
+    return message == "interrupted" or "statement timeout" in message
+
+
+def naive_utc(value: datetime) -> datetime:
+    """DBの保存形式（タイムゾーンなしUTC）に揃える"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+engine = _create_engine(
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_STATEMENT_TIMEOUT_MS, read_only=False
+)
+
+if DATABASE_READ_URL is None and _is_memory_sqlite(make_url(DATABASE_URL)):
+    # インメモリの SQLite は接続ごとに別のDBになるので、読み取りも同じエンジンで行う
+    read_engine = engine
+else:
+    read_engine = _create_engine(
+        DATABASE_READ_URL or DATABASE_URL, DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW,
+        DB_READ_STATEMENT_TIMEOUT_MS, read_only=True
+    )
 
 
 def create_db_and_tables():
     """データベースとテーブルを作成"""
+    from app.db.search import create_search_index, is_supported
+
     SQLModel.metadata.create_all(engine)
+    upgrade_schema()
+    if is_supported(engine.dialect.name):
+        create_search_index(engine)
+
+
+def _add_missing_columns(conn, inspector, table: str):
+    """モデルにあってDBにない列を追加（新しい列はすべて NULL 可なので既存行はそのまま）"""
+    existing = {c["name"] for c in inspector.get_columns(table)}
+    for column in SQLModel.metadata.tables[table].columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}")
+
+
+def _add_missing_indexes(conn, inspector, table: str):
+    """モデルにあってDBにないインデックスを作成（追加した列のインデックスなど）"""
+    existing = {index["name"] for index in inspector.get_indexes(table)}
+    for index in SQLModel.metadata.tables[table].indexes:
+        if index.name not in existing:
+            index.create(conn)
+
+
+def upgrade_schema():
+    """
+    既存DBのテーブルを現在のモデルに合わせる（create_all は既存テーブルを変更しないため）
+
+    - 追加された列（span.cache_hit、trace.release など）: ALTER TABLE ... ADD COLUMN とそのインデックス
+    - duration_ms: 整数ミリ秒 -> 小数（ミリ秒未満の精度）。SQLite は INTEGER 列にも小数を
+      そのまま保存するので、型の変更が必要なのは PostgreSQL だけ
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in ("trace", "span"):
+            if not inspector.has_table(table):
+                continue
+            _add_missing_columns(conn, inspector, table)
+            _add_missing_indexes(conn, inspector, table)
+            if engine.dialect.name != "postgresql":
+                continue
+            columns = {c["name"]: c["type"] for c in inspector.get_columns(table)}
+            if isinstance(columns.get("duration_ms"), Integer):
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table} ALTER COLUMN duration_ms TYPE DOUBLE PRECISION"
+                )
 
 
 def get_session():
-    """FastAPI依存性注入用のセッション取得"""
+    """FastAPI依存性注入用のセッション取得（書き込み用）"""
     with Session(engine) as session:
         yield session
 
 
+def get_read_session():
+    """
+    FastAPI依存性注入用の読み取り専用セッション取得（一覧・詳細・集計用）
+
+    レプリカを使う場合は取り込み直後のトレースがまだ見えないことがある。
+    """
+    with Session(read_engine) as session:
+        yield session
+
+
 @contextmanager
 def get_session_context():
     """コンテキストマネージャ版セッション取得"""
@@ -0,0 +1,267 @@
+"""
+Full-text search index over traces and spans
+
+SQLite uses an FTS5 virtual table, PostgreSQL a tsvector column with a GIN index.
+The index is maintained incrementally on ingest, in the same transaction as the rows.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+import hashlib
+import os
+import re
+
+from app.db.database import naive_utc
+
+# インデックス対象とするペイロードのキー（"*" で全キー）
+SEARCH_PAYLOAD_FIELDS = [
+    f.strip() for f in os.getenv(
+        "SEARCH_PAYLOAD_FIELDS",
+        "query,prompt,messages,content,result,response,error,value,args,kwargs"
+    ).split(",") if f.strip()
+]
+
+# 1ドキュメントあたりのペイロード文字数上限
+SEARCH_PAYLOAD_MAX_CHARS = int(os.getenv("SEARCH_PAYLOAD_MAX_CHARS", "4000"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_supported(dialect_name: str) -> bool:
+    """検索インデックスに対応したDBか"""
+    return dialect_name in ("sqlite", "postgresql")
+
+
+def create_search_index(engine: Engine):
+    """検索インデックス用のテーブルを作成"""
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            conn.exec_driver_sql(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS trace_search USING fts5("
+                "name, error_message, payload, "
+                "trace_id UNINDEXED, span_id UNINDEXED, project_id UNINDEXED, "
+                "tokenize='unicode61')"
+            )
+        elif dialect == "postgresql":
+            conn.exec_driver_sql(
+                "CREATE TABLE IF NOT EXISTS trace_search ("
+                "trace_id VARCHAR NOT NULL, span_id VARCHAR, project_id VARCHAR NOT NULL, "
+                "document TSVECTOR NOT NULL)"
+            )
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_trace_search_document "
+                "ON trace_search USING GIN (document)"
+            )
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_trace_search_project "
+                "ON trace_search (project_id)"
+            )
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_trace_search_trace "
+                "ON trace_search (trace_id)"
+            )
+
+
+def _collect_text(value: Any, out: List[str], budget: int) -> int:
+    """ペイロードから文字列を再帰的に集める（残り文字数を返す）"""
+    if budget <= 0 or value is None:
+        return budget
+    if isinstance(value, dict):
+        for v in value.values():
+            budget = _collect_text(v, out, budget)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            budget = _collect_text(v, out, budget)
+    else:
+        s = str(value)[:budget]
+        out.append(s)
+        budget -= len(s)
+    return budget
+
+
+def payload_text(*payloads: Optional[Dict]) -> str:
+    """インデックス対象のペイロードフィールドを1つの文字列にする"""
+    out: List[str] = []
+    budget = SEARCH_PAYLOAD_MAX_CHARS
+    index_all = "*" in SEARCH_PAYLOAD_FIELDS
+    for payload in payloads:
+        if not payload:
+            continue
+        for key, value in payload.items():
+            if index_all or key in SEARCH_PAYLOAD_FIELDS:
+                budget = _collect_text(value, out, budget)
+    return " ".join(out)
+
+
+def _trace_rowid(trace_id: str) -> int:
+    """
+    トレース自体のドキュメントの rowid（SQLite）
+
+    トレースIDから決まる負の値にして、置き換えを rowid 1回の検索で済ませる
+    （スパンのドキュメントは自動採番の正の rowid）。
+    """
+    digest = hashlib.blake2b(trace_id.encode(), digest_size=8).digest()
+    return -(int.from_bytes(digest, "big") >> 1) - 1
+
+
+def index_documents(session: Session, documents: Iterable[Dict]):
+    """
+    ドキュメントをインデックスに追加
+
+    トレース自体のドキュメント（span_id が None）はトレースごとに1件で、既存のものを置き換える。
+    スパンのドキュメントは追加するだけ。
+
+    Args:
+        documents: trace_id, span_id, project_id, name, error_message, payload を持つ辞書
+    """
+    rows = list(documents)
+    if not rows:
+        return
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        trace_rows = [dict(row, rowid=_trace_rowid(row["trace_id"])) for row in rows if row["span_id"] is None]
+        span_rows = [row for row in rows if row["span_id"] is not None]
+        if trace_rows:
+            session.execute(
+                text(
+                    "INSERT OR REPLACE INTO trace_search "
+                    "(rowid, name, error_message, payload, trace_id, span_id, project_id) "
+                    "VALUES (:rowid, :name, :error_message, :payload, :trace_id, :span_id, :project_id)"
+                ),
+                trace_rows
+            )
+        if span_rows:
+            session.execute(
+                text(
+                    "INSERT INTO trace_search (name, error_message, payload, trace_id, span_id, project_id) "
+                    "VALUES (:name, :error_message, :payload, :trace_id, :span_id, :project_id)"
+                ),
+                span_rows
+            )
+    elif dialect == "postgresql":
+        trace_ids = [row["trace_id"] for row in rows if row["span_id"] is None]
+        if trace_ids:
+            session.execute(
+                text(
+                    "DELETE FROM trace_search WHERE span_id IS NULL AND trace_id IN :trace_ids"
+                ).bindparams(bindparam("trace_ids", expanding=True)),
+                {"trace_ids": trace_ids}
+            )
+        session.execute(
+            text(
+                "INSERT INTO trace_search (trace_id, span_id, project_id, document) VALUES ("
+                ":trace_id, :span_id, :project_id, "
+                "setweight(to_tsvector('simple', coalesce(:name, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(:error_message, '')), 'B') || "
+                "setweight(to_tsvector('simple', coalesce(:payload, '')), 'C'))"
+            ),
+            rows
+        )
+
+
+def _fts5_query(query: str) -> str:
+    """ユーザー入力をFTS5のクエリに変換（全トークンのAND、各トークンは前方一致）"""
+    tokens = _TOKEN_RE.findall(query)
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def search(
+    session: Session,
+    project_id: str,
+    query: str,
+    model: Optional[str] = None,
+    span_type: Optional[str] = None,
+    min_duration_ms: Optional[float] = None,
+    max_duration_ms: Optional[float] = None,
+    min_cost_usd: Optional[float] = None,
+    max_cost_usd: Optional[float] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 50,
+    offset: int = 0
+) -> List[Dict]:
+    """
+    インデックスを検索してヒットしたトレース/スパンを返す
+
+    span_id が None のヒットはトレース自体（名前・エラーメッセージ）への一致。
+    """
+    dialect = session.get_bind().dialect.name
+    params: Dict[str, Any] = {"project_id": project_id, "limit": limit, "offset": offset}
+
+    # FTS5の MATCH 左辺にはテーブル名が必要なため、SQLiteではエイリアスを付けない
+    if dialect == "sqlite":
+        match_query = _fts5_query(query)
+        if not match_query:
+            return []
+        params["q"] = match_query
+        source, ref = "trace_search", "trace_search"
+        match_clause = "trace_search MATCH :q"
+        rank_expr = "bm25(trace_search, 10.0, 5.0, 1.0)"
+        order = "rank ASC"
+    else:
+        # 呼び出し元が is_supported で確認しているので、ここは PostgreSQL
+        params["q"] = query
+        source, ref = "trace_search si", "si"
+        match_clause = "si.document @@ plainto_tsquery('simple', :q)"
+        rank_expr = "ts_rank(si.document, plainto_tsquery('simple', :q))"
+        order = "rank DESC"
+
+    filters = [match_clause, f"{ref}.project_id = :project_id"]
+    if model:
+        filters.append("sp.model = :model")
+        params["model"] = model
+    if span_type:
+        filters.append("sp.span_type = :span_type")
+        params["span_type"] = span_type
+    if min_duration_ms is not None:
+        filters.append("COALESCE(sp.duration_ms, t.duration_ms) >= :min_duration_ms")
+        params["min_duration_ms"] = min_duration_ms
+    if max_duration_ms is not None:
+        filters.append("COALESCE(sp.duration_ms, t.duration_ms) <= :max_duration_ms")
+        params["max_duration_ms"] = max_duration_ms
+    if min_cost_usd is not None:
+        filters.append("COALESCE(sp.cost_usd, t.total_cost_usd) >= :min_cost_usd")
+        params["min_cost_usd"] = min_cost_usd
+    if max_cost_usd is not None:
+        filters.append("COALESCE(sp.cost_usd, t.total_cost_usd) <= :max_cost_usd")
+        params["max_cost_usd"] = max_cost_usd
+
+    datetime_params = []
+    if start is not None:
+        filters.append("COALESCE(sp.start_time, t.start_time) >= :start")
+        params["start"] = naive_utc(start)
+        datetime_params.append(bindparam("start", type_=DateTime))
+    if end is not None:
+        filters.append("COALESCE(sp.start_time, t.start_time) <= :end")
+        params["end"] = naive_utc(end)
+        datetime_params.append(bindparam("end", type_=DateTime))
+
+    statement = text(f"""
+        SELECT {ref}.trace_id AS trace_id,
+               {ref}.span_id AS span_id,
+               t.name AS trace_name,
+               COALESCE(sp.name, t.name) AS name,
+               sp.span_type AS span_type,
+               sp.model AS model,
+               COALESCE(sp.status, t.status) AS status,
+               COALESCE(sp.error_message, t.error_message) AS error_message,
+               COALESCE(sp.duration_ms, t.duration_ms) AS duration_ms,
+               COALESCE(sp.cost_usd, t.total_cost_usd) AS cost_usd,
+               COALESCE(sp.start_time, t.start_time) AS start_time,
+               {rank_expr} AS rank
+        FROM {source}
+        JOIN trace t ON t.id = {ref}.trace_id
+        LEFT JOIN span sp ON sp.id = {ref}.span_id
+        WHERE {" AND ".join(filters)}
+        ORDER BY {order}
+        LIMIT :limit OFFSET :offset
+    """)
+    if datetime_params:
+        statement = statement.bindparams(*datetime_params)
+
+    rows = session.execute(statement.columns(start_time=DateTime), params).mappings().all()
+    return [dict(row) for row in rows]
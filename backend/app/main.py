@@ -2,11 +2,20 @@
 AgentScope Backend
 AI Agent monitoring and observability platform
 """
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError
 
-from app.api import traces, metrics
-from app.db.database import create_db_and_tables
+from app.api import traces, metrics, export, dashboard, otlp
+from app.db.database import create_db_and_tables, engine, is_statement_timeout, read_engine
+from app.services import observability
+from app.services.compression import GzipRequestMiddleware
+from app.services.alerts import alert_dispatcher
+from app.services.releases import release_buffer
+from app.services.topk import sketch_buffer
 
 app = FastAPI(
     title="AgentScope API",
@@ -23,11 +32,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# コレクターからの gzip 圧縮バッチを展開
+app.add_middleware(GzipRequestMiddleware)
+
+# 自己計測（リクエスト数・レイテンシ・コネクションプール）
+app.add_middleware(observability.PrometheusMiddleware)
+observability.instrument_engine(engine, "writer")
+if read_engine is not engine:
+    observability.instrument_engine(read_engine, "reader")
+
+
+@app.exception_handler(OperationalError)
+async def on_operational_error(request: Request, exc: OperationalError):
+    """ステートメントのタイムアウトは 503（期間を狭めて再試行できる）、それ以外は通常の 500"""
+    if is_statement_timeout(exc):
+        return JSONResponse(status_code=503, content={"detail": "Query timed out"})
+    raise exc
+
 
 @app.on_event("startup")
 async def on_startup():
     """サーバー起動時にDBテーブルを作成"""
     create_db_and_tables()
+    alert_dispatcher.start()
+    sketch_buffer.start()
+    release_buffer.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """ワーカー終了時にアラート配送を止め、溜めた上位K件のサマリーとリリース集計を書き、Prometheusのプロセス別ファイルを片付ける"""
+    await alert_dispatcher.stop()
+    await asyncio.to_thread(sketch_buffer.stop)
+    await asyncio.to_thread(release_buffer.stop)
+    observability.mark_process_dead()
 
 
 @app.get("/")
@@ -40,6 +78,18 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics/prometheus", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheusテキスト形式のメトリクス（マルチプロセス対応）"""
+    data, content_type = observability.render_latest()
+    return Response(content=data, media_type=content_type)
+
+
 # ルーター登録
 app.include_router(traces.router, prefix="/api/v1", tags=["traces"])
 app.include_router(metrics.router, prefix="/api/v1", tags=["metrics"])
+app.include_router(export.router, prefix="/api/v1", tags=["export"])
+app.include_router(dashboard.router, prefix="/api/v1", tags=["dashboard"])
+
+# OTLP/HTTP は標準のパス（/v1/traces）で受ける
+app.include_router(otlp.router, tags=["otlp"])
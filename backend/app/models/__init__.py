@@ -1,4 +1,4 @@
 # モデルパッケージ
-from app.models.trace import Trace, Span, Project
+from app.models.trace import Trace, Span, Project, TraceRollup, TopKSketch, ReleaseStats
 
-__all__ = ["Trace", "Span", "Project"]
+__all__ = ["Trace", "Span", "Project", "TraceRollup", "TopKSketch", "ReleaseStats"]
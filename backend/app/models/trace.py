@@ -3,6 +3,7 @@ Database Models - Trace
 """
 from datetime import datetime
 from typing import Optional, List
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 import uuid
 
@@ -22,7 +23,7 @@ class Span(SQLModel, table=True):
     
     start_time: datetime
     end_time: Optional[datetime] = None
-    duration_ms: Optional[int] = None
+    duration_ms: Optional[float] = None
     
     # LLM固有フィールド
     model: Optional[str] = None  # "gpt-4", "claude-3" など
@@ -30,6 +31,11 @@ class Span(SQLModel, table=True):
     output_tokens: Optional[int] = None
     cost_usd: Optional[float] = None
     
+    # SDKの応答キャッシュ（None はキャッシュ対象外の呼び出し）
+    cache_hit: Optional[bool] = None
+    saved_cost_usd: Optional[float] = None  # ヒットで払わずに済んだコスト
+    saved_duration_ms: Optional[float] = None  # ヒットで短縮できた時間
+    
     # 入出力（JSON文字列として保存）
     input_data: Optional[str] = None
     output_data: Optional[str] = None
@@ -44,6 +50,9 @@ class Span(SQLModel, table=True):
 
 class Trace(SQLModel, table=True):
     """エージェント実行の1回分のトレース"""
+    # 期間指定のエクスポート・集計用（プロジェクト内を開始時刻で絞る）
+    __table_args__ = (Index("ix_trace_project_start", "project_id", "start_time"),)
+    
     id: str = Field(default_factory=generate_uuid, primary_key=True)
     project_id: str = Field(index=True)
     
@@ -51,11 +60,14 @@ class Trace(SQLModel, table=True):
     
     start_time: datetime
     end_time: Optional[datetime] = None
-    duration_ms: Optional[int] = None
+    duration_ms: Optional[float] = None
     
     status: str = "running"  # "running", "success", "error"
     error_message: Optional[str] = None
     
+    # デプロイしたバージョン（SDK の init(release=...)）
+    release: Optional[str] = Field(default=None, index=True)
+    
     # 集計フィールド
     total_tokens: Optional[int] = None
     total_cost_usd: Optional[float] = None
@@ -80,3 +92,69 @@ class Project(SQLModel, table=True):
     # Slack通知設定
     slack_webhook_url: Optional[str] = None
     alert_on_error: bool = True
+
+
+class TraceRollup(SQLModel, table=True):
+    """
+    時間バケットごとのトレース集計（時系列グラフ用の事前集計）
+
+    確定したトレースを取り込み時に加算する。bucket_epoch はバケット開始のUNIX秒。
+    """
+    __tablename__ = "trace_rollup"
+    
+    project_id: str = Field(primary_key=True)
+    bucket_seconds: int = Field(primary_key=True)  # 60（分）または 3600（時）
+    bucket_epoch: int = Field(primary_key=True)
+    
+    trace_count: int = 0
+    error_count: int = 0
+    total_tokens: int = 0
+    total_cost_usd: float = 0.0
+    duration_sum_ms: float = 0.0
+    duration_count: int = 0
+    max_duration_ms: float = 0.0
+
+
+class TopKSketch(SQLModel, table=True):
+    """
+    時バケットごとの上位キーのサマリー（Space-Saving）
+
+    dimension（span_name / trace_name / model）と metric（duration / calls / errors / cost）の
+    組ごとに1行。entries は {キー: [見積もり, 誤差]} の JSON。version は同時更新の検出用。
+    """
+    __tablename__ = "topk_sketch"
+    
+    project_id: str = Field(primary_key=True)
+    bucket_epoch: int = Field(primary_key=True)
+    dimension: str = Field(primary_key=True)
+    metric: str = Field(primary_key=True)
+    
+    version: int = 1
+    total: float = 0.0
+    entries: str = "{}"
+
+
+class ReleaseStats(SQLModel, table=True):
+    """
+    リリース × トレース名ごとの集計（リリース間の比較用）
+
+    確定したトレースを取り込み時に加算する。平均と分散はトークン・コストの和と二乗和から、
+    所要時間の分布は LogHistogram（duration_sketch は to_dict の JSON）から求める。
+    version は同時更新の検出用。
+    """
+    __tablename__ = "release_stats"
+    
+    project_id: str = Field(primary_key=True)
+    release: str = Field(primary_key=True)
+    trace_name: str = Field(primary_key=True)
+    
+    version: int = 1
+    trace_count: int = 0
+    error_count: int = 0
+    tokens_sum: float = 0.0
+    tokens_sumsq: float = 0.0
+    cost_sum: float = 0.0
+    cost_sumsq: float = 0.0
+    duration_sketch: str = "{}"
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
@@ -0,0 +1 @@
+# サービスパッケージ
@@ -0,0 +1,393 @@
+"""
+Streaming alert evaluation and webhook delivery
+
+The ingest path feeds every stored trace into AlertEngine, which keeps sliding-window
+counters per project and per (project, model). Rules are evaluated at most once per
+second per window and fired alerts are handed to AlertDispatcher, whose asyncio worker
+checks the project's notification settings, applies the cooldown and hourly budget to
+alerts it can actually deliver, and posts them to the project's Slack webhook, so
+delivery never blocks ingest.
+"""
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
+import math
+import os
+import threading
+import time
+
+import httpx
+from sqlmodel import Session
+
+from app.db.database import engine
+from app.models.trace import Project
+from app.services.observability import ALERTS_FIRED, ALERTS_SUPPRESSED, ALERT_DELIVERIES, QUEUE_DEPTH
+from app.services.quantiles import LogHistogram
+
+# ===== 設定（環境変数） =====
+
+ALERT_WINDOW_SECONDS = int(os.getenv("ALERT_WINDOW_SECONDS", "300"))
+ALERT_BUCKET_SECONDS = int(os.getenv("ALERT_BUCKET_SECONDS", "30"))
+ALERT_MIN_SAMPLES = int(os.getenv("ALERT_MIN_SAMPLES", "10"))
+# エラー率（0〜1）
+ALERT_ERROR_RATE = float(os.getenv("ALERT_ERROR_RATE", "0.2"))
+# p95レイテンシ（ms）。未設定なら無効
+ALERT_P95_LATENCY_MS = float(os.getenv("ALERT_P95_LATENCY_MS", "0")) or None
+# 1時間あたりのコスト（USD）。未設定なら無効
+ALERT_COST_BURN_USD_PER_HOUR = float(os.getenv("ALERT_COST_BURN_USD_PER_HOUR", "0")) or None
+# 異常検知：直近バケットのEWMAからのzスコア
+ALERT_ANOMALY_ZSCORE = float(os.getenv("ALERT_ANOMALY_ZSCORE", "4.0"))
+ALERT_ANOMALY_MIN_BUCKETS = int(os.getenv("ALERT_ANOMALY_MIN_BUCKETS", "20"))
+# 同じアラート（プロジェクト・ルール・対象）の再通知までの秒数
+ALERT_COOLDOWN_SECONDS = int(os.getenv("ALERT_COOLDOWN_SECONDS", "900"))
+# プロジェクトあたりの1時間の通知上限
+ALERT_MAX_PER_HOUR = int(os.getenv("ALERT_MAX_PER_HOUR", "20"))
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "1000"))
+
+# 各ウィンドウを評価する最小間隔（秒）
+_EVAL_INTERVAL = 1.0
+# EWMAの平滑化係数
+_EWMA_ALPHA = 0.1
+
+
+class _Bucket:
+    """ウィンドウ内の1区間の集計"""
+
+    __slots__ = ("start", "count", "errors", "cost", "latency")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.count = 0
+        self.errors = 0
+        self.cost = 0.0
+        self.latency = LogHistogram()
+
+
+class SlidingWindow:
+    """固定長バケットのリングで表した時間窓"""
+
+    __slots__ = ("buckets", "last_eval", "warming_up")
+
+    def __init__(self):
+        self.buckets: Deque[_Bucket] = deque()
+        self.last_eval = 0.0
+        # 前回評価時にサンプル不足だったか（不足中は件数が小さいので毎回評価する）
+        self.warming_up = True
+
+    def add(self, now: float, is_error: bool, duration_ms: Optional[float], cost: float) -> Optional[_Bucket]:
+        """値を追加。バケットが切り替わった場合は閉じたバケットを返す"""
+        closed = None
+        start = now - (now % ALERT_BUCKET_SECONDS)
+        if not self.buckets or self.buckets[-1].start != start:
+            if self.buckets:
+                closed = self.buckets[-1]
+            self.buckets.append(_Bucket(start))
+            # 窓の外に出たバケットを捨てる
+            while self.buckets[0].start <= now - ALERT_WINDOW_SECONDS:
+                self.buckets.popleft()
+
+        bucket = self.buckets[-1]
+        bucket.count += 1
+        if is_error:
+            bucket.errors += 1
+        bucket.cost += cost
+        if duration_ms is not None:
+            bucket.latency.add(duration_ms)
+        return closed
+
+    def totals(self, now: float) -> Tuple[int, int, float, LogHistogram]:
+        """窓全体の (件数, エラー数, コスト, レイテンシ分布)"""
+        count = errors = 0
+        cost = 0.0
+        latency = LogHistogram()
+        for bucket in self.buckets:
+            if bucket.start <= now - ALERT_WINDOW_SECONDS:
+                continue
+            count += bucket.count
+            errors += bucket.errors
+            cost += bucket.cost
+            latency.merge(bucket.latency)
+        return count, errors, cost, latency
+
+
+class _Ewma:
+    """指数移動平均と分散（異常検知のベースライン）"""
+
+    __slots__ = ("mean", "var", "n")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.n = 0
+
+    def zscore(self, x: float) -> Optional[float]:
+        if self.n < ALERT_ANOMALY_MIN_BUCKETS:
+            return None
+        std = math.sqrt(self.var)
+        if std <= 1e-12:
+            return None
+        return (x - self.mean) / std
+
+    def update(self, x: float):
+        if self.n == 0:
+            self.mean = x
+        else:
+            diff = x - self.mean
+            self.mean += _EWMA_ALPHA * diff
+            self.var = (1 - _EWMA_ALPHA) * (self.var + _EWMA_ALPHA * diff * diff)
+        self.n += 1
+
+
+class AlertEngine:
+    """取り込み経路から呼ばれるストリーミングのルールエンジン"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows: Dict[Tuple[str, str], SlidingWindow] = {}
+        self._baselines: Dict[Tuple[str, str, str], _Ewma] = {}
+
+    def observe(
+        self,
+        project_id: str,
+        status: str,
+        duration_ms: Optional[float],
+        cost_usd: Optional[float],
+        llm_calls: List[Tuple[str, str, Optional[float], Optional[float]]]
+    ) -> List[Dict]:
+        """
+        トレース1件を取り込み、発火したアラートを返す
+
+        Args:
+            llm_calls: (model, status, duration_ms, cost_usd) のリスト
+        """
+        now = time.monotonic()
+        alerts: List[Dict] = []
+        with self._lock:
+            self._add(project_id, "*", now, status == "error", duration_ms, cost_usd or 0.0, alerts)
+            self._add_llm_calls(project_id, now, llm_calls, alerts)
+        return alerts
+
+    def observe_llm_calls(
+        self,
+        project_id: str,
+        llm_calls: List[Tuple[str, str, Optional[float], Optional[float]]]
+    ) -> List[Dict]:
+        """実行中トレースのチャンクに含まれるLLM呼び出しだけを取り込む"""
+        if not llm_calls:
+            return []
+        alerts: List[Dict] = []
+        with self._lock:
+            self._add_llm_calls(project_id, time.monotonic(), llm_calls, alerts)
+        return alerts
+
+    def _add_llm_calls(self, project_id, now, llm_calls, alerts):
+        for model, span_status, span_duration, span_cost in llm_calls:
+            self._add(project_id, f"model:{model}", now, span_status == "error",
+                      span_duration, span_cost or 0.0, alerts)
+
+    def _add(self, project_id, scope, now, is_error, duration_ms, cost, alerts):
+        key = (project_id, scope)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = SlidingWindow()
+
+        closed = window.add(now, is_error, duration_ms, cost)
+        if closed is not None:
+            self._check_anomalies(project_id, scope, closed, now, alerts)
+
+        if window.warming_up or now - window.last_eval >= _EVAL_INTERVAL:
+            window.last_eval = now
+            self._check_thresholds(project_id, scope, window, now, alerts)
+
+    def _check_thresholds(self, project_id, scope, window, now, alerts):
+        count, errors, cost, latency = window.totals(now)
+        window.warming_up = count < ALERT_MIN_SAMPLES
+        if window.warming_up:
+            return
+
+        error_rate = errors / count
+        if error_rate >= ALERT_ERROR_RATE:
+            self._fire(alerts, now, project_id, "error_rate", scope, error_rate, ALERT_ERROR_RATE,
+                       f"error rate {error_rate:.0%} over the last {ALERT_WINDOW_SECONDS}s ({errors}/{count})")
+
+        if ALERT_P95_LATENCY_MS:
+            p95 = latency.quantile(0.95)
+            if p95 is not None and p95 >= ALERT_P95_LATENCY_MS:
+                self._fire(alerts, now, project_id, "p95_latency", scope, p95, ALERT_P95_LATENCY_MS,
+                           f"p95 latency {p95:.0f}ms over the last {ALERT_WINDOW_SECONDS}s")
+
+        if ALERT_COST_BURN_USD_PER_HOUR:
+            burn = cost * 3600 / ALERT_WINDOW_SECONDS
+            if burn >= ALERT_COST_BURN_USD_PER_HOUR:
+                self._fire(alerts, now, project_id, "cost_burn", scope, burn, ALERT_COST_BURN_USD_PER_HOUR,
+                           f"cost burn ${burn:.2f}/h over the last {ALERT_WINDOW_SECONDS}s")
+
+    def _check_anomalies(self, project_id, scope, bucket, now, alerts):
+        if bucket.count == 0:
+            return
+        p95 = bucket.latency.quantile(0.95)
+        values = {
+            "error_rate": bucket.errors / bucket.count,
+            "cost": bucket.cost,
+        }
+        if p95 is not None:
+            values["p95_latency"] = p95
+
+        for metric, value in values.items():
+            key = (project_id, scope, metric)
+            baseline = self._baselines.get(key)
+            if baseline is None:
+                baseline = self._baselines[key] = _Ewma()
+            z = baseline.zscore(value)
+            if z is not None and z >= ALERT_ANOMALY_ZSCORE and bucket.count >= ALERT_MIN_SAMPLES:
+                self._fire(alerts, now, project_id, f"anomaly_{metric}", scope, value, baseline.mean,
+                           f"{metric} {value:.4g} is {z:.1f} standard deviations above its baseline "
+                           f"{baseline.mean:.4g}")
+            baseline.update(value)
+
+    def _fire(self, alerts, now, project_id, rule, scope, value, threshold, message):
+        """
+        条件を満たしたアラートを追加
+
+        重複排除とレート制限は配送側（AlertDispatcher）で、送れるアラートにだけ適用する。
+        条件が続く間は評価のたび（ウィンドウごとに最大1秒に1回）に発火する。
+        """
+        alerts.append({
+            "project_id": project_id,
+            "rule": rule,
+            "scope": scope,
+            "value": value,
+            "threshold": threshold,
+            "message": message,
+            "fired_at": datetime.now(timezone.utc).isoformat(),
+        })
+
+
+class AlertDispatcher:
+    """アラートを非同期キューで受け取り、Webhookに送信する"""
+
+    def __init__(self, db_engine):
+        self._db_engine = db_engine
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._projects: Dict[str, Tuple[float, Optional[str], bool]] = {}
+        # 重複排除とレート制限（ワーカーだけが触るのでロックは不要）
+        self._last_sent: Dict[Tuple[str, str, str], float] = {}
+        self._project_budget: Dict[str, Tuple[float, int]] = {}
+
+    def start(self):
+        """配送ワーカーを起動（イベントループ上で呼ぶこと）"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=ALERT_QUEUE_SIZE)
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        """配送ワーカーを停止"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._loop = None
+
+    async def drain(self):
+        """積まれているアラートの配送が終わるまで待つ"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def enqueue(self, alert: Dict):
+        """アラートを配送キューに積む（どのスレッドからでも呼べる）"""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._put, alert)
+
+    def _put(self, alert: Dict):
+        try:
+            self._queue.put_nowait(alert)
+            QUEUE_DEPTH.labels("alerts").inc()
+        except asyncio.QueueFull:
+            ALERTS_SUPPRESSED.labels("queue_full").inc()
+
+    def _load_project(self, project_id: str) -> Tuple[Optional[str], bool]:
+        """通知設定を取得（60秒キャッシュ）"""
+        cached = self._projects.get(project_id)
+        if cached and time.monotonic() - cached[0] < 60:
+            return cached[1], cached[2]
+        with Session(self._db_engine) as session:
+            project = session.get(Project, project_id)
+            webhook = project.slack_webhook_url if project else None
+            alert_on_error = project.alert_on_error if project else False
+        self._projects[project_id] = (time.monotonic(), webhook, alert_on_error)
+        return webhook, alert_on_error
+
+    async def _worker(self):
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            while True:
+                alert = await self._queue.get()
+                QUEUE_DEPTH.labels("alerts").dec()
+                try:
+                    await self._deliver(client, alert)
+                except Exception:
+                    ALERT_DELIVERIES.labels("error").inc()
+                finally:
+                    self._queue.task_done()
+
+    def _admit(self, alert: Dict) -> bool:
+        """
+        クールダウンと1時間あたりの上限を確認し、通すならその分を消費する
+
+        送信先がない・無効なアラートで消費しないよう、設定を確認した後に呼ぶ。
+        """
+        now = time.monotonic()
+        project_id = alert["project_id"]
+        dedup_key = (project_id, alert["rule"], alert["scope"])
+        last = self._last_sent.get(dedup_key)
+        if last is not None and now - last < ALERT_COOLDOWN_SECONDS:
+            return False
+
+        hour_start, sent = self._project_budget.get(project_id, (now, 0))
+        if now - hour_start >= 3600:
+            hour_start, sent = now, 0
+        if sent >= ALERT_MAX_PER_HOUR:
+            ALERTS_SUPPRESSED.labels("rate_limited").inc()
+            return False
+
+        self._last_sent[dedup_key] = now
+        self._project_budget[project_id] = (hour_start, sent + 1)
+        ALERTS_FIRED.labels(alert["rule"]).inc()
+        return True
+
+    async def _deliver(self, client: httpx.AsyncClient, alert: Dict):
+        webhook, alert_on_error = await asyncio.to_thread(self._load_project, alert["project_id"])
+        if not webhook:
+            ALERT_DELIVERIES.labels("no_webhook").inc()
+            return
+        if alert["rule"] in ("error_rate", "anomaly_error_rate") and not alert_on_error:
+            ALERT_DELIVERIES.labels("disabled").inc()
+            return
+        if not self._admit(alert):
+            return
+
+        scope = "" if alert["scope"] == "*" else f" ({alert['scope']})"
+        payload = {"text": f":rotating_light: [{alert['project_id']}]{scope} {alert['message']}"}
+
+        # 一時的な失敗は指数バックオフで再送
+        for attempt in range(3):
+            try:
+                response = await client.post(webhook, json=payload)
+                if response.status_code < 500:
+                    ALERT_DELIVERIES.labels("sent" if response.is_success else "rejected").inc()
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5 * 2 ** attempt)
+        ALERT_DELIVERIES.labels("failed").inc()
+
+
+# シングルトン
+alert_engine = AlertEngine()
+alert_dispatcher = AlertDispatcher(engine)
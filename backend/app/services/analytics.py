@@ -0,0 +1,324 @@
+"""
+Vectorized group-by analytics over traces and spans (NumPy)
+
+Only the needed columns are pulled through a raw DB-API cursor in fixed-size
+chunks. Each chunk is turned into NumPy arrays and folded into per
+(group, time bucket) accumulators, including log-bucket histograms for
+quantiles, so memory is bounded by the number of output cells rather than
+the number of rows scanned.
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Sequence
+import math
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+from sqlmodel import Session
+
+from app.db.database import naive_utc
+from app.services.quantiles import DEFAULT_RELATIVE_ACCURACY
+
+# 集計単位ごとに group_by で使える列
+GROUP_COLUMNS = {
+    "trace": {"name": "t.name", "status": "t.status"},
+    "span": {"name": "sp.name", "span_type": "sp.span_type", "status": "sp.status", "model": "sp.model"},
+}
+
+# 自動選択するバケット幅（秒）の候補
+BUCKET_LADDER = (60, 300, 900, 3600, 3 * 3600, 6 * 3600, 86400, 7 * 86400)
+
+# 1系列あたりの最大バケット数
+MAX_BUCKETS = 1000
+
+# カーソルから一度に読む行数
+DEFAULT_CHUNK_SIZE = 50_000
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+# 対数ヒストグラムのビン（quantiles.LogHistogram と同じ底）。0以下の値はビン0に入れる
+_GAMMA = (1 + DEFAULT_RELATIVE_ACCURACY) / (1 - DEFAULT_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_MIN_INDEX = -400   # ≒ 0.0003 ms
+_MAX_INDEX = 1200   # ≒ 年単位
+_NBINS = _MAX_INDEX - _MIN_INDEX + 2
+
+_INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_interval(value: str) -> int:
+    """"5m" や "1h" のような表記を秒数に変換"""
+    value = value.strip().lower()
+    if value.isdigit():
+        seconds = int(value)
+    else:
+        unit = _INTERVAL_UNITS.get(value[-1:])
+        if unit is None or not value[:-1].isdigit():
+            raise ValueError(f"Invalid interval: {value}")
+        seconds = int(value[:-1]) * unit
+    if seconds <= 0:
+        raise ValueError(f"Invalid interval: {value}")
+    return seconds
+
+
+def choose_interval(start: datetime, end: datetime, max_points: int) -> int:
+    """点数が max_points 以下になる最小のバケット幅を選ぶ"""
+    span = max(1.0, (end - start).total_seconds())
+    for seconds in BUCKET_LADDER:
+        if span / seconds <= max_points:
+            return seconds
+    return int(math.ceil(span / max_points / BUCKET_LADDER[-1])) * BUCKET_LADDER[-1]
+
+
+def iter_rows(
+    session: Session,
+    build_sql: Callable[[Callable[[str], str]], str],
+    params: Dict,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[List[tuple]]:
+    """
+    生のDB-APIカーソルで行をチャンクごとに返す（ORM/結果行の変換を通さない）
+
+    Args:
+        build_sql: プレースホルダ生成関数を受け取ってSQLを返す関数（ドライバごとに書式が違うため）
+        params: パラメータ。datetime はタイムゾーンなしUTCで渡す
+    """
+    connection = session.connection()
+    raw = connection.connection
+    if connection.dialect.name == "postgresql":
+        # サーバーサイドカーソル（名前付き）で少しずつ読む
+        cursor = raw.cursor("agentscope_analytics")
+        placeholder = lambda name: f"%({name})s"
+    else:
+        cursor = raw.cursor()
+        placeholder = lambda name: f":{name}"
+        # SQLite の DateTime は "YYYY-MM-DD HH:MM:SS.ffffff" の文字列で保存されている
+        params = {
+            key: value.isoformat(" ", timespec="microseconds") if isinstance(value, datetime) else value
+            for key, value in params.items()
+        }
+
+    try:
+        cursor.execute(build_sql(placeholder), params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _statement(level: str, group_column: str, placeholder) -> str:
+    """必要な列だけを読むSQL（時刻・グループ・ステータス・所要時間・トークン・コスト）"""
+    if level == "trace":
+        return (
+            f"SELECT t.start_time, COALESCE({group_column}, ''), t.status, t.duration_ms, "
+            f"t.total_tokens, t.total_cost_usd "
+            f"FROM trace t "
+            f"WHERE t.project_id = {placeholder('project_id')} "
+            f"AND t.start_time >= {placeholder('start')} AND t.start_time < {placeholder('end')}"
+        )
+    return (
+        f"SELECT sp.start_time, COALESCE({group_column}, ''), sp.status, sp.duration_ms, "
+        f"COALESCE(sp.input_tokens, 0) + COALESCE(sp.output_tokens, 0), sp.cost_usd "
+        f"FROM span sp JOIN trace t ON t.id = sp.trace_id "
+        f"WHERE t.project_id = {placeholder('project_id')} "
+        f"AND sp.start_time >= {placeholder('start')} AND sp.start_time < {placeholder('end')}"
+    )
+
+
+def _log_bins(durations: "np.ndarray") -> "np.ndarray":
+    """所要時間を対数ビン番号（0 = 0以下、1.. = gamma^i のビン）に変換"""
+    bins = np.zeros(durations.shape, dtype=np.int64)
+    positive = durations > 0
+    index = np.ceil(np.log(durations[positive]) / _LOG_GAMMA).astype(np.int64)
+    bins[positive] = np.clip(index, _MIN_INDEX, _MAX_INDEX) - _MIN_INDEX + 1
+    return bins
+
+
+def _bin_values(bins: "np.ndarray") -> "np.ndarray":
+    """ビン番号の代表値（LogHistogram.quantile と同じ定義）"""
+    values = 2 * _GAMMA ** (bins - 1 + _MIN_INDEX).astype(np.float64) / (_GAMMA + 1)
+    return np.where(bins == 0, 0.0, values)
+
+
+class _Accumulator:
+    """(グループ, バケット) ごとの集計値。グループが増えるたびに配列を伸ばす"""
+
+    def __init__(self, n_buckets: int):
+        self.n_buckets = n_buckets
+        self.groups: Dict[str, int] = {}
+        size = 0
+        self.count = np.zeros(size, dtype=np.int64)
+        self.errors = np.zeros(size, dtype=np.int64)
+        self.tokens = np.zeros(size, dtype=np.int64)
+        self.cost = np.zeros(size, dtype=np.float64)
+        self.duration_sum = np.zeros(size, dtype=np.float64)
+        self.duration_count = np.zeros(size, dtype=np.int64)
+        # (セル番号 * _NBINS + ビン番号) → 件数。チャンクごとの疎な結果を溜めて最後にまとめる
+        self._hist_codes: List["np.ndarray"] = []
+        self._hist_counts: List["np.ndarray"] = []
+
+    def _group_ids(self, values: Sequence[str]) -> "np.ndarray":
+        """グループ名をチャンク間で一貫したID配列に変換（Python処理はユニーク値だけ）"""
+        unique, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+        ids = np.empty(len(unique), dtype=np.int64)
+        for i, value in enumerate(unique):
+            group_id = self.groups.get(value)
+            if group_id is None:
+                group_id = self.groups[value] = len(self.groups)
+            ids[i] = group_id
+        self._grow()
+        return ids[inverse]
+
+    def _grow(self):
+        size = len(self.groups) * self.n_buckets
+        if size <= len(self.count):
+            return
+        extra = size - len(self.count)
+        for name in ("count", "errors", "tokens", "cost", "duration_sum", "duration_count"):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros(extra, dtype=array.dtype)]))
+
+    def add_chunk(self, rows: List[tuple], start: "np.datetime64", interval: int):
+        times, groups, statuses, durations, tokens, costs = zip(*rows)
+
+        timestamps = np.asarray(times, dtype="datetime64[us]")
+        buckets = ((timestamps - start) // np.timedelta64(interval, "s")).astype(np.int64)
+        np.clip(buckets, 0, self.n_buckets - 1, out=buckets)
+        cells = self._group_ids(groups) * self.n_buckets + buckets
+
+        size = len(self.count)
+        is_error = np.asarray(statuses, dtype=object) == "error"
+        duration = np.asarray(durations, dtype=np.float64)
+        has_duration = ~np.isnan(duration)
+
+        self.count += np.bincount(cells, minlength=size)
+        self.errors += np.bincount(cells, weights=is_error, minlength=size).astype(np.int64)
+        self.tokens += np.bincount(
+            cells, weights=np.nan_to_num(np.asarray(tokens, dtype=np.float64)), minlength=size
+        ).astype(np.int64)
+        self.cost += np.bincount(cells, weights=np.nan_to_num(np.asarray(costs, dtype=np.float64)), minlength=size)
+        self.duration_sum += np.bincount(cells[has_duration], weights=duration[has_duration], minlength=size)
+        self.duration_count += np.bincount(cells[has_duration], minlength=size)
+
+        codes = cells[has_duration] * _NBINS + _log_bins(duration[has_duration])
+        codes, counts = np.unique(codes, return_counts=True)
+        self._hist_codes.append(codes)
+        self._hist_counts.append(counts)
+        if len(self._hist_codes) >= 8:
+            self._compact()
+
+    def _compact(self):
+        """チャンクごとのヒストグラムを1つにまとめる（使用量を出力セル数 × ビン数で抑える）"""
+        codes, inverse = np.unique(np.concatenate(self._hist_codes), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate(self._hist_counts)).astype(np.int64)
+        self._hist_codes = [codes]
+        self._hist_counts = [counts]
+
+    def quantiles(self, qs: Sequence[float]) -> Dict[float, "np.ndarray"]:
+        """セルごとの分位点（所要時間のないセルは NaN）"""
+        size = len(self.count)
+        result = {q: np.full(size, np.nan) for q in qs}
+        if not self._hist_codes:
+            return result
+
+        self._compact()
+        codes, counts = self._hist_codes[0], self._hist_counts[0]
+        if not len(codes):
+            return result
+        cells = codes // _NBINS
+        bins = codes % _NBINS
+
+        cumulative = np.cumsum(counts)
+        starts = np.r_[0, np.flatnonzero(np.diff(cells)) + 1]
+        totals = np.add.reduceat(counts, starts)
+        before = cumulative[starts] - counts[starts]
+        for q in qs:
+            # LogHistogram.quantile と同じく、累積件数が rank を超える最初のビン
+            rank = before + q * (totals - 1)
+            index = np.searchsorted(cumulative, rank, side="right")
+            result[q][cells[starts]] = _bin_values(bins[index])
+        return result
+
+
+def breakdown(
+    session: Session,
+    project_id: str,
+    level: str,
+    group_by: str,
+    start: datetime,
+    end: datetime,
+    interval: int,
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> List[Dict]:
+    """
+    グループ × 時間バケットの件数・エラー数・トークン・コスト・所要時間の統計を返す
+
+    Args:
+        level: "trace" または "span"
+        group_by: GROUP_COLUMNS[level] のキー
+        interval: バケット幅（秒）
+        quantiles: 計算する分位点。各点に p50_duration_ms のようなキーで入る
+
+    Returns:
+        グループごとの系列（件数の多い順）。各系列の points は空でないバケットのみ
+    """
+    if not HAS_NUMPY:
+        raise RuntimeError("numpy is not installed")
+    columns = GROUP_COLUMNS.get(level)
+    if columns is None:
+        raise ValueError(f"Unknown level: {level}")
+    if group_by not in columns:
+        raise ValueError(f"Cannot group {level} by {group_by}")
+
+    start, end = naive_utc(start), naive_utc(end)
+    n_buckets = max(1, math.ceil((end - start).total_seconds() / interval))
+    if n_buckets > MAX_BUCKETS:
+        raise ValueError(f"Too many buckets ({n_buckets} > {MAX_BUCKETS}); use a wider interval")
+
+    accumulator = _Accumulator(n_buckets)
+    start64 = np.datetime64(start, "us")
+    for rows in iter_rows(
+        session,
+        lambda placeholder: _statement(level, columns[group_by], placeholder),
+        {"project_id": project_id, "start": start, "end": end},
+        chunk_size
+    ):
+        accumulator.add_chunk(rows, start64, interval)
+
+    quantile_values = accumulator.quantiles(quantiles)
+    series = []
+    for group, group_id in accumulator.groups.items():
+        offset = group_id * n_buckets
+        cells = np.flatnonzero(accumulator.count[offset:offset + n_buckets]) + offset
+        points = []
+        for cell in cells:
+            duration_count = int(accumulator.duration_count[cell])
+            point = {
+                "bucket_start": start + timedelta(seconds=int(cell - offset) * interval),
+                "count": int(accumulator.count[cell]),
+                "error_count": int(accumulator.errors[cell]),
+                "total_tokens": int(accumulator.tokens[cell]),
+                "total_cost_usd": round(float(accumulator.cost[cell]), 6),
+                "avg_duration_ms": round(float(accumulator.duration_sum[cell]) / duration_count, 2)
+                if duration_count else None,
+            }
+            for q, values in quantile_values.items():
+                value = values[cell]
+                point[f"p{round(q * 100):d}_duration_ms"] = None if np.isnan(value) else round(float(value), 2)
+            points.append(point)
+        series.append({
+            "group": group,
+            "count": sum(p["count"] for p in points),
+            "error_count": sum(p["error_count"] for p in points),
+            "total_tokens": sum(p["total_tokens"] for p in points),
+            "total_cost_usd": round(sum(p["total_cost_usd"] for p in points), 6),
+            "points": points,
+        })
+    return sorted(series, key=lambda s: s["count"], reverse=True)
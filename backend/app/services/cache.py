@@ -0,0 +1,58 @@
+"""
+Short-lived in-process result cache with single-flight
+"""
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+
+from app.services.observability import CACHE_REQUESTS
+
+
+class AsyncTTLCache:
+    """
+    TTL付きの結果キャッシュ（イベントループ内で使う）
+
+    同じキーの計算が進行中なら、後続のリクエストは新たに計算せずその結果を待つ（single-flight）。
+    計算は独立したタスクで走るので、最初に頼んだリクエストが切断されても他の待機者には結果が届く。
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1024):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._hit = CACHE_REQUESTS.labels(name, "hit")
+        self._miss = CACHE_REQUESTS.labels(name, "miss")
+        self._coalesced = CACHE_REQUESTS.labels(name, "coalesced")
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """キャッシュ済みの値を返す。なければ compute() を1回だけ実行してその結果を返す"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > monotonic():
+            self._hit.inc()
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self._miss.inc()
+            task = self._inflight[key] = asyncio.ensure_future(self._run(key, compute))
+        else:
+            self._coalesced.inc()
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await compute()
+            if self.ttl > 0:
+                self._entries[key] = (monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,81 @@
+"""
+Request body decompression (Content-Encoding: gzip)
+
+The host-local collector uploads large batches gzip-compressed; this ASGI middleware
+inflates them before FastAPI parses the JSON body.
+"""
+import os
+import zlib
+
+from app.services.observability import INGEST_REJECTED
+
+# 展開後のボディの上限（圧縮爆弾対策）
+MAX_DECOMPRESSED_BYTES = int(os.getenv("MAX_DECOMPRESSED_BYTES", str(256 * 1024 * 1024)))
+
+
+async def _reject(send, status: int, detail: bytes):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")],
+    })
+    await send({"type": "http.response.body", "body": b'{"detail":"' + detail + b'"}'})
+
+
+class GzipRequestMiddleware:
+    """Content-Encoding: gzip のリクエストボディを展開するASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = scope["headers"]
+        encoding = next((v for k, v in headers if k == b"content-encoding"), None)
+        if encoding is None or encoding.strip().lower() != b"gzip":
+            await self.app(scope, receive, send)
+            return
+
+        # 受信しながら少しずつ展開し、上限を超えた時点で打ち切る
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = []
+        size = 0
+        more_body = True
+        try:
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                more_body = message.get("more_body", False)
+                data = inflater.decompress(message.get("body", b""), MAX_DECOMPRESSED_BYTES - size + 1)
+                size += len(data)
+                if size > MAX_DECOMPRESSED_BYTES or inflater.unconsumed_tail:
+                    INGEST_REJECTED.labels("body_too_large").inc()
+                    await _reject(send, 413, b"Decompressed body too large")
+                    return
+                chunks.append(data)
+            chunks.append(inflater.flush())
+        except zlib.error:
+            INGEST_REJECTED.labels("bad_encoding").inc()
+            await _reject(send, 400, b"Invalid gzip body")
+            return
+
+        body = b"".join(chunks)
+        scope = dict(scope)
+        scope["headers"] = [
+            (k, v) for k, v in headers if k not in (b"content-encoding", b"content-length")
+        ] + [(b"content-length", str(len(body)).encode())]
+
+        sent = False
+
+        async def receive_inflated():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(scope, receive_inflated, send)
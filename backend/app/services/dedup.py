@@ -0,0 +1,77 @@
+"""
+Recently-seen id filter for idempotent ingest
+
+A two-generation Bloom filter of trace ids committed by this process. Ids it
+has definitely not seen skip the existing-row lookup; a false "new" (another
+worker, a restart) surfaces as an IntegrityError and ingest retries with the
+full lookup, so the filter only ever saves work.
+"""
+from typing import Iterable
+import math
+import os
+import threading
+
+# 1世代あたりのID数（2世代持つので、直近でこの1〜2倍のIDを覚えている）。0 でフィルタを使わない
+INGEST_DEDUP_CAPACITY = int(os.getenv("INGEST_DEDUP_CAPACITY", "500000"))
+# 偽陽性率（既知と誤判定されたIDは DB を引くだけなので、正しさには影響しない）
+INGEST_DEDUP_ERROR_RATE = float(os.getenv("INGEST_DEDUP_ERROR_RATE", "0.01"))
+
+
+class RecentIdFilter:
+    """
+    直近に見たIDの Bloom フィルタ（古い世代から捨てる）
+
+    "含まれない" は確実、"含まれる" は偽陽性率 error_rate で誤る。
+    ハッシュには Python の hash() を使う（プロセス内でだけ使うので、起動ごとに変わってよい）。
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.enabled = capacity > 0
+        bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)) if self.enabled else 8
+        self._num_bits = bits
+        self._num_hashes = max(1, round(bits / max(capacity, 1) * math.log(2)))
+        self._current = bytearray((bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, item: str):
+        h = hash(item)
+        h1 = h & 0xFFFFFFFF
+        h2 = ((h >> 32) & 0xFFFFFFFF) | 1
+        m = self._num_bits
+        return [(h1 + i * h2) % m for i in range(self._num_hashes)]
+
+    def __contains__(self, item: str) -> bool:
+        positions = self._positions(item)
+        # 世代の入れ替えと競合しても、見落とし（"含まれない"）は IntegrityError の再試行で救われる
+        for bits in (self._current, self._previous):
+            if all(bits[p >> 3] & (1 << (p & 7)) for p in positions):
+                return True
+        return False
+
+    def add_many(self, items: Iterable[str]):
+        """IDを登録（現世代が満杯なら、前の世代を捨てて新しい世代を始める）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for item in items:
+                if self._count >= self.capacity:
+                    self._previous = self._current
+                    self._current = bytearray(len(self._previous))
+                    self._count = 0
+                bits = self._current
+                for p in self._positions(item):
+                    bits[p >> 3] |= 1 << (p & 7)
+                self._count += 1
+
+    def clear(self):
+        with self._lock:
+            self._current = bytearray(len(self._current))
+            self._previous = bytearray(len(self._current))
+            self._count = 0
+
+
+# このプロセスでコミットしたトレースID
+recent_trace_ids = RecentIdFilter(INGEST_DEDUP_CAPACITY, INGEST_DEDUP_ERROR_RATE)
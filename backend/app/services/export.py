@@ -0,0 +1,205 @@
+"""
+Columnar bulk export of traces and spans (Apache Arrow IPC / Parquet)
+
+Rows are read through a server-side cursor in fixed-size chunks and each chunk
+is written as one record batch / row group, so memory stays bounded regardless
+of the export size.
+"""
+from datetime import datetime
+from typing import Iterator, List, Optional
+from sqlalchemy import select
+from sqlmodel import Session
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+from app.db.database import naive_utc
+from app.models.trace import Trace, Span
+
+EXPORT_FORMATS = ("arrow", "parquet")
+EXPORT_TABLES = ("spans", "traces")
+
+# 1チャンク（= 1レコードバッチ / 1行グループ）あたりの行数
+DEFAULT_CHUNK_SIZE = 10_000
+
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """書き込まれたバイト列を溜めておき、チャンクごとに取り出せる出力先"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        """溜まったバイト列を取り出す"""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _schema(table: str, include_payload: bool) -> "pa.Schema":
+    """エクスポートするテーブルのスキーマ"""
+    ts = pa.timestamp("us", tz="UTC")
+    if table == "spans":
+        fields = [
+            ("id", pa.string()),
+            ("trace_id", pa.string()),
+            ("project_id", pa.string()),
+            ("parent_span_id", pa.string()),
+            ("name", pa.string()),
+            ("span_type", pa.string()),
+            ("start_time", ts),
+            ("end_time", ts),
+            ("duration_ms", pa.float64()),
+            ("model", pa.string()),
+            ("input_tokens", pa.int64()),
+            ("output_tokens", pa.int64()),
+            ("cost_usd", pa.float64()),
+            ("cache_hit", pa.bool_()),
+            ("saved_cost_usd", pa.float64()),
+            ("saved_duration_ms", pa.float64()),
+            ("status", pa.string()),
+            ("error_message", pa.string()),
+        ]
+        if include_payload:
+            fields += [("input_data", pa.string()), ("output_data", pa.string())]
+    else:
+        fields = [
+            ("id", pa.string()),
+            ("project_id", pa.string()),
+            ("name", pa.string()),
+            ("start_time", ts),
+            ("end_time", ts),
+            ("duration_ms", pa.float64()),
+            ("status", pa.string()),
+            ("error_message", pa.string()),
+            ("release", pa.string()),
+            ("total_tokens", pa.int64()),
+            ("total_cost_usd", pa.float64()),
+            ("span_count", pa.int64()),
+            ("created_at", ts),
+        ]
+        if include_payload:
+            fields += [("extra_metadata", pa.string())]
+    return pa.schema(fields)
+
+
+def _statement(
+    table: str,
+    project_id: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    include_payload: bool
+):
+    """必要な列だけを読むSELECT文"""
+    if table == "spans":
+        columns = [
+            Span.id, Span.trace_id, Trace.project_id, Span.parent_span_id, Span.name,
+            Span.span_type, Span.start_time, Span.end_time, Span.duration_ms, Span.model,
+            Span.input_tokens, Span.output_tokens, Span.cost_usd, Span.cache_hit,
+            Span.saved_cost_usd, Span.saved_duration_ms, Span.status, Span.error_message,
+        ]
+        if include_payload:
+            columns += [Span.input_data, Span.output_data]
+        statement = select(*columns).join(Trace, Trace.id == Span.trace_id)
+    else:
+        columns = [
+            Trace.id, Trace.project_id, Trace.name, Trace.start_time, Trace.end_time,
+            Trace.duration_ms, Trace.status, Trace.error_message, Trace.release,
+            Trace.total_tokens, Trace.total_cost_usd, Trace.span_count, Trace.created_at,
+        ]
+        if include_payload:
+            columns += [Trace.extra_metadata]
+        statement = select(*columns)
+
+    # 期間はトレースの開始時刻で指定する（取り込み時刻ではないので、遅れて届いたトレースも正しい期間に入る）
+    statement = statement.where(Trace.project_id == project_id)
+    if start is not None:
+        statement = statement.where(Trace.start_time >= naive_utc(start))
+    if end is not None:
+        statement = statement.where(Trace.start_time < naive_utc(end))
+    return statement
+
+
+def iter_export(
+    session: Session,
+    project_id: str,
+    table: str = "spans",
+    fmt: str = "parquet",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_payload: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    エクスポート結果をバイト列のチャンクとして順に返す
+
+    Args:
+        table: "spans" または "traces"
+        fmt: "arrow"（IPCストリーム）または "parquet"
+        include_payload: 入出力ペイロード列を含めるか
+        chunk_size: サーバーサイドカーソルから一度に読む行数
+    """
+    if not HAS_PYARROW:
+        raise RuntimeError("pyarrow is not installed")
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    schema = _schema(table, include_payload)
+    sink = _ChunkSink()
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+    else:
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    # 1つのカーソルを送信の終わりまで読み続けるので、読み取り側のステートメントのタイムアウト（SQLite）を外す
+    result = session.connection().execution_options(
+        stream_results=True, yield_per=chunk_size, no_statement_timeout=True
+    ).execute(_statement(table, project_id, start, end, include_payload))
+
+    try:
+        for rows in result.partitions(chunk_size):
+            columns = list(zip(*rows))
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema
+            )
+            if fmt == "arrow":
+                writer.write_batch(batch)
+            else:
+                writer.write_table(pa.Table.from_batches([batch]), row_group_size=chunk_size)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        result.close()
+
+    writer.close()
+    data = sink.drain()
+    if data:
+        yield data
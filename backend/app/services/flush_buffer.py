@@ -0,0 +1,113 @@
+"""
+Per-worker buffers for aggregates written outside the ingest transaction
+
+Pre-aggregated rows (top-K sketches, release stats) are hot: every worker
+ingesting the same project updates the same few rows. Writing them inside the
+ingest transaction serializes ingest on those row locks and lets a conflict
+fail the whole batch. Ingest instead hands each committed request's deltas to
+a FlushBuffer, which merges them in memory and writes them every few seconds
+from a background thread. Rows that could not be written are kept for the
+next flush and counted in agentscope_aggregate_flush_total.
+"""
+from typing import Any, Dict, Hashable, Optional
+import threading
+
+from sqlmodel import Session
+
+from app.services.observability import AGGREGATE_FLUSHES
+
+# 同時更新で version が合わなかったときに、1回の書き込みで読み直す回数
+_MAX_RETRIES = 5
+
+
+class FlushBuffer:
+    """
+    取り込みで作った集計の増分をワーカー内に溜め、取り込みのトランザクションの外でまとめて書く
+
+    値は merge(other) で足し込めるオブジェクト（SpaceSaving・Stats など）。サブクラスは
+    write(session, pending) で行にマージして書き、競合して書けなかったものを返す。
+    書けなかった分（競合が続いた・DBエラー）は次の書き込みに回すので、取り込みは失敗しない。
+    プロセスが落ちると、最後の書き込み以降の分（最大 interval 秒）は失われる。
+
+    Args:
+        name: メトリクスのラベル（aggregate）とスレッド名に使う名前
+        db_engine: 書き込みに使うエンジン
+        interval: 定期的に書き込む間隔（秒）
+    """
+
+    def __init__(self, name: str, db_engine, interval: float):
+        self.name = name
+        self.interval = interval
+        self._db_engine = db_engine
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[Hashable, Any] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self, session: Session, pending: Dict[Hashable, Any]) -> Dict[Hashable, Any]:
+        raise NotImplementedError
+
+    def add(self, deltas: Dict[Hashable, Any]):
+        """増分を溜める（コミットした後に呼ぶ）"""
+        if not deltas:
+            return
+        with self._lock:
+            pending = self._pending
+            for key, delta in deltas.items():
+                current = pending.get(key)
+                if current is None:
+                    pending[key] = delta
+                else:
+                    current.merge(delta)
+
+    def flush(self) -> int:
+        """溜まっている増分を書き、書いた行数を返す"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            # ワーカー同士が同じ順で行をロックするよう、キー順に書く（Postgres のデッドロック回避）
+            pending = dict(sorted(pending.items(), key=lambda item: item[0]))
+            total = len(pending)
+            result = "conflict"
+            try:
+                with Session(self._db_engine) as session:
+                    for _ in range(_MAX_RETRIES):
+                        remaining = self.write(session, pending)
+                        session.commit()
+                        pending = remaining
+                        if not pending:
+                            break
+            except Exception:
+                result = "error"
+            written = total - len(pending)
+            if written:
+                AGGREGATE_FLUSHES.labels(self.name, "written").inc(written)
+            if pending:
+                # 書けなかった分は次回に回す（新しく溜まった分とマージする）
+                AGGREGATE_FLUSHES.labels(self.name, result).inc(len(pending))
+                self.add(pending)
+            return written
+
+    def start(self):
+        """定期的に書き込むスレッドを起動"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.interval):
+                self.flush()
+
+        self._thread = threading.Thread(target=run, name=f"agentscope-{self.name}-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """スレッドを止め、残りを書く"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
@@ -0,0 +1,369 @@
+"""
+Trace ingest pipeline shared by the single and batch endpoints
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from time import perf_counter
+import json
+
+from app.db import search as search_index
+from app.db.database import naive_utc
+from app.models.trace import Trace, Span
+from app.services.alerts import alert_dispatcher, alert_engine
+from app.services.dedup import recent_trace_ids
+from app.services.live import broker
+from app.services.releases import build_release_stats, release_buffer
+from app.services.observability import INGEST_DEDUP, INGEST_SPANS, INGEST_TRACES, observe_phase
+from app.services.timeseries import delta, record_rollups, snapshot
+from app.services.topk import build_sketches, sketch_buffer
+
+
+def _trace_event(trace: Trace) -> Dict[str, Any]:
+    """ライブ配信用のトレース概要"""
+    return {
+        "id": trace.id,
+        "project_id": trace.project_id,
+        "name": trace.name,
+        "start_time": trace.start_time.isoformat() if trace.start_time else None,
+        "end_time": trace.end_time.isoformat() if trace.end_time else None,
+        "duration_ms": trace.duration_ms,
+        "status": trace.status,
+        "error_message": trace.error_message,
+        "release": trace.release,
+        "total_tokens": trace.total_tokens,
+        "total_cost_usd": trace.total_cost_usd,
+        "span_count": trace.span_count,
+        "created_at": trace.created_at.isoformat() if trace.created_at else None,
+    }
+
+
+# これ以上変化しないトレースのステータス（後続チャンクで running に戻さない）
+FINAL_STATUSES = ("success", "error")
+
+
+class TraceConflictError(Exception):
+    """既存のトレースIDが別プロジェクトのものだった"""
+
+
+def _build_spans(
+    trace: Trace,
+    spans_data: List[Dict],
+    skip_ids: Set[str],
+    search_documents: List[Dict],
+    llm_calls: List
+) -> List[Span]:
+    """
+    受信データからSpanを組み立て、トレースの集計値に足し込む
+
+    skip_ids に含まれるスパン（再送されたチャンクの重複）は無視し、集計にも含めない。
+    """
+    spans: List[Span] = []
+    total_tokens = 0
+    total_cost = 0.0
+    
+    for span_data in spans_data:
+        if span_data["id"] in skip_ids:
+            continue
+        skip_ids.add(span_data["id"])
+        input_data = span_data.get("input_data")
+        output_data = span_data.get("output_data")
+        span = Span(
+            id=span_data["id"],
+            trace_id=trace.id,
+            parent_span_id=span_data.get("parent_span_id"),
+            name=span_data["name"],
+            span_type=span_data["span_type"],
+            start_time=span_data["start_time"],
+            end_time=span_data.get("end_time"),
+            duration_ms=span_data.get("duration_ms"),
+            model=span_data.get("model"),
+            input_tokens=span_data.get("input_tokens"),
+            output_tokens=span_data.get("output_tokens"),
+            cost_usd=span_data.get("cost_usd"),
+            cache_hit=span_data.get("cache_hit"),
+            saved_cost_usd=span_data.get("saved_cost_usd"),
+            saved_duration_ms=span_data.get("saved_duration_ms"),
+            input_data=json.dumps(input_data) if input_data else None,
+            output_data=json.dumps(output_data) if output_data else None,
+            status=span_data.get("status", "success"),
+            error_message=span_data.get("error_message")
+        )
+        spans.append(span)
+        search_documents.append({
+            "trace_id": trace.id,
+            "span_id": span.id,
+            "project_id": trace.project_id,
+            "name": span.name,
+            "error_message": span.error_message,
+            "payload": search_index.payload_text(input_data, output_data)
+        })
+        
+        if span.input_tokens:
+            total_tokens += span.input_tokens
+        if span.output_tokens:
+            total_tokens += span.output_tokens
+        if span.cost_usd:
+            total_cost += span.cost_usd
+        if span.model:
+            llm_calls.append((span.model, span.status, span.duration_ms, span.cost_usd))
+    
+    # 集計値は増分で更新（0件のときは None のまま）
+    trace.span_count = (trace.span_count or 0) + len(spans)
+    if total_tokens > 0:
+        trace.total_tokens = (trace.total_tokens or 0) + total_tokens
+    if total_cost > 0:
+        trace.total_cost_usd = (trace.total_cost_usd or 0.0) + total_cost
+    return spans
+
+
+def _is_downstream(trace_data: Dict) -> bool:
+    """他サービスから traceparent で引き継いだトレースのチャンクか"""
+    return trace_data.get("remote_parent_span_id") is not None
+
+
+def _trace_document(trace: Trace, extra_metadata: Optional[Dict]) -> Dict:
+    """トレース自体（名前・エラーメッセージ・メタデータ）の検索ドキュメント"""
+    return {
+        "trace_id": trace.id,
+        "span_id": None,
+        "project_id": trace.project_id,
+        "name": trace.name,
+        "error_message": trace.error_message,
+        "payload": search_index.payload_text(extra_metadata)
+    }
+
+
+def _new_trace(trace_data: Dict, trace_documents: Dict[str, Dict]) -> Trace:
+    """
+    最初のチャンク（または一括送信）からTraceを作る
+
+    下流サービスのチャンクが先に届いた場合は running で作り、呼び出し元のチャンクを待つ
+    （名前とステータスは呼び出し元のものになる）。
+    """
+    extra_metadata = trace_data.get("extra_metadata")
+    downstream = _is_downstream(trace_data)
+    trace = Trace(
+        id=trace_data["id"],
+        project_id=trace_data["project_id"],
+        name=trace_data["name"],
+        start_time=trace_data["start_time"],
+        end_time=trace_data.get("end_time"),
+        duration_ms=trace_data.get("duration_ms"),
+        status="running" if downstream else trace_data.get("status", "success"),
+        error_message=None if downstream else trace_data.get("error_message"),
+        release=trace_data.get("release"),
+        extra_metadata=json.dumps(extra_metadata) if extra_metadata else None,
+        span_count=0
+    )
+    
+    # 検索インデックス用ドキュメント（トレース自体）
+    trace_documents[trace.id] = _trace_document(trace, extra_metadata)
+    return trace
+
+
+def _merge_trace(trace: Trace, trace_data: Dict, trace_documents: Dict[str, Dict]):
+    """
+    既存のトレースに後続チャンクのヘッダを反映
+
+    確定済み（success/error）のトレースを running に戻すことはない。
+    チャンクの到着順が前後しても最終状態が残る。下流サービスのチャンクはスパンと時間幅だけを足し、
+    名前・ステータス・エラーは呼び出し元のチャンクに任せる。
+    
+    時間幅はすべてのチャンクの和（開始は最も早いもの、終了は最も遅いもの）。OTLPでは子スパンだけの
+    チャンクがルートより先に届き、非同期に呼ばれた下流サービスは呼び出し元より後に終わることがある。
+    所要時間は、広がった時間幅と呼び出し元が測った値の大きいほうにする（スパンは読み直さない）。
+    """
+    indexed = (trace.name, trace.error_message, trace.extra_metadata)
+    widened = False
+    start_time = trace_data.get("start_time")
+    if start_time is not None and trace.start_time is not None \
+            and naive_utc(start_time) < naive_utc(trace.start_time):
+        trace.start_time = start_time
+        widened = True
+    previous_end = trace.end_time
+    
+    status = trace_data.get("status", "success")
+    if not _is_downstream(trace_data) and (status in FINAL_STATUSES or trace.status not in FINAL_STATUSES):
+        # 最終チャンクのヘッダ（ルートスパン）の名前を正とする
+        if status in FINAL_STATUSES and trace_data.get("name"):
+            trace.name = trace_data["name"]
+        trace.status = status
+        if trace_data.get("end_time") is not None:
+            trace.end_time = trace_data["end_time"]
+        if trace_data.get("duration_ms") is not None:
+            trace.duration_ms = trace_data["duration_ms"]
+        if trace_data.get("error_message"):
+            trace.error_message = trace_data["error_message"]
+    
+    for end_time in (previous_end, trace_data.get("end_time")):
+        if end_time is not None and (trace.end_time is None or naive_utc(end_time) > naive_utc(trace.end_time)):
+            trace.end_time = end_time
+            widened = True
+    if widened and trace.start_time is not None and trace.end_time is not None:
+        window_ms = (naive_utc(trace.end_time) - naive_utc(trace.start_time)).total_seconds() * 1000
+        trace.duration_ms = max(trace.duration_ms or 0.0, round(window_ms, 3))
+    
+    # リリースは呼び出し元のものを正とする（下流サービスは別のリリースで動いていることがある）
+    release = trace_data.get("release")
+    if release and (trace.release is None or not _is_downstream(trace_data)):
+        trace.release = release
+    
+    extra_metadata = trace_data.get("extra_metadata")
+    if extra_metadata:
+        trace.extra_metadata = json.dumps(extra_metadata)
+    
+    # 名前・エラー・メタデータが変わったら、トレースの検索ドキュメントを置き換える（追記はしない）
+    if (trace.name, trace.error_message, trace.extra_metadata) != indexed:
+        trace_documents[trace.id] = _trace_document(
+            trace, json.loads(trace.extra_metadata) if trace.extra_metadata else None
+        )
+
+
+def ingest_traces(session: Session, traces_data: List[Dict], endpoint: str = "traces") -> List[Trace]:
+    """
+    トレース（スパン込み）をまとめて保存
+
+    1回のコミットで全件を書き込み、コミット後にライブ購読者へ配信する。
+    既に存在するトレースIDはチャンクの追記として扱い、スパンを追加して集計値を増分更新する
+    （長時間実行のエージェントが途中経過を送る用途）。
+    同じトレース・スパンの再送は冪等で、既知のスパンは捨て、確定済みトレースの集計やアラートは
+    やり直さない。
+    
+    Args:
+        traces_data: TraceCreate相当の辞書のリスト
+        endpoint: メトリクスのラベルに使う取り込み経路名
+    
+    Returns:
+        保存・更新したTraceのリスト（IDごとに1件）
+    """
+    try:
+        return _ingest(session, traces_data, endpoint, trust_filter=True)
+    except IntegrityError:
+        # フィルタが新規と判断したIDが既に書かれていた（別ワーカー・再起動前・同時の再送）。
+        # 全件を DB で照合してやり直す（集計もロールバックされているので二重には数えない）
+        session.rollback()
+        INGEST_DEDUP.labels("conflict_retry").inc()
+        return _ingest(session, traces_data, endpoint, trust_filter=False)
+
+
+def _ingest(session: Session, traces_data: List[Dict], endpoint: str, trust_filter: bool) -> List[Trace]:
+    """
+    ingest_traces の本体
+
+    trust_filter=True のときは、このプロセスが最近コミットしていないトレースIDを新規とみなし、
+    既存行の照会を省く。
+    """
+    search_documents: List[Dict] = []
+    trace_documents: Dict[str, Dict] = {}
+    span_count = 0
+    
+    # 同じIDのトレースは既存行（またはこのリクエスト内の先行チャンク）にマージする
+    trace_ids = list({t["id"] for t in traces_data})
+    started = perf_counter()
+    lookup_ids = trace_ids
+    if trust_filter and recent_trace_ids.enabled:
+        lookup_ids = [trace_id for trace_id in trace_ids if trace_id in recent_trace_ids]
+        if len(lookup_ids) < len(trace_ids):
+            INGEST_DEDUP.labels("lookup_skipped").inc(len(trace_ids) - len(lookup_ids))
+    if lookup_ids:
+        INGEST_DEDUP.labels("lookup").inc(len(lookup_ids))
+    merged: Dict[str, Trace] = {
+        trace.id: trace
+        for trace in session.exec(select(Trace).where(Trace.id.in_(lookup_ids)))
+    } if lookup_ids else {}
+    for trace_data in traces_data:
+        existing = merged.get(trace_data["id"])
+        if existing is not None and existing.project_id != trace_data["project_id"]:
+            raise TraceConflictError(trace_data["id"])
+    # 既に確定済みのトレース（最終チャンクの再送ではアラートを再評価しない）と、その集計値
+    already_final = {trace_id for trace_id, trace in merged.items() if trace.status in FINAL_STATUSES}
+    final_before = {trace_id: snapshot(merged[trace_id]) for trace_id in already_final}
+    known_span_ids: Set[str] = set()
+    if merged:
+        incoming_span_ids = [
+            span["id"] for t in traces_data if t["id"] in merged for span in t.get("spans") or ()
+        ]
+        if incoming_span_ids:
+            known_span_ids.update(session.exec(
+                select(Span.id).where(Span.trace_id.in_(list(merged)), Span.id.in_(incoming_span_ids))
+            ))
+    observe_phase(endpoint, "lookup", perf_counter() - started)
+    
+    # 1リクエストの中で更新されたトレース（挿入順）と、その回の LLM 呼び出し
+    touched: Dict[str, Trace] = {}
+    llm_calls_by_trace: Dict[str, List] = {}
+    new_spans: List[Tuple[str, List[Span]]] = []
+    
+    started = perf_counter()
+    for trace_data in traces_data:
+        trace = merged.get(trace_data["id"])
+        if trace is None:
+            trace = merged[trace_data["id"]] = _new_trace(trace_data, trace_documents)
+            session.add(trace)
+        else:
+            _merge_trace(trace, trace_data, trace_documents)
+        
+        llm_calls = llm_calls_by_trace.setdefault(trace.id, [])
+        spans = _build_spans(trace, trace_data.get("spans") or [], known_span_ids, search_documents, llm_calls)
+        session.add_all(spans)
+        span_count += len(spans)
+        new_spans.append((trace.project_id, spans))
+        touched[trace.id] = trace
+    
+    # コミット後に属性を再読込しないよう、配信・アラート用の値はコミット前に取り出しておく
+    traces = list(touched.values())
+    events = [_trace_event(trace) for trace in traces]
+    finalized = [t for t in traces if t.status in FINAL_STATUSES and t.id not in already_final]
+    finalized_ids = {t.id for t in finalized}
+    # 確定済みのトレースに後から届いたスパン（下流サービスなど）の分は、増分だけを集計に足す
+    late = [d for d in (delta(t, final_before[t.id]) for t in traces if t.id in already_final) if d is not None]
+    observations = [
+        (trace.project_id, trace.id in finalized_ids, trace.status, trace.duration_ms,
+         trace.total_cost_usd, llm_calls_by_trace[trace.id])
+        for trace in traces
+    ]
+    observe_phase(endpoint, "build", perf_counter() - started)
+    
+    # 時系列グラフ・上位K件・リリース比較用の事前集計（トレースは確定した時点、スパンは初めて保存した時点で1回だけ加算する）
+    started = perf_counter()
+    record_rollups(session, finalized, late)
+    # 上位K件のサマリーとリリース比較の集計はコミットした後にバッファへ渡し、トランザクションの外で書く
+    sketches = build_sketches(finalized, new_spans, late)
+    release_stats = build_release_stats(finalized)
+    observe_phase(endpoint, "rollup", perf_counter() - started)
+    
+    if search_index.is_supported(session.get_bind().dialect.name):
+        started = perf_counter()
+        search_index.index_documents(session, [*trace_documents.values(), *search_documents])
+        observe_phase(endpoint, "index", perf_counter() - started)
+    
+    started = perf_counter()
+    session.commit()
+    observe_phase(endpoint, "commit", perf_counter() - started)
+    recent_trace_ids.add_many(trace_ids)
+    sketch_buffer.add(sketches)
+    release_buffer.add(release_stats)
+    
+    INGEST_TRACES.labels(endpoint).inc(len(traces))
+    INGEST_SPANS.labels(endpoint).inc(span_count)
+    duplicate_spans = sum(len(t.get("spans") or ()) for t in traces_data) - span_count
+    if duplicate_spans:
+        INGEST_DEDUP.labels("duplicate_span").inc(duplicate_spans)
+    
+    # ライブ購読者へ配信（購読者がいなければ何もしない）
+    for event in events:
+        if broker.has_subscribers(event["project_id"]):
+            broker.publish(event["project_id"], event)
+    
+    # アラート評価（通知は非同期キュー経由なので取り込みを待たせない）
+    # 実行中のチャンクはLLM呼び出しだけを評価し、トレース単位の評価は確定時に1回だけ行う
+    for project_id, finalized, status, duration_ms, cost_usd, llm_calls in observations:
+        if finalized:
+            alerts = alert_engine.observe(project_id, status, duration_ms, cost_usd, llm_calls)
+        else:
+            alerts = alert_engine.observe_llm_calls(project_id, llm_calls)
+        for alert in alerts:
+            alert_dispatcher.enqueue(alert)
+    
+    return traces
@@ -0,0 +1,134 @@
+"""
+Live trace fan-out (in-process pub/sub for Server-Sent Events)
+"""
+from typing import Dict, Optional, Set
+import asyncio
+import json
+import os
+import threading
+
+from app.services.observability import QUEUE_DEPTH
+
+# 購読者ごとのバッファ上限（これを超えた遅いクライアントは切断する）
+LIVE_BUFFER_SIZE = int(os.getenv("LIVE_BUFFER_SIZE", "256"))
+
+# バッファ溢れで切断されたことを購読者に伝える番兵
+DROPPED = object()
+
+
+class LiveSubscriber:
+    """1本のSSE接続に対応する購読者"""
+
+    def __init__(
+        self,
+        project_id: str,
+        status: Optional[str] = None,
+        name: Optional[str] = None,
+        min_duration_ms: Optional[float] = None,
+        max_buffer: int = LIVE_BUFFER_SIZE
+    ):
+        self.project_id = project_id
+        self.status = status
+        self.name = name
+        self.min_duration_ms = min_duration_ms
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self.loop = asyncio.get_running_loop()
+        self.dropped = False
+
+    def matches(self, event: Dict) -> bool:
+        """サーバー側フィルタを適用"""
+        if self.status and event.get("status") != self.status:
+            return False
+        if self.name and event.get("name") != self.name:
+            return False
+        if self.min_duration_ms is not None:
+            duration = event.get("duration_ms")
+            if duration is None or duration < self.min_duration_ms:
+                return False
+        return True
+
+    def offer(self, data: str):
+        """イベントをバッファに積む（イベントループ上で呼ぶこと）"""
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # 遅いクライアントは切り捨てる。溜まったイベントを捨てて番兵だけ残す
+            self.dropped = True
+            QUEUE_DEPTH.labels("live").dec(self.queue.qsize())
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(DROPPED)
+        QUEUE_DEPTH.labels("live").inc()
+
+
+class LiveBroker:
+    """
+    取り込み経路からSSE購読者へトレースを配信する
+
+    登録・解除はイベントループ上、配信は取り込みのワーカースレッドから呼ばれるので、
+    購読者の集合はロックで守り、配信はロック内で取ったコピーに対して行う。
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[LiveSubscriber]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscriber: LiveSubscriber):
+        """購読者を登録"""
+        with self._lock:
+            self._subscribers.setdefault(subscriber.project_id, set()).add(subscriber)
+
+    def unsubscribe(self, subscriber: LiveSubscriber):
+        """購読者を解除"""
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.project_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self._subscribers.pop(subscriber.project_id, None)
+        QUEUE_DEPTH.labels("live").dec(subscriber.queue.qsize())
+
+    def has_subscribers(self, project_id: str) -> bool:
+        """プロジェクトに購読者がいるか"""
+        return bool(self._subscribers.get(project_id))
+
+    def subscriber_count(self) -> int:
+        """全購読者数"""
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, project_id: str, event: Dict):
+        """
+        イベントを配信
+
+        シリアライズは1回だけ行い、全購読者で共有する。
+        イベントループ外のスレッドから呼ばれた場合は call_soon_threadsafe で渡す。
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(project_id)
+            if not subscribers:
+                return
+            subscribers = list(subscribers)
+
+        data = None
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        for subscriber in subscribers:
+            if subscriber.dropped or not subscriber.matches(event):
+                continue
+            if data is None:
+                data = json.dumps(event, default=str)
+            if subscriber.loop is running_loop:
+                subscriber.offer(data)
+            else:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, data)
+
+
+# シングルトンブローカー
+broker = LiveBroker()
@@ -0,0 +1,196 @@
+"""
+Backend self-observability (Prometheus metrics)
+
+When PROMETHEUS_MULTIPROC_DIR is set (required when uvicorn/gunicorn runs several
+workers), prometheus_client writes values to per-process files and the exposition
+endpoint aggregates them with MultiProcessCollector.
+"""
+from typing import Dict, Tuple
+from time import perf_counter
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+    generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# 取り込み1フェーズあたりのバケット（サブミリ秒から数秒まで）
+_PHASE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HTTP_REQUESTS = Counter(
+    "agentscope_http_requests_total",
+    "HTTP requests by route and status",
+    ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "agentscope_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route"]
+)
+INGEST_PHASE = Histogram(
+    "agentscope_ingest_phase_duration_seconds",
+    "Time spent in each ingest phase (parse, auth, lookup, build, rollup, index, commit)",
+    ["endpoint", "phase"],
+    buckets=_PHASE_BUCKETS
+)
+INGEST_TRACES = Counter(
+    "agentscope_ingest_traces_total",
+    "Traces accepted by ingest",
+    ["endpoint"]
+)
+INGEST_SPANS = Counter(
+    "agentscope_ingest_spans_total",
+    "Spans accepted by ingest",
+    ["endpoint"]
+)
+INGEST_REJECTED = Counter(
+    "agentscope_ingest_rejected_total",
+    "Ingest requests rejected before writing",
+    ["reason"]
+)
+INGEST_DEDUP = Counter(
+    "agentscope_ingest_dedup_total",
+    "Ingest id deduplication (lookup skipped by the recent-id filter, lookup, conflict retried, duplicate span dropped)",
+    ["result"]
+)
+QUERY_LATENCY = Histogram(
+    "agentscope_query_duration_seconds",
+    "Time spent computing read/analytics queries",
+    ["query"],
+    buckets=_PHASE_BUCKETS
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "agentscope_db_pool_checked_out",
+    "Database connections currently checked out of the pool",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+DB_CONNECTIONS_OPENED = Counter(
+    "agentscope_db_connections_opened_total",
+    "New database connections opened by the pool",
+    ["pool"]
+)
+QUEUE_DEPTH = Gauge(
+    "agentscope_queue_depth",
+    "Items waiting in in-process queues",
+    ["queue"],
+    multiprocess_mode="livesum"
+)
+ALERTS_FIRED = Counter(
+    "agentscope_alerts_fired_total",
+    "Alerts admitted for delivery after the cooldown and hourly budget",
+    ["rule"]
+)
+ALERTS_SUPPRESSED = Counter(
+    "agentscope_alerts_suppressed_total",
+    "Alerts dropped by rate limiting or a full delivery queue",
+    ["reason"]
+)
+ALERT_DELIVERIES = Counter(
+    "agentscope_alert_deliveries_total",
+    "Alert webhook delivery outcomes",
+    ["result"]
+)
+AGGREGATE_FLUSHES = Counter(
+    "agentscope_aggregate_flush_total",
+    "Rows of buffered aggregates flushed outside ingest (written, or deferred to the next flush after a conflict or error)",
+    ["aggregate", "result"]
+)
+CACHE_REQUESTS = Counter(
+    "agentscope_cache_requests_total",
+    "Result cache lookups (hit, miss, coalesced into an in-flight computation)",
+    ["cache", "result"]
+)
+
+# ラベル付き子メトリクスのキャッシュ（.labels() の辞書検索を毎回しないため）
+_phase_children: Dict[Tuple[str, str], object] = {}
+_http_children: Dict[Tuple[str, str], Tuple[object, Dict[int, object]]] = {}
+
+
+def observe_phase(endpoint: str, phase: str, seconds: float):
+    """取り込みフェーズの所要時間を記録"""
+    child = _phase_children.get((endpoint, phase))
+    if child is None:
+        child = _phase_children[(endpoint, phase)] = INGEST_PHASE.labels(endpoint, phase)
+    child.observe(seconds)
+
+
+def request_elapsed(scope: dict) -> float:
+    """ミドルウェアが記録したリクエスト開始からの経過秒数"""
+    started = scope.get("agentscope_started")
+    return perf_counter() - started if started is not None else 0.0
+
+
+class PrometheusMiddleware:
+    """ルート単位のリクエスト数とレイテンシを記録するASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        scope["agentscope_started"] = started = perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            children = _http_children.get((method, path))
+            if children is None:
+                children = _http_children[(method, path)] = (HTTP_LATENCY.labels(method, path), {})
+            latency, counters = children
+            latency.observe(perf_counter() - started)
+            counter = counters.get(status_code)
+            if counter is None:
+                counter = counters[status_code] = HTTP_REQUESTS.labels(method, path, str(status_code))
+            counter.inc()
+
+
+def instrument_engine(engine: Engine, pool: str = "writer"):
+    """コネクションプールのイベントを計測（pool は writer / reader）"""
+    opened = DB_CONNECTIONS_OPENED.labels(pool)
+    checked_out = DB_POOL_CHECKED_OUT.labels(pool)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        opened.inc()
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """Prometheusテキスト形式で現在の値を出力"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """ワーカー終了時にこのプロセスの livesum ゲージを集計対象から外す"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
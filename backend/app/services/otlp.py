@@ -0,0 +1,248 @@
+"""
+OTLP/HTTP (protobuf) trace decoding
+
+Turns an ExportTraceServiceRequest straight into the trace dicts consumed by
+ingest_traces, skipping the Pydantic request models used by the JSON API.
+GenAI semantic-convention attributes are mapped onto the span's LLM columns.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import os
+
+try:
+    from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+        ExportTraceServiceRequest, ExportTraceServiceResponse
+    )
+    HAS_OTLP = True
+except ImportError:
+    HAS_OTLP = False
+
+# プロジェクトIDを指定するリソース属性（なければ X-Project-ID ヘッダー）
+PROJECT_ATTRIBUTE = os.getenv("OTLP_PROJECT_ATTRIBUTE", "agentscope.project_id")
+
+# リリース（デプロイしたバージョン）として扱うリソース属性
+RELEASE_ATTRIBUTE = "service.version"
+
+# Status.code
+STATUS_CODE_ERROR = 2
+# Span.flags: 親スパンが別プロセス（リモート）かどうかのビット
+_FLAGS_HAS_IS_REMOTE = 0x100
+_FLAGS_IS_REMOTE = 0x200
+
+# GenAI セマンティック規約の属性 -> スパンの列（同じ列に複数あるときは先に書いたものが優先）
+_MAPPED_ATTRIBUTES = {
+    "gen_ai.response.model": ("model", 0),
+    "gen_ai.request.model": ("model", 1),
+    "gen_ai.usage.input_tokens": ("input_tokens", 0),
+    "gen_ai.usage.prompt_tokens": ("input_tokens", 1),
+    "gen_ai.usage.output_tokens": ("output_tokens", 0),
+    "gen_ai.usage.completion_tokens": ("output_tokens", 1),
+    # 規約にコストはないので、送られてくればそれを使い、なければ料金表から計算する
+    "agentscope.cost_usd": ("cost_usd", 0),
+    "gen_ai.usage.cost": ("cost_usd", 1),
+}
+
+# gen_ai.operation.name -> span_type（それ以外で gen_ai.* を持つスパンは llm）
+_OPERATION_SPAN_TYPES = {
+    "execute_tool": "tool",
+    "invoke_agent": "agent",
+    "create_agent": "agent",
+}
+
+# モデル別料金（USD / 1Kトークン、入力・出力）。バージョン付きのモデル名は最長一致で引く
+MODEL_PRICING = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "claude-3-opus": (0.015, 0.075),
+    "claude-3-5-sonnet": (0.003, 0.015),
+    "claude-3-haiku": (0.00025, 0.00125),
+}
+_PRICING_PREFIXES = sorted(MODEL_PRICING, key=len, reverse=True)
+
+_UTC = timezone.utc
+
+
+def _from_unix_nano(value: int) -> datetime:
+    # float 経由でもマイクロ秒（DBの精度）までは保たれ、timedelta の加算より速い
+    return datetime.fromtimestamp(value / 1e9, _UTC)
+
+
+def _any_value(value) -> Any:
+    """AnyValue を Python の値に変換"""
+    kind = value.WhichOneof("value")
+    if kind == "string_value":
+        return value.string_value
+    if kind is None:
+        return None
+    if kind == "array_value":
+        return [_any_value(v) for v in value.array_value.values]
+    if kind == "kvlist_value":
+        return {kv.key: _any_value(kv.value) for kv in value.kvlist_value.values}
+    if kind == "bytes_value":
+        return value.bytes_value.hex()
+    return getattr(value, kind)
+
+
+def _attributes(key_values) -> Dict[str, Any]:
+    return {kv.key: _any_value(kv.value) for kv in key_values}
+
+
+def estimate_cost(model: Optional[str], input_tokens: Optional[int], output_tokens: Optional[int]) -> Optional[float]:
+    """料金表からコストを見積もる（未知のモデルは None）"""
+    if not model or not (input_tokens or output_tokens):
+        return None
+    for prefix in _PRICING_PREFIXES:
+        if model.startswith(prefix):
+            input_price, output_price = MODEL_PRICING[prefix]
+            return round((input_tokens or 0) / 1000 * input_price + (output_tokens or 0) / 1000 * output_price, 6)
+    return None
+
+
+def _convert_span(span) -> Tuple[Dict[str, Any], bool]:
+    """OTLP Span を ingest 用の辞書に変換し、(辞書, このプロセスでのルートか) を返す"""
+    # 属性は1回だけ走査し、GenAI の属性は列へ、それ以外は input_data に残す
+    mapped: Dict[str, Tuple[int, Any]] = {}
+    extra: Dict[str, Any] = {}
+    for kv in span.attributes:
+        key = kv.key
+        value = _any_value(kv.value)
+        target = _MAPPED_ATTRIBUTES.get(key)
+        if target is None:
+            extra[key] = value
+        elif value is not None:
+            column, priority = target
+            current = mapped.get(column)
+            if current is None or priority < current[0]:
+                mapped[column] = (priority, value)
+
+    model = mapped["model"][1] if "model" in mapped else None
+    input_tokens = int(mapped["input_tokens"][1]) if "input_tokens" in mapped else None
+    output_tokens = int(mapped["output_tokens"][1]) if "output_tokens" in mapped else None
+    if "cost_usd" in mapped:
+        cost_usd = float(mapped["cost_usd"][1])
+    else:
+        cost_usd = estimate_cost(model, input_tokens, output_tokens)
+
+    operation = extra.get("gen_ai.operation.name")
+    if operation in _OPERATION_SPAN_TYPES:
+        span_type = _OPERATION_SPAN_TYPES[operation]
+    elif model is not None or operation is not None or "gen_ai.system" in extra:
+        span_type = "llm"
+    else:
+        span_type = "function"
+
+    status = "success"
+    error_message = None
+    span_status = span.status
+    if span_status.code == STATUS_CODE_ERROR:
+        status = "error"
+        error_message = span_status.message or None
+        if error_message is None:
+            for event in span.events:
+                if event.name == "exception":
+                    error_message = _attributes(event.attributes).get("exception.message")
+                    break
+
+    start_ns = span.start_time_unix_nano
+    end_ns = span.end_time_unix_nano
+    parent_span_id = span.parent_span_id.hex() or None
+    flags = span.flags
+    is_root = parent_span_id is None or (
+        flags & _FLAGS_HAS_IS_REMOTE != 0 and flags & _FLAGS_IS_REMOTE != 0
+    )
+
+    return {
+        "id": span.span_id.hex(),
+        "parent_span_id": parent_span_id,
+        "name": span.name,
+        "span_type": span_type,
+        "start_time": _from_unix_nano(start_ns),
+        "end_time": _from_unix_nano(end_ns) if end_ns else None,
+        "duration_ms": round((end_ns - start_ns) / 1_000_000, 3) if end_ns else None,
+        "model": model,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": cost_usd,
+        "input_data": {"attributes": extra} if extra else None,
+        "output_data": None,
+        "status": status,
+        "error_message": error_message,
+    }, is_root
+
+
+def decode_export_request(body: bytes, default_project_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    ExportTraceServiceRequest を ingest_traces 用のトレース辞書のリストに変換
+
+    OTLPのエクスポーターは終わったスパンから順に送るので、1リクエストに含まれるのは
+    トレースの一部のことがある。ルートスパンを含むトレースは確定（success/error）、
+    含まないものは running のチャンクとして扱い、ingest 側で既存のトレースに追記する。
+    リモートの親を持つスパン（traceparent で呼ばれた下流サービスのルート）しかないトレースは、
+    remote_parent_span_id 付きの下流チャンクにする。
+
+    Raises:
+        ValueError: protobuf として解釈できない、またはプロジェクトIDが決まらない
+    """
+    request = ExportTraceServiceRequest()
+    try:
+        request.ParseFromString(body)
+    except Exception as e:
+        raise ValueError(f"Invalid OTLP payload: {e}") from e
+
+    traces: Dict[str, Dict[str, Any]] = {}
+    roots: Dict[str, Dict[str, Any]] = {}
+    for resource_spans in request.resource_spans:
+        resource = _attributes(resource_spans.resource.attributes)
+        project_id = resource.pop(PROJECT_ATTRIBUTE, None) or default_project_id
+        if not project_id:
+            raise ValueError(f"Project ID missing (resource attribute {PROJECT_ATTRIBUTE} or X-Project-ID header)")
+        for scope_spans in resource_spans.scope_spans:
+            for span in scope_spans.spans:
+                trace_id = span.trace_id.hex()
+                span_data, is_root = _convert_span(span)
+                trace = traces.get(trace_id)
+                if trace is None:
+                    trace = traces[trace_id] = {
+                        "id": trace_id,
+                        "project_id": project_id,
+                        "name": span_data["name"],
+                        "start_time": span_data["start_time"],
+                        "end_time": None,
+                        "duration_ms": None,
+                        "status": "running",
+                        "error_message": None,
+                        "release": resource.get(RELEASE_ATTRIBUTE),
+                        "extra_metadata": resource or None,
+                        "spans": [],
+                    }
+                elif span_data["start_time"] < trace["start_time"]:
+                    trace["start_time"] = span_data["start_time"]
+                trace["spans"].append(span_data)
+                # 親のないルートを、リモートの親を持つルートより優先する（コレクターが複数サービスのスパンをまとめて送る場合）
+                if is_root:
+                    current = roots.get(trace_id)
+                    if current is None or (current["parent_span_id"] is not None and span_data["parent_span_id"] is None):
+                        roots[trace_id] = span_data
+
+    # ルートスパンの値をトレースの値にする
+    for trace_id, root in roots.items():
+        trace = traces[trace_id]
+        trace.update(
+            name=root["name"],
+            start_time=root["start_time"],
+            end_time=root["end_time"],
+            duration_ms=root["duration_ms"],
+            status=root["status"],
+            error_message=root["error_message"],
+        )
+        if root["parent_span_id"] is not None:
+            trace["remote_parent_span_id"] = root["parent_span_id"]
+    return list(traces.values())
+
+
+def export_response() -> bytes:
+    """成功時のレスポンスボディ（部分的な拒否はしない）"""
+    return ExportTraceServiceResponse().SerializeToString()
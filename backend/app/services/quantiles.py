@@ -0,0 +1,95 @@
+"""
+Mergeable quantile sketch with bounded relative error (DDSketch-style log buckets)
+"""
+from typing import Dict, Iterable, Optional
+import math
+
+# 相対誤差 1% 程度になる対数バケットの底
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+
+class LogHistogram:
+    """
+    対数バケットのヒストグラム
+
+    値 v は floor(log(v) / log(gamma)) のバケットに入り、
+    分位点はバケット代表値として相対誤差 relative_accuracy 以内で返る。
+    同じ精度のスケッチ同士は足し合わせ（merge）できる。
+    """
+
+    __slots__ = ("gamma", "_log_gamma", "buckets", "zero_count", "count", "total")
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float, count: int = 1):
+        """値を追加（0以下は0として数える）"""
+        self.count += count
+        self.total += value * count
+        if value <= 0:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def merge(self, other: "LogHistogram"):
+        """他のスケッチを足し込む"""
+        self.count += other.count
+        self.total += other.total
+        self.zero_count += other.zero_count
+        buckets = self.buckets
+        for index, count in other.buckets.items():
+            buckets[index] = buckets.get(index, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """分位点（0〜1）を返す。空なら None"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # バケット (gamma^(i-1), gamma^i] の代表値
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def mean(self) -> Optional[float]:
+        """平均値"""
+        return self.total / self.count if self.count else None
+
+    def items(self) -> Iterable:
+        """(代表値, 件数) を昇順に返す（ゼロバケットを含む）"""
+        if self.zero_count:
+            yield 0.0, self.zero_count
+        for index in sorted(self.buckets):
+            yield 2 * self.gamma ** index / (self.gamma + 1), self.buckets[index]
+
+    def to_dict(self) -> Dict:
+        """JSON保存用の辞書に変換"""
+        return {
+            "gamma": self.gamma,
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "total": self.total,
+            "buckets": {str(k): v for k, v in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LogHistogram":
+        """to_dict の逆変換"""
+        sketch = cls()
+        sketch.gamma = data["gamma"]
+        sketch._log_gamma = math.log(sketch.gamma)
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.total = data["total"]
+        sketch.buckets = {int(k): v for k, v in data["buckets"].items()}
+        return sketch
@@ -0,0 +1,382 @@
+"""
+Release-to-release regression comparison
+
+Every finalized trace that carries a release tag is folded into one
+ReleaseStats row per (project, release, trace name): counts, sums and sums of
+squares of tokens and cost, and a log-bucket duration histogram. Ingest builds
+the per-row deltas for each committed request and a per-worker
+ReleaseStatsBuffer merges them into the rows every few seconds, outside the
+ingest transaction. Comparing two releases reads those rows only, so the check
+is cheap enough to run on every deploy regardless of traffic.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import math
+import os
+
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from app.db.database import engine
+from app.models.trace import ReleaseStats, Trace
+from app.services.flush_buffer import FlushBuffer
+from app.services.quantiles import LogHistogram
+
+# 溜めた集計をDBに書く間隔（秒）
+RELEASE_STATS_FLUSH_SECONDS = float(os.getenv("RELEASE_STATS_FLUSH_SECONDS", "5"))
+
+_FINAL_STATUSES = ("success", "error")
+
+_INSERT = text("""
+    INSERT INTO release_stats (project_id, release, trace_name, version, trace_count, error_count,
+                               tokens_sum, tokens_sumsq, cost_sum, cost_sumsq, duration_sketch,
+                               first_seen, last_seen)
+    VALUES (:project_id, :release, :trace_name, 1, :trace_count, :error_count,
+            :tokens_sum, :tokens_sumsq, :cost_sum, :cost_sumsq, :duration_sketch,
+            :first_seen, :last_seen)
+    ON CONFLICT (project_id, release, trace_name) DO NOTHING
+""")
+
+_UPDATE = text("""
+    UPDATE release_stats SET version = version + 1, trace_count = :trace_count, error_count = :error_count,
+        tokens_sum = :tokens_sum, tokens_sumsq = :tokens_sumsq, cost_sum = :cost_sum, cost_sumsq = :cost_sumsq,
+        duration_sketch = :duration_sketch, first_seen = :first_seen, last_seen = :last_seen
+    WHERE project_id = :project_id AND release = :release AND trace_name = :trace_name AND version = :version
+""")
+
+
+class Stats:
+    """1つのリリース（とトレース名）の集計。行の読み書きと比較の両方で使う"""
+
+    __slots__ = ("trace_count", "error_count", "tokens_sum", "tokens_sumsq",
+                 "cost_sum", "cost_sumsq", "duration", "first_seen", "last_seen")
+
+    def __init__(self):
+        self.trace_count = 0
+        self.error_count = 0
+        self.tokens_sum = 0.0
+        self.tokens_sumsq = 0.0
+        self.cost_sum = 0.0
+        self.cost_sumsq = 0.0
+        self.duration = LogHistogram()
+        self.first_seen: Optional[datetime] = None
+        self.last_seen: Optional[datetime] = None
+
+    def add(self, trace: Trace):
+        tokens = float(trace.total_tokens or 0)
+        cost = trace.total_cost_usd or 0.0
+        self.trace_count += 1
+        if trace.status == "error":
+            self.error_count += 1
+        self.tokens_sum += tokens
+        self.tokens_sumsq += tokens * tokens
+        self.cost_sum += cost
+        self.cost_sumsq += cost * cost
+        if trace.duration_ms is not None:
+            self.duration.add(trace.duration_ms)
+        self._seen(trace.start_time, trace.start_time)
+
+    def merge(self, other: "Stats") -> "Stats":
+        """other を足し込む（self を更新して返す）"""
+        self.trace_count += other.trace_count
+        self.error_count += other.error_count
+        self.tokens_sum += other.tokens_sum
+        self.tokens_sumsq += other.tokens_sumsq
+        self.cost_sum += other.cost_sum
+        self.cost_sumsq += other.cost_sumsq
+        self.duration.merge(other.duration)
+        self._seen(other.first_seen, other.last_seen)
+        return self
+
+    def _seen(self, first: Optional[datetime], last: Optional[datetime]):
+        if first is not None and (self.first_seen is None or first < self.first_seen):
+            self.first_seen = first
+        if last is not None and (self.last_seen is None or last > self.last_seen):
+            self.last_seen = last
+
+    @property
+    def error_rate(self) -> Optional[float]:
+        return self.error_count / self.trace_count if self.trace_count else None
+
+    def mean_and_variance(self, metric: str) -> Tuple[Optional[float], float]:
+        """トークン・コストの1トレースあたりの平均と不偏分散"""
+        if metric == "tokens":
+            total, sumsq = self.tokens_sum, self.tokens_sumsq
+        else:
+            total, sumsq = self.cost_sum, self.cost_sumsq
+        n = self.trace_count
+        if n == 0:
+            return None, 0.0
+        mean = total / n
+        # 和と二乗和からの計算は桁落ちで僅かに負になることがある
+        variance = max(sumsq - n * mean * mean, 0.0) / (n - 1) if n > 1 else 0.0
+        return mean, variance
+
+    def params(self) -> Dict:
+        return {
+            "trace_count": self.trace_count,
+            "error_count": self.error_count,
+            "tokens_sum": self.tokens_sum,
+            "tokens_sumsq": self.tokens_sumsq,
+            "cost_sum": self.cost_sum,
+            "cost_sumsq": self.cost_sumsq,
+            "duration_sketch": json.dumps(self.duration.to_dict(), separators=(",", ":")),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+        }
+
+    @classmethod
+    def from_row(cls, row) -> "Stats":
+        stats = cls()
+        stats.trace_count = row.trace_count
+        stats.error_count = row.error_count
+        stats.tokens_sum = row.tokens_sum
+        stats.tokens_sumsq = row.tokens_sumsq
+        stats.cost_sum = row.cost_sum
+        stats.cost_sumsq = row.cost_sumsq
+        sketch = json.loads(row.duration_sketch)
+        if sketch:
+            stats.duration = LogHistogram.from_dict(sketch)
+        stats.first_seen = row.first_seen
+        stats.last_seen = row.last_seen
+        return stats
+
+
+# ORM オブジェクトにせず列だけを読む（読み直したときに古い値が残らない）
+_COLUMNS = (
+    ReleaseStats.project_id, ReleaseStats.release, ReleaseStats.trace_name, ReleaseStats.version,
+    ReleaseStats.trace_count, ReleaseStats.error_count, ReleaseStats.tokens_sum, ReleaseStats.tokens_sumsq,
+    ReleaseStats.cost_sum, ReleaseStats.cost_sumsq, ReleaseStats.duration_sketch,
+    ReleaseStats.first_seen, ReleaseStats.last_seen,
+)
+
+StatsKey = Tuple[str, str, str]  # (project_id, release, trace_name)
+
+
+def build_release_stats(traces: Iterable[Trace]) -> Dict[StatsKey, Stats]:
+    """
+    確定したトレースから、1リクエスト分の行ごとの増分を作る（DBには触らない）
+
+    release のないトレースは数えない。traces は確定した時点で1回だけ渡す。確定後に下流サービスから
+    届いたスパンの増分は、比較の分布をほとんど変えないので足さない。
+    """
+    deltas: Dict[StatsKey, Stats] = {}
+    for trace in traces:
+        if trace.release and trace.status in _FINAL_STATUSES:
+            key = (trace.project_id, trace.release, trace.name)
+            stats = deltas.get(key)
+            if stats is None:
+                stats = deltas[key] = Stats()
+            stats.add(trace)
+    return deltas
+
+
+class ReleaseStatsBuffer(FlushBuffer):
+    """
+    取り込みで作った増分をワーカー内に溜め、RELEASE_STATS_FLUSH_SECONDS ごとに書き戻す
+
+    1つのリリースの行は、そのリリースを取り込む全ワーカーが更新する。取り込みのトランザクション内で
+    書くと行ロックで取り込みが直列になり、競合が続くとバッチごと失敗するので、コミット後に溜める。
+    """
+
+    def __init__(self, db_engine):
+        super().__init__("release_stats", db_engine, RELEASE_STATS_FLUSH_SECONDS)
+
+    def write(self, session: Session, pending: Dict[StatsKey, Stats]) -> Dict[StatsKey, Stats]:
+        return _write(session, pending)
+
+
+def _write(session: Session, batch: Dict[StatsKey, Stats]) -> Dict[StatsKey, Stats]:
+    """集計を行にマージして書き、競合して書けなかったものを返す"""
+    projects = {key[0] for key in batch}
+    releases = {key[1] for key in batch}
+    existing = {
+        (row.project_id, row.release, row.trace_name): row
+        for row in session.exec(
+            select(*_COLUMNS).where(ReleaseStats.project_id.in_(projects), ReleaseStats.release.in_(releases))
+        )
+    }
+    conflicts: Dict[StatsKey, Stats] = {}
+    for key, stats in batch.items():
+        row = existing.get(key)
+        if row is None:
+            merged = stats
+            statement = _INSERT
+            params = merged.params()
+        else:
+            merged = Stats.from_row(row).merge(stats)
+            statement = _UPDATE
+            params = merged.params()
+            params["version"] = row.version
+        params.update(project_id=key[0], release=key[1], trace_name=key[2])
+        if session.execute(statement, params).rowcount != 1:
+            conflicts[key] = stats
+    return conflicts
+
+
+def list_releases(session: Session, project_id: str) -> List[Tuple[str, Stats]]:
+    """プロジェクトのリリースごとの集計（最後に見た時刻の新しい順）"""
+    by_release: Dict[str, Stats] = {}
+    for row in session.exec(select(*_COLUMNS).where(ReleaseStats.project_id == project_id)):
+        stats = by_release.get(row.release)
+        if stats is None:
+            by_release[row.release] = Stats.from_row(row)
+        else:
+            stats.merge(Stats.from_row(row))
+    return sorted(by_release.items(), key=lambda item: item[1].last_seen or datetime.min, reverse=True)
+
+
+def _load(session: Session, project_id: str, release: str, trace_name: Optional[str]) -> Dict[str, Stats]:
+    query = select(*_COLUMNS).where(ReleaseStats.project_id == project_id, ReleaseStats.release == release)
+    if trace_name is not None:
+        query = query.where(ReleaseStats.trace_name == trace_name)
+    return {row.trace_name: Stats.from_row(row) for row in session.exec(query)}
+
+
+# ===== 検定（いずれも片側: 候補リリースのほうが悪い） =====
+
+def _upper_p(z: float) -> float:
+    """標準正規分布で z 以上になる確率"""
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def mann_whitney_p(baseline: LogHistogram, candidate: LogHistogram) -> Optional[float]:
+    """
+    所要時間が候補リリースで長くなったかの Mann-Whitney U 検定（正規近似・同順位補正あり）
+
+    生の値の代わりにヒストグラムのバケットを同順位として扱う。バケット幅は相対1%程度なので、
+    それより小さい差は同順位になり検出力が少し落ちるだけで、偽陽性は増えない。
+    """
+    n_a, n_b = baseline.count, candidate.count
+    if n_a == 0 or n_b == 0:
+        return None
+    # 両方のスケッチを同じバケット（ゼロバケットを先頭）で並べる
+    keys = sorted(set(baseline.buckets) | set(candidate.buckets))
+    bins = [(baseline.zero_count, candidate.zero_count)]
+    bins += [(baseline.buckets.get(key, 0), candidate.buckets.get(key, 0)) for key in keys]
+    u = 0.0
+    below = 0
+    ties = 0.0
+    for a, b in bins:
+        # 候補の各値について、それより小さいベースラインの値の数（同順位は 1/2）
+        u += b * (below + a / 2)
+        below += a
+        t = a + b
+        ties += t * t * t - t
+    n = n_a + n_b
+    variance = n_a * n_b / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    return _upper_p((u - n_a * n_b / 2) / math.sqrt(variance))
+
+
+def welch_p(mean_a: float, var_a: float, n_a: int, mean_b: float, var_b: float, n_b: int) -> float:
+    """1トレースあたりの平均が候補リリースで大きくなったかの Welch 検定（正規近似）"""
+    se = math.sqrt(var_a / n_a + var_b / n_b)
+    if se == 0:
+        return 0.0 if mean_b > mean_a else 1.0
+    return _upper_p((mean_b - mean_a) / se)
+
+
+def proportion_p(errors_a: int, n_a: int, errors_b: int, n_b: int) -> float:
+    """エラー率が候補リリースで上がったかの2標本比率検定"""
+    pooled = (errors_a + errors_b) / (n_a + n_b)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / n_a + 1 / n_b))
+    if se == 0:
+        return 1.0
+    return _upper_p((errors_b / n_b - errors_a / n_a) / se)
+
+
+def _relative_change(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    if before is None or after is None or before == 0:
+        return None
+    return after / before - 1
+
+
+def _compare_metrics(baseline: Stats, candidate: Stats, min_count: int) -> List[Dict]:
+    """指標ごとの値・変化率・p値（データが足りなければ p値は None）"""
+    enough = baseline.trace_count >= min_count and candidate.trace_count >= min_count
+    results = []
+
+    before, after = baseline.duration.mean(), candidate.duration.mean()
+    results.append({
+        "metric": "duration_ms", "baseline": before, "candidate": after,
+        "change": _relative_change(before, after),
+        "p_value": mann_whitney_p(baseline.duration, candidate.duration) if enough else None,
+    })
+    for metric in ("tokens", "cost_usd"):
+        mean_a, var_a = baseline.mean_and_variance(metric)
+        mean_b, var_b = candidate.mean_and_variance(metric)
+        results.append({
+            "metric": metric, "baseline": mean_a, "candidate": mean_b,
+            "change": _relative_change(mean_a, mean_b),
+            "p_value": welch_p(mean_a, var_a, baseline.trace_count, mean_b, var_b, candidate.trace_count)
+            if enough else None,
+        })
+    before, after = baseline.error_rate, candidate.error_rate
+    results.append({
+        "metric": "error_rate", "baseline": before, "candidate": after,
+        # エラー率は 0 からの悪化もあるので、変化はポイント差で見る
+        "change": after - before if before is not None and after is not None else None,
+        "p_value": proportion_p(baseline.error_count, baseline.trace_count,
+                                candidate.error_count, candidate.trace_count) if enough else None,
+    })
+    return results
+
+
+def compare_releases(
+    session: Session,
+    project_id: str,
+    baseline: str,
+    candidate: str,
+    trace_name: Optional[str] = None,
+    alpha: float = 0.01,
+    min_effect: float = 0.05,
+    min_error_delta: float = 0.01,
+    min_count: int = 30
+) -> List[Dict]:
+    """
+    2つのリリースを全体とトレース名ごとに比べる
+
+    各指標の p値が alpha / (検定の数) 未満（Bonferroni 補正）で、かつ変化が min_effect
+    （所要時間・トークン・コストは相対変化、エラー率は min_error_delta ポイント）以上のときに
+    regression とする。どちらかのトレース数が min_count 未満のグループは検定しない。
+
+    Returns:
+        {"trace_name" (全体は None), "baseline": Stats, "candidate": Stats, "metrics": [...]} のリスト。
+        最初の要素が全体で、残りはトレース名順
+    """
+    before = _load(session, project_id, baseline, trace_name)
+    after = _load(session, project_id, candidate, trace_name)
+    groups: List[Tuple[Optional[str], Stats, Stats]] = []
+    if trace_name is None:
+        overall_before, overall_after = Stats(), Stats()
+        for stats in before.values():
+            overall_before.merge(stats)
+        for stats in after.values():
+            overall_after.merge(stats)
+        groups.append((None, overall_before, overall_after))
+    for name in sorted(before.keys() | after.keys()):
+        groups.append((name, before.get(name) or Stats(), after.get(name) or Stats()))
+
+    comparisons = []
+    tests = 0
+    for name, stats_before, stats_after in groups:
+        metrics = _compare_metrics(stats_before, stats_after, min_count)
+        tests += sum(1 for m in metrics if m["p_value"] is not None)
+        comparisons.append({"trace_name": name, "baseline": stats_before, "candidate": stats_after, "metrics": metrics})
+
+    threshold = alpha / max(tests, 1)
+    for comparison in comparisons:
+        for m in comparison["metrics"]:
+            required = min_error_delta if m["metric"] == "error_rate" else min_effect
+            m["regression"] = (
+                m["p_value"] is not None and m["p_value"] < threshold
+                and m["change"] is not None and m["change"] >= required
+            )
+    return comparisons
+
+
+# ワーカーごとのバッファ（起動・停止は main のライフサイクルで行う）
+release_buffer = ReleaseStatsBuffer(engine)
@@ -0,0 +1,362 @@
+"""
+Cost / token / latency time series backed by pre-aggregated rollups
+
+Finalized traces are added to per-minute and per-hour rollup rows at ingest
+time (an atomic upsert per bucket), so chart queries over long windows read a
+few hundred rollup rows instead of every trace. Windows older than the first
+rollup fall back to grouping the raw trace table. Raw latency points are
+reduced with a streaming min/max envelope followed by LTTB.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import math
+
+from sqlalchemy import DateTime, bindparam, text
+from sqlmodel import Session
+
+from app.db.database import naive_utc
+from app.models.trace import Trace
+from app.services.analytics import HAS_NUMPY, iter_rows
+
+if HAS_NUMPY:
+    import numpy as np
+
+# 事前集計の粒度（秒）。グラフのバケット幅はこのどちらかの倍数になる
+ROLLUP_GRANULARITIES = (60, 3600)
+
+# 確定したトレースのステータス（ロールアップに入るのはこれだけ）
+_FINAL_STATUSES = ("success", "error")
+
+_UPSERT = text("""
+    INSERT INTO trace_rollup (
+        project_id, bucket_seconds, bucket_epoch, trace_count, error_count, total_tokens,
+        total_cost_usd, duration_sum_ms, duration_count, max_duration_ms
+    ) VALUES (
+        :project_id, :bucket_seconds, :bucket_epoch, :trace_count, :error_count, :total_tokens,
+        :total_cost_usd, :duration_sum_ms, :duration_count, :max_duration_ms
+    )
+    ON CONFLICT (project_id, bucket_seconds, bucket_epoch) DO UPDATE SET
+        trace_count = trace_rollup.trace_count + excluded.trace_count,
+        error_count = trace_rollup.error_count + excluded.error_count,
+        total_tokens = trace_rollup.total_tokens + excluded.total_tokens,
+        total_cost_usd = trace_rollup.total_cost_usd + excluded.total_cost_usd,
+        duration_sum_ms = trace_rollup.duration_sum_ms + excluded.duration_sum_ms,
+        duration_count = trace_rollup.duration_count + excluded.duration_count,
+        max_duration_ms = CASE WHEN excluded.max_duration_ms > trace_rollup.max_duration_ms
+                               THEN excluded.max_duration_ms ELSE trace_rollup.max_duration_ms END
+""")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch(value: datetime) -> int:
+    return int((naive_utc(value) - _EPOCH).total_seconds())
+
+
+def _epoch_expr(dialect: str, column: str) -> str:
+    """日時列をUNIX秒（整数）に変換するSQL式"""
+    if dialect == "sqlite":
+        return f"CAST(strftime('%s', {column}) AS INTEGER)"
+    return f"CAST(EXTRACT(EPOCH FROM {column}) AS BIGINT)"
+
+
+class TraceDelta(NamedTuple):
+    """確定済みのトレースに後から届いたチャンク（下流サービスのスパンなど）による集計値の増分"""
+    trace: Trace
+    tokens: int
+    cost_usd: float
+    duration_ms: float  # 所要時間の増分（時間幅が広がった分）
+    duration_count: int  # 所要時間が初めて決まったら 1
+
+
+def snapshot(trace: Trace) -> Tuple[int, float, Optional[float]]:
+    """TraceDelta を作るための、マージ前の集計値"""
+    return trace.total_tokens or 0, trace.total_cost_usd or 0.0, trace.duration_ms
+
+
+def delta(trace: Trace, before: Tuple[int, float, Optional[float]]) -> Optional[TraceDelta]:
+    """マージ前後の差分（変化がなければ None）"""
+    tokens, cost, duration = snapshot(trace)
+    result = TraceDelta(
+        trace,
+        tokens - before[0],
+        cost - before[1],
+        (duration or 0.0) - (before[2] or 0.0),
+        int(before[2] is None and duration is not None),
+    )
+    if not (result.tokens or result.cost_usd or result.duration_ms or result.duration_count):
+        return None
+    return result
+
+
+def record_rollups(session: Session, traces: Iterable[Trace], deltas: Iterable[TraceDelta] = ()):
+    """
+    確定したトレースをロールアップに加算（コミットは呼び出し元）
+
+    同じバケットのトレースはまとめて1行にし、バケットごとに1回の UPSERT で加算する。
+    加算はSQL側で行うので、複数ワーカーからの同時更新でも値が失われない。
+    deltas は確定済みのトレースの増分で、件数は増やさずにトークン・コスト・所要時間だけを足す。
+    """
+    rows: Dict[Tuple[str, int, int], Dict] = {}
+
+    def add(trace: Trace, count: int, errors: int, tokens: int, cost: float,
+            duration_sum: float, duration_count: int):
+        epoch = _epoch(trace.start_time)
+        duration = trace.duration_ms
+        for granularity in ROLLUP_GRANULARITIES:
+            key = (trace.project_id, granularity, epoch - epoch % granularity)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = {
+                    "project_id": key[0], "bucket_seconds": key[1], "bucket_epoch": key[2],
+                    "trace_count": 0, "error_count": 0, "total_tokens": 0, "total_cost_usd": 0.0,
+                    "duration_sum_ms": 0.0, "duration_count": 0, "max_duration_ms": 0.0,
+                }
+            row["trace_count"] += count
+            row["error_count"] += errors
+            row["total_tokens"] += tokens
+            row["total_cost_usd"] += cost
+            row["duration_sum_ms"] += duration_sum
+            row["duration_count"] += duration_count
+            if duration is not None:
+                row["max_duration_ms"] = max(row["max_duration_ms"], duration)
+
+    for trace in traces:
+        if trace.status not in _FINAL_STATUSES or trace.start_time is None:
+            continue
+        duration = trace.duration_ms
+        add(trace, 1, int(trace.status == "error"), trace.total_tokens or 0, trace.total_cost_usd or 0.0,
+            duration or 0.0, int(duration is not None))
+    for item in deltas:
+        if item.trace.start_time is not None:
+            add(item.trace, 0, 0, item.tokens, item.cost_usd, item.duration_ms, item.duration_count)
+    if rows:
+        session.execute(_UPSERT, list(rows.values()))
+
+
+def backfill_rollups(session: Session, project_id: str):
+    """
+    プロジェクトのロールアップを生のトレースから作り直す（コミットは呼び出し元）
+
+    ロールアップ導入前のデータを時系列APIの高速経路に載せたいときに使う。
+    """
+    dialect = session.get_bind().dialect.name
+    epoch = _epoch_expr(dialect, "start_time")
+    session.execute(text("DELETE FROM trace_rollup WHERE project_id = :project_id"), {"project_id": project_id})
+    for granularity in ROLLUP_GRANULARITIES:
+        session.execute(text(f"""
+            INSERT INTO trace_rollup (
+                project_id, bucket_seconds, bucket_epoch, trace_count, error_count, total_tokens,
+                total_cost_usd, duration_sum_ms, duration_count, max_duration_ms
+            )
+            SELECT project_id, :granularity, {epoch} / :granularity * :granularity,
+                   COUNT(*),
+                   SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END),
+                   SUM(COALESCE(total_tokens, 0)),
+                   SUM(COALESCE(total_cost_usd, 0)),
+                   SUM(COALESCE(duration_ms, 0)),
+                   COUNT(duration_ms),
+                   COALESCE(MAX(duration_ms), 0)
+            FROM trace
+            WHERE project_id = :project_id AND status IN ('success', 'error')
+            GROUP BY project_id, {epoch} / :granularity * :granularity
+        """), {"project_id": project_id, "granularity": granularity})
+
+
+def _merge(buckets: Dict[int, List], rows):
+    """(t, count, errors, tokens, cost, duration_sum, duration_count, max) の行をバケットに足し込む"""
+    for t, count, errors, tokens, cost, duration_sum, duration_count, max_duration in rows:
+        bucket = buckets.get(int(t))
+        if bucket is None:
+            buckets[int(t)] = [count, errors or 0, tokens or 0, cost or 0.0,
+                               duration_sum or 0.0, duration_count or 0, max_duration]
+            continue
+        bucket[0] += count
+        bucket[1] += errors or 0
+        bucket[2] += tokens or 0
+        bucket[3] += cost or 0.0
+        bucket[4] += duration_sum or 0.0
+        bucket[5] += duration_count or 0
+        if max_duration is not None and (bucket[6] is None or max_duration > bucket[6]):
+            bucket[6] = max_duration
+
+
+def query_series(
+    session: Session,
+    project_id: str,
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int
+) -> Tuple[List[Dict], str]:
+    """
+    バケットごとの件数・エラー・トークン・コスト・平均/最大所要時間を返す
+
+    バケットはUNIX秒で bucket_seconds の倍数に揃える（ロールアップと境界を合わせるため）。
+    ロールアップがある期間はそれを、ない期間は生のトレースを集計する。
+
+    Returns:
+        (空のバケットも含む点のリスト, データの出どころ "rollup" / "raw" / "mixed")
+    """
+    dialect = session.get_bind().dialect.name
+    granularity = max(g for g in ROLLUP_GRANULARITIES if bucket_seconds % g == 0)
+    lo = _epoch(start) - _epoch(start) % bucket_seconds
+    hi = _epoch(end)
+
+    # ロールアップの最初のバケットは導入前のトレースを含まないので、その次から使う
+    first = session.execute(
+        text("SELECT MIN(bucket_epoch) FROM trace_rollup WHERE project_id = :p AND bucket_seconds = :g"),
+        {"p": project_id, "g": granularity}
+    ).scalar()
+    split = hi if first is None else min(hi, max(lo, first + granularity))
+
+    buckets: Dict[int, List] = {}
+    if split > lo:
+        epoch = _epoch_expr(dialect, "start_time")
+        statement = text(f"""
+            SELECT {epoch} / :b * :b AS t,
+                   COUNT(*),
+                   SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END),
+                   SUM(COALESCE(total_tokens, 0)),
+                   SUM(COALESCE(total_cost_usd, 0)),
+                   SUM(COALESCE(duration_ms, 0)),
+                   COUNT(duration_ms),
+                   MAX(duration_ms)
+            FROM trace
+            WHERE project_id = :p AND status IN ('success', 'error')
+              AND start_time >= :start AND start_time < :end
+            GROUP BY 1
+        """).bindparams(bindparam("start", type_=DateTime), bindparam("end", type_=DateTime))
+        _merge(buckets, session.execute(statement, {
+            "p": project_id, "b": bucket_seconds,
+            "start": _EPOCH + timedelta(seconds=lo), "end": _EPOCH + timedelta(seconds=split),
+        }))
+    if hi > split:
+        _merge(buckets, session.execute(text("""
+            SELECT bucket_epoch / :b * :b AS t,
+                   SUM(trace_count), SUM(error_count), SUM(total_tokens), SUM(total_cost_usd),
+                   SUM(duration_sum_ms), SUM(duration_count), MAX(max_duration_ms)
+            FROM trace_rollup
+            WHERE project_id = :p AND bucket_seconds = :g AND bucket_epoch >= :lo AND bucket_epoch < :hi
+            GROUP BY 1
+        """), {"p": project_id, "b": bucket_seconds, "g": granularity, "lo": split, "hi": hi}))
+
+    source = "raw" if split >= hi else "rollup" if split <= lo else "mixed"
+    points = []
+    for t in range(lo, hi, bucket_seconds):
+        count, errors, tokens, cost, duration_sum, duration_count, max_duration = buckets.get(
+            t, (0, 0, 0, 0.0, 0.0, 0, None)
+        )
+        points.append({
+            "timestamp": _EPOCH + timedelta(seconds=t),
+            "trace_count": int(count),
+            "error_count": int(errors),
+            "total_tokens": int(tokens),
+            "total_cost_usd": round(float(cost), 6),
+            "avg_duration_ms": round(duration_sum / duration_count, 2) if duration_count else None,
+            "max_duration_ms": float(max_duration) if duration_count and max_duration is not None else None,
+        })
+    return points, source
+
+
+def lttb(x: "np.ndarray", y: "np.ndarray", n_out: int) -> "np.ndarray":
+    """
+    Largest-Triangle-Three-Buckets で残す点のインデックスを選ぶ
+
+    x は昇順であること。先頭と末尾の点は必ず残る。
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        # 次のバケットの平均点
+        next_start = int(math.floor((i + 1) * every)) + 1
+        next_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # 今のバケットで、前に選んだ点・次の平均点と作る三角形が最大の点
+        start = int(math.floor(i * every)) + 1
+        stop = int(math.floor((i + 1) * every)) + 1
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+class _Envelope:
+    """
+    細かい時間ビンごとに最小・最大の点だけを残すストリーミング縮約
+
+    全件をメモリに載せずに、スパイクを落とさない候補点を LTTB に渡すための前処理。
+    """
+
+    def __init__(self, start: float, end: float, n_bins: int):
+        self.start = start
+        self.width = max((end - start) / n_bins, 1e-6)
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+
+    def add(self, x: "np.ndarray", y: "np.ndarray"):
+        x = np.concatenate([self.x, x])
+        y = np.concatenate([self.y, y])
+        bins = ((x - self.start) // self.width).astype(np.int64)
+        order = np.lexsort((y, bins))
+        bins = bins[order]
+        first = np.r_[0, np.flatnonzero(np.diff(bins)) + 1]
+        last = np.r_[first[1:] - 1, len(bins) - 1]
+        keep = order[np.unique(np.concatenate([first, last]))]
+        self.x, self.y = x[keep], y[keep]
+
+    def result(self) -> Tuple["np.ndarray", "np.ndarray"]:
+        order = np.argsort(self.x, kind="stable")
+        return self.x[order], self.y[order]
+
+
+def latency_series(
+    session: Session,
+    project_id: str,
+    start: datetime,
+    end: datetime,
+    max_points: int,
+    chunk_size: int = 50_000
+) -> List[Dict]:
+    """
+    生のトレース所要時間を max_points 点程度に間引いた系列
+
+    行はチャンクごとに読み、時間ビンごとの最小・最大点だけを残してから LTTB をかける。
+    """
+    if not HAS_NUMPY:
+        raise RuntimeError("numpy is not installed")
+    start, end = naive_utc(start), naive_utc(end)
+    start64 = np.datetime64(start, "us")
+    envelope = _Envelope(0.0, (end - start).total_seconds(), max_points * 4)
+
+    for rows in iter_rows(
+        session,
+        lambda ph: (
+            f"SELECT start_time, duration_ms FROM trace "
+            f"WHERE project_id = {ph('project_id')} AND duration_ms IS NOT NULL "
+            f"AND status IN ('success', 'error') "
+            f"AND start_time >= {ph('start')} AND start_time < {ph('end')}"
+        ),
+        {"project_id": project_id, "start": start, "end": end},
+        chunk_size
+    ):
+        times, durations = zip(*rows)
+        seconds = (np.asarray(times, dtype="datetime64[us]") - start64) / np.timedelta64(1, "s")
+        envelope.add(seconds, np.asarray(durations, dtype=np.float64))
+
+    x, y = envelope.result()
+    selected = lttb(x, y, max_points)
+    return [
+        {"timestamp": start + timedelta(seconds=float(x[i])), "duration_ms": float(y[i])}
+        for i in selected
+    ]
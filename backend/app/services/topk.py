@@ -0,0 +1,305 @@
+"""
+Top-K operations by duration, call count, errors and cost
+
+Per project and hour, each (dimension, metric) pair keeps a weighted
+Space-Saving summary: at most TOPK_SKETCH_CAPACITY keys, each with an
+overestimated total and the bound on that overestimate. Ingest builds the
+summaries for each committed request and a per-worker SketchBuffer merges them
+into their bucket rows every few seconds, outside the ingest transaction.
+Summaries are merged again across buckets at query time, so a top-K query
+reads (hours in window) small rows regardless of how many spans the window
+contains.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import os
+
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from app.db.database import engine
+from app.models.trace import Span, TopKSketch, Trace
+from app.services.flush_buffer import FlushBuffer
+from app.services.timeseries import TraceDelta, _epoch
+
+# 1つのサマリーが追跡するキーの数。見積もりの誤差は (期間の合計) / この値 以下
+TOPK_SKETCH_CAPACITY = int(os.getenv("TOPK_SKETCH_CAPACITY", "256"))
+
+# サマリーのバケット幅（秒）
+TOPK_BUCKET_SECONDS = 3600
+
+# 溜めたサマリーをDBに書く間隔（秒）
+TOPK_FLUSH_SECONDS = float(os.getenv("TOPK_FLUSH_SECONDS", "5"))
+
+DIMENSIONS = ("span_name", "trace_name", "model")
+METRICS = ("duration", "calls", "errors", "cost")
+
+_FINAL_STATUSES = ("success", "error")
+
+_INSERT = text("""
+    INSERT INTO topk_sketch (project_id, bucket_epoch, dimension, metric, version, total, entries)
+    VALUES (:project_id, :bucket_epoch, :dimension, :metric, 1, :total, :entries)
+    ON CONFLICT (project_id, bucket_epoch, dimension, metric) DO NOTHING
+""")
+
+_UPDATE = text("""
+    UPDATE topk_sketch SET version = version + 1, total = :total, entries = :entries
+    WHERE project_id = :project_id AND bucket_epoch = :bucket_epoch
+      AND dimension = :dimension AND metric = :metric AND version = :version
+""")
+
+
+class SpaceSaving:
+    """
+    重み付き Space-Saving サマリー
+
+    counts[key] は真の合計以上で、counts[key] - errors[key] は真の合計以下。
+    追跡していないキーの合計は min_count 以下（満杯でなければ 0）。
+    """
+
+    __slots__ = ("capacity", "counts", "errors", "total")
+
+    def __init__(self, capacity: int = TOPK_SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+        self.total = 0.0
+
+    @property
+    def min_count(self) -> float:
+        """追跡していないキーの合計の上限"""
+        if len(self.counts) < self.capacity:
+            return 0.0
+        return min(self.counts.values())
+
+    def add(self, key: str, weight: float = 1.0):
+        if weight <= 0:
+            return
+        self.total += weight
+        counts = self.counts
+        if key in counts:
+            counts[key] += weight
+        elif len(counts) < self.capacity:
+            counts[key] = weight
+            self.errors[key] = 0.0
+        else:
+            # 最小のキーを追い出し、その値を新しいキーの誤差として引き継ぐ
+            evicted = min(counts, key=counts.__getitem__)
+            floor = counts.pop(evicted)
+            del self.errors[evicted]
+            counts[key] = floor + weight
+            self.errors[key] = floor
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """
+        2つのサマリーを合わせる（self を更新して返す）
+
+        片方にしかないキーには、もう片方で追跡されていない分の上限（min_count）を足す。
+        合わせた後は大きい順に capacity 件だけ残す。
+        """
+        floor_self, floor_other = self.min_count, other.min_count
+        counts: Dict[str, float] = {}
+        errors: Dict[str, float] = {}
+        for key in self.counts.keys() | other.counts.keys():
+            if key in self.counts:
+                count, error = self.counts[key], self.errors[key]
+            else:
+                count, error = floor_self, floor_self
+            if key in other.counts:
+                count += other.counts[key]
+                error += other.errors[key]
+            else:
+                count += floor_other
+                error += floor_other
+            counts[key] = count
+            errors[key] = error
+        if len(counts) > self.capacity:
+            keep = sorted(counts, key=counts.__getitem__, reverse=True)[:self.capacity]
+            counts = {key: counts[key] for key in keep}
+            errors = {key: errors[key] for key in keep}
+        self.counts, self.errors = counts, errors
+        self.total += other.total
+        return self
+
+    def top(self, k: int) -> List[Tuple[str, float, float]]:
+        """(キー, 見積もり, 誤差の上限) を見積もりの大きい順に k 件"""
+        keys = sorted(self.counts, key=self.counts.__getitem__, reverse=True)[:k]
+        return [(key, self.counts[key], self.errors[key]) for key in keys]
+
+    def dumps(self) -> str:
+        """{キー: [見積もり, 誤差]} の JSON"""
+        return json.dumps(
+            {key: [count, self.errors[key]] for key, count in self.counts.items()},
+            separators=(",", ":"), ensure_ascii=False
+        )
+
+    @classmethod
+    def loads(cls, entries: str, total: float, capacity: int = TOPK_SKETCH_CAPACITY) -> "SpaceSaving":
+        sketch = cls(capacity)
+        for key, (count, error) in json.loads(entries).items():
+            sketch.counts[key] = count
+            sketch.errors[key] = error
+        sketch.total = total
+        if len(sketch.counts) > capacity:
+            # 容量を小さくした後の古い行は、大きい順に切り詰める
+            sketch.merge(cls(capacity))
+        return sketch
+
+
+SketchKey = Tuple[str, int, str, str]  # (project_id, bucket_epoch, dimension, metric)
+
+
+class _Batch:
+    """1リクエスト分のサマリー（バケットの計算は時ごとに1回だけ）"""
+
+    __slots__ = ("sketches", "_buckets")
+
+    def __init__(self):
+        self.sketches: Dict[SketchKey, SpaceSaving] = {}
+        self._buckets: Dict[datetime, int] = {}
+
+    def observe(
+        self,
+        project_id: str,
+        started: Optional[datetime],
+        dimension: str,
+        key: Optional[str],
+        status: Optional[str],
+        duration_ms: Optional[float],
+        cost_usd: Optional[float],
+        calls: float = 1.0
+    ):
+        """1件の実行を4つの指標のサマリーに加える（calls=0 で増分だけを足す）"""
+        if not key or started is None:
+            return
+        hour = started.replace(minute=0, second=0, microsecond=0)
+        bucket = self._buckets.get(hour)
+        if bucket is None:
+            bucket = self._buckets[hour] = _epoch(hour)
+        for metric, weight in (
+            ("calls", calls),
+            ("errors", calls if status == "error" else 0.0),
+            ("duration", duration_ms or 0.0),
+            ("cost", cost_usd or 0.0),
+        ):
+            if weight > 0:
+                sketch_key = (project_id, bucket, dimension, metric)
+                sketch = self.sketches.get(sketch_key)
+                if sketch is None:
+                    sketch = self.sketches[sketch_key] = SpaceSaving()
+                sketch.add(key, weight)
+
+
+def build_sketches(
+    traces: Iterable[Trace],
+    spans: Iterable[Tuple[str, Sequence[Span]]],
+    deltas: Iterable[TraceDelta] = ()
+) -> Dict[SketchKey, SpaceSaving]:
+    """
+    確定したトレースと新しく保存するスパンから、1リクエスト分のサマリーを作る（DBには触らない）
+
+    traces は確定した時点で1回だけ、spans は（project_id, 新規スパン）で渡す。deltas は確定済みの
+    トレースに後から加わった所要時間とコストで、呼び出し数は増やさない（減る方向の増分は捨てる）。
+    """
+    batch = _Batch()
+    for trace in traces:
+        if trace.status in _FINAL_STATUSES:
+            batch.observe(trace.project_id, trace.start_time, "trace_name", trace.name,
+                          trace.status, trace.duration_ms, trace.total_cost_usd)
+    for item in deltas:
+        trace = item.trace
+        batch.observe(trace.project_id, trace.start_time, "trace_name", trace.name,
+                      None, item.duration_ms, item.cost_usd, calls=0.0)
+    for project_id, new_spans in spans:
+        for span in new_spans:
+            batch.observe(project_id, span.start_time, "span_name", span.name,
+                          span.status, span.duration_ms, span.cost_usd)
+            if span.model:
+                batch.observe(project_id, span.start_time, "model", span.model,
+                              span.status, span.duration_ms, span.cost_usd)
+    return batch.sketches
+
+
+class SketchBuffer(FlushBuffer):
+    """
+    取り込みで作ったサマリーをワーカー内に溜め、TOPK_FLUSH_SECONDS ごとに書き戻す
+
+    サマリーの行は全ワーカーが更新する集中箇所なので、取り込みのたびに書くとワーカー同士が
+    行を取り合い、競合が続くと取り込みまで失敗する。コミット済みのリクエストの分だけを溜める。
+    """
+
+    def __init__(self, db_engine):
+        super().__init__("topk", db_engine, TOPK_FLUSH_SECONDS)
+
+    def write(self, session: Session, pending: Dict[SketchKey, SpaceSaving]) -> Dict[SketchKey, SpaceSaving]:
+        return _write(session, pending)
+
+
+def _write(session: Session, sketches: Dict[SketchKey, SpaceSaving]) -> Dict[SketchKey, SpaceSaving]:
+    """サマリーを行にマージして書き、競合して書けなかったものを返す"""
+    projects = {key[0] for key in sketches}
+    buckets = {key[1] for key in sketches}
+    existing = {
+        (row.project_id, row.bucket_epoch, row.dimension, row.metric): row
+        for row in session.exec(
+            select(TopKSketch.project_id, TopKSketch.bucket_epoch, TopKSketch.dimension,
+                   TopKSketch.metric, TopKSketch.version, TopKSketch.total, TopKSketch.entries)
+            .where(TopKSketch.project_id.in_(projects), TopKSketch.bucket_epoch.in_(buckets))
+        )
+    }
+    conflicts: Dict[SketchKey, SpaceSaving] = {}
+    for key, sketch in sketches.items():
+        params = {"project_id": key[0], "bucket_epoch": key[1], "dimension": key[2], "metric": key[3]}
+        row = existing.get(key)
+        if row is None:
+            merged = sketch
+            statement = _INSERT
+        else:
+            merged = SpaceSaving.loads(row.entries, row.total).merge(sketch)
+            statement = _UPDATE
+            params["version"] = row.version
+        params["total"] = merged.total
+        params["entries"] = merged.dumps()
+        if session.execute(statement, params).rowcount != 1:
+            conflicts[key] = sketch
+    return conflicts
+
+
+def query_top(
+    session: Session,
+    project_id: str,
+    dimension: str,
+    metric: str,
+    start: datetime,
+    end: datetime,
+    k: int
+) -> Tuple[SpaceSaving, List[Tuple[str, float, float]]]:
+    """
+    期間に掛かる時バケットのサマリーを合わせて上位 k 件を返す
+
+    期間の端はバケット単位に広がる（start を含む時の頭から、end を含む時の終わりまで）。
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"dimension must be one of {', '.join(DIMENSIONS)}")
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    first = _epoch(start)
+    first -= first % TOPK_BUCKET_SECONDS
+    rows = session.exec(
+        select(TopKSketch.total, TopKSketch.entries).where(
+            TopKSketch.project_id == project_id,
+            TopKSketch.dimension == dimension,
+            TopKSketch.metric == metric,
+            TopKSketch.bucket_epoch >= first,
+            TopKSketch.bucket_epoch <= _epoch(end),
+        )
+    )
+    result = SpaceSaving()
+    for total, entries in rows:
+        result.merge(SpaceSaving.loads(entries, total))
+    return result, result.top(k)
+
+
+# ワーカーごとのバッファ（起動・停止は main のライフサイクルで行う）
+sketch_buffer = SketchBuffer(engine)
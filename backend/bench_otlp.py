@@ -0,0 +1,172 @@
+"""
+CPU cost of the OTLP/HTTP protobuf ingest path versus the JSON batch API
+
+Builds the same traces (demo_generator.build_mock_trace) as a /traces/batch JSON
+body and as an OTLP ExportTraceServiceRequest, then measures process CPU time per
+1k spans for turning each body into ingest_traces input. With --with-ingest the
+decoded traces are also written to a throwaway SQLite database.
+
+Usage:
+    python bench_otlp.py
+    python bench_otlp.py --traces 500 --spans 10 --payload-bytes 1024 --with-ingest
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+from demo_generator import build_mock_trace, PROJECT_ID
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _parse_iso(value: str) -> int:
+    """ISO 8601 文字列を UNIX ナノ秒に"""
+    delta = datetime.fromisoformat(value) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+
+
+def build_traces(count: int, spans: int, payload_bytes: int, seed: int) -> List[Dict]:
+    """最初のスパンをルート、残りをその子にした同じ形のトレースを作る"""
+    rng = random.Random(seed)
+    traces = []
+    for _ in range(count):
+        trace = build_mock_trace(rng, span_count=spans, payload_bytes=payload_bytes or None)
+        root_id = trace["spans"][0]["id"]
+        for span in trace["spans"][1:]:
+            span["parent_span_id"] = root_id
+        traces.append(trace)
+    return traces
+
+
+def to_json_body(traces: List[Dict]) -> bytes:
+    return json.dumps(traces).encode()
+
+
+def to_otlp_body(traces: List[Dict]) -> bytes:
+    """同じトレースを GenAI セマンティック規約の属性付き OTLP リクエストにする"""
+    from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+    from opentelemetry.proto.common.v1.common_pb2 import KeyValue
+
+    def kv(key, value) -> KeyValue:
+        attribute = KeyValue(key=key)
+        if isinstance(value, int):
+            attribute.value.int_value = value
+        else:
+            attribute.value.string_value = str(value)
+        return attribute
+
+    request = ExportTraceServiceRequest()
+    resource_spans = request.resource_spans.add()
+    resource_spans.resource.attributes.extend([kv("service.name", "bench"), kv("agentscope.project_id", PROJECT_ID)])
+    scope_spans = resource_spans.scope_spans.add()
+    for trace in traces:
+        trace_id = bytes.fromhex(trace["id"].replace("-", ""))
+        for span_data in trace["spans"]:
+            span = scope_spans.spans.add()
+            span.trace_id = trace_id
+            span.span_id = bytes.fromhex(span_data["id"].replace("-", ""))[:8]
+            if span_data.get("parent_span_id"):
+                span.parent_span_id = bytes.fromhex(span_data["parent_span_id"].replace("-", ""))[:8]
+            span.name = span_data["name"]
+            span.start_time_unix_nano = _parse_iso(span_data["start_time"])
+            span.end_time_unix_nano = _parse_iso(span_data["end_time"])
+            attributes = [
+                kv("agentscope.input", json.dumps(span_data["input_data"])),
+                kv("agentscope.output", json.dumps(span_data["output_data"])),
+            ]
+            if span_data["span_type"] == "llm":
+                attributes += [
+                    kv("gen_ai.operation.name", "chat"),
+                    kv("gen_ai.request.model", span_data["model"]),
+                    kv("gen_ai.usage.input_tokens", span_data["input_tokens"]),
+                    kv("gen_ai.usage.output_tokens", span_data["output_tokens"]),
+                ]
+            elif span_data["span_type"] == "tool":
+                attributes.append(kv("gen_ai.operation.name", "execute_tool"))
+            span.attributes.extend(attributes)
+            if trace["status"] == "error" and not span_data.get("parent_span_id"):
+                span.status.code = 2
+                span.status.message = trace.get("error_message") or ""
+    return request.SerializeToString()
+
+
+def decode_json(body: bytes) -> List[Dict]:
+    """/traces/batch と同じ処理（JSONパース → Pydantic検証 → 辞書化）"""
+    from app.api.traces import TraceCreate
+    return [TraceCreate.model_validate(t).model_dump() for t in json.loads(body)]
+
+
+def decode_otlp(body: bytes) -> List[Dict]:
+    from app.services.otlp import decode_export_request
+    return decode_export_request(body)
+
+
+def measure(fn: Callable[[], object], repeat: int) -> float:
+    """最小の CPU 時間（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        best = min(best, time.process_time() - started)
+    return best
+
+
+def measure_ingest(decode: Callable[[bytes], List[Dict]], body: bytes) -> float:
+    """デコードから ingest_traces のコミットまでの CPU 時間（新しいDBに1回だけ書く）"""
+    from sqlmodel import Session, SQLModel, create_engine
+    from app.db.search import create_search_index
+    from app.services.ingest import ingest_traces
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        SQLModel.metadata.create_all(engine)
+        create_search_index(engine)
+        with Session(engine) as session:
+            started = time.process_time()
+            ingest_traces(session, decode(body), endpoint="bench")
+            elapsed = time.process_time() - started
+        engine.dispose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OTLP vs JSON ingest CPU benchmark")
+    parser.add_argument("--traces", type=int, default=200)
+    parser.add_argument("--spans", type=int, default=5, help="トレースあたりのスパン数")
+    parser.add_argument("--payload-bytes", type=int, default=0, help="スパンあたりの入出力ペイロードのサイズ")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数（最小値を使う）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--with-ingest", action="store_true", help="SQLiteへの書き込みまで含めて計測する")
+    args = parser.parse_args()
+
+    traces = build_traces(args.traces, args.spans, args.payload_bytes, args.seed)
+    span_total = args.traces * args.spans
+    bodies: Dict[str, Tuple[bytes, Callable[[bytes], List[Dict]]]] = {
+        "json": (to_json_body(traces), decode_json),
+        "otlp": (to_otlp_body(traces), decode_otlp),
+    }
+
+    print(f"{args.traces} traces x {args.spans} spans", file=sys.stderr)
+    results = {}
+    for name, (body, decode) in bodies.items():
+        # 結果の形がそろっていること（比較の前提）
+        decoded = decode(body)
+        assert sum(len(t["spans"]) for t in decoded) == span_total, name
+        cpu = measure(lambda: decode(body), args.repeat)
+        results[name] = cpu
+        line = f"  {name:5s} body {len(body) / 1024:8.1f} KiB  decode {cpu / span_total * 1e6:8.1f} ms/1k spans"
+        if args.with_ingest:
+            total = measure_ingest(decode, body)
+            line += f"  decode+ingest {total / span_total * 1e6:8.1f} ms/1k spans"
+        print(line, file=sys.stderr)
+    print(f"  otlp/json decode CPU ratio: {results['otlp'] / results['json']:.2f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
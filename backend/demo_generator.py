@@ -4,51 +4,73 @@ Demo script to generate traces for AgentScope
 import time
 import random
 import uuid
-from datetime import datetime, timezone
-import requests
+from datetime import datetime, timedelta, timezone
 
 API_URL = "http://localhost:8000/api/v1/traces"
 PROJECT_ID = "default-project"
+API_KEY = "sk_demo_key_12345"
 
-def generate_mock_trace():
-    trace_id = str(uuid.uuid4())
-    names = ["CustomerSupportAI", "TranslationBot", "DataAnalyzer", "RiskAssessor", "AutoCoder"]
-    name = random.choice(names)
+TRACE_NAMES = ["CustomerSupportAI", "TranslationBot", "DataAnalyzer", "RiskAssessor", "AutoCoder"]
+SPAN_TYPES = ["llm", "tool", "function"]
+MODELS = ["gpt-4o", "gpt-4o-mini", "claude-3-sonnet", "gpt-3.5-turbo"]
+
+
+def build_mock_trace(
+    rng: random.Random = random,
+    project_id: str = PROJECT_ID,
+    span_count: int = None,
+    payload_bytes: int = None,
+    start_time: datetime = None
+) -> dict:
+    """
+    モックトレースのペイロードを組み立てる（送信・待機はしない）
+
+    Args:
+        rng: 乱数生成器（シードを固定すれば同じトレース列を再現できる）
+        span_count: スパン数（省略時は2〜5）
+        payload_bytes: 各スパンの入出力ペイロードのおおよそのサイズ（省略時は最小限）
+        start_time: トレース開始時刻（省略時は現在時刻）
+    """
+    # ID も rng から作り、シード固定時に完全に再現できるようにする
+    trace_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    name = rng.choice(TRACE_NAMES)
     
-    start_time = datetime.now(timezone.utc)
-    status = "success" if random.random() > 0.1 else "error"
+    start_time = start_time or datetime.now(timezone.utc)
+    status = "success" if rng.random() > 0.1 else "error"
     error_msg = "Rate limit exceeded" if status == "error" else None
     
     # Generate 2-5 spans
     spans = []
-    num_spans = random.randint(2, 5)
-    total_cost = 0.0
-    total_tokens = 0
+    num_spans = span_count if span_count is not None else rng.randint(2, 5)
+    cursor = start_time
     
     for i in range(num_spans):
-        span_start = datetime.now(timezone.utc)
-        time.sleep(random.uniform(0.1, 0.5))
-        span_end = datetime.now(timezone.utc)
-        
-        duration = int((span_end - span_start).total_seconds() * 1000)
+        # 実際に待たず、100〜500msの実行時間を合成する
+        span_start = cursor
+        duration = int(rng.uniform(100, 500))
+        span_end = span_start + timedelta(milliseconds=duration)
+        cursor = span_end
         
-        span_types = ["llm", "tool", "function"]
-        s_type = random.choice(span_types)
+        s_type = rng.choice(SPAN_TYPES)
         
         cost = 0.0
         tokens = 0
         model = None
         
         if s_type == "llm":
-            models = ["gpt-4o", "gpt-4o-mini", "claude-3-sonnet", "gpt-3.5-turbo"]
-            model = random.choice(models)
-            tokens = random.randint(100, 2000)
+            model = rng.choice(MODELS)
+            tokens = rng.randint(100, 2000)
             cost = (tokens / 1000) * 0.01
-            total_cost += cost
-            total_tokens += tokens
+        
+        if payload_bytes:
+            input_data = {"query": "x" * (payload_bytes // 2)}
+            output_data = {"response": "y" * (payload_bytes - payload_bytes // 2)}
+        else:
+            input_data = {"query": "hello"}
+            output_data = {"response": "hi"}
             
         spans.append({
-            "id": str(uuid.uuid4()),
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
             "name": f"Step {i+1}",
             "span_type": s_type,
             "start_time": span_start.isoformat(),
@@ -59,16 +81,16 @@ def generate_mock_trace():
             "output_tokens": tokens // 2 if s_type == "llm" else None,
             "cost_usd": cost if s_type == "llm" else None,
             "status": "success",
-            "input_data": {"query": "hello"},
-            "output_data": {"response": "hi"}
+            "input_data": input_data,
+            "output_data": output_data
         })
 
-    end_time = datetime.now(timezone.utc)
+    end_time = cursor
     duration = int((end_time - start_time).total_seconds() * 1000)
 
-    trace_data = {
+    return {
         "id": trace_id,
-        "project_id": PROJECT_ID,
+        "project_id": project_id,
         "name": name,
         "start_time": start_time.isoformat(),
         "end_time": end_time.isoformat(),
@@ -78,12 +100,20 @@ def generate_mock_trace():
         "extra_metadata": {},
         "spans": spans
     }
+
+
+def generate_mock_trace():
+    import requests
+
+    trace_data = build_mock_trace()
+    name = trace_data["name"]
+    status = trace_data["status"]
     
     try:
         response = requests.post(
             API_URL, 
             json=trace_data,
-            headers={"X-API-KEY": "sk_demo_key_12345"}
+            headers={"X-API-KEY": API_KEY}
         )
         if response.status_code == 200:
             print(f"Sent trace: {name} ({status})")
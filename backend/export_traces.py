@@ -0,0 +1,54 @@
+"""
+Export traces/spans to Apache Arrow IPC or Parquet straight from the database
+
+Usage:
+    python export_traces.py --project-id default-project --table spans \
+        --format parquet --start 2024-01-01 --end 2024-02-01 --output spans.parquet
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from sqlmodel import Session
+
+from app.db.database import read_engine
+from app.services.export import EXPORT_FORMATS, EXPORT_TABLES, DEFAULT_CHUNK_SIZE, iter_export
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export AgentScope traces/spans as Arrow or Parquet")
+    parser.add_argument("--project-id", required=True)
+    parser.add_argument("--table", choices=EXPORT_TABLES, default="spans")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--include-payload", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--output", "-o", required=True, help="出力ファイル（- で標準出力）")
+    args = parser.parse_args()
+
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    written = 0
+    try:
+        with Session(read_engine) as session:
+            for chunk in iter_export(
+                session,
+                project_id=args.project_id,
+                table=args.table,
+                fmt=args.format,
+                start=args.start,
+                end=args.end,
+                include_payload=args.include_payload,
+                chunk_size=args.chunk_size
+            ):
+                out.write(chunk)
+                written += len(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+    print(f"Exported {args.table} ({written} bytes) to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Load generator and ingest benchmark for the AgentScope backend
+
+Builds traces with the same schema as demo_generator.build_mock_trace and sends
+them with asyncio (optionally across several processes) to measure achieved
+throughput and ingest latency percentiles.
+
+Usage:
+    python loadgen.py --traces 5000 --concurrency 32 --seed 42
+    python loadgen.py --traces 20000 --rate 500 --processes 4 --batch-size 50
+    python loadgen.py --spans 10-50 --payload-bytes 512-8192 --json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from demo_generator import build_mock_trace, API_KEY, PROJECT_ID
+
+
+def parse_range(value: str) -> Tuple[int, int]:
+    """"10" または "10-50" を (min, max) に変換"""
+    if "-" in value:
+        low, high = value.split("-", 1)
+        return int(low), int(high)
+    return int(value), int(value)
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """ソート済みリストのパーセンタイル（最近傍法）"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def build_requests(args, worker_index: int, trace_count: int) -> List[Tuple[bytes, int]]:
+    """
+    送信するリクエストボディを事前に生成する
+
+    生成・シリアライズのコストを計測から除外するため、送信前に全件作っておく。
+    Returns:
+        (JSONボディ, スパン数) のリスト
+    """
+    rng = random.Random(args.seed * 1000 + worker_index)
+    span_range = parse_range(args.spans)
+    payload_range = parse_range(args.payload_bytes) if args.payload_bytes else None
+    base_time = datetime(2024, 1, 1, tzinfo=timezone.utc) if args.seed_timestamps else None
+
+    traces = []
+    for i in range(trace_count):
+        start_time = base_time + timedelta(seconds=i) if base_time else None
+        traces.append(build_mock_trace(
+            rng=rng,
+            project_id=args.project_id,
+            span_count=rng.randint(*span_range),
+            payload_bytes=rng.randint(*payload_range) if payload_range else None,
+            start_time=start_time
+        ))
+
+    # 同じシードでの再実行が主キー衝突しないよう、IDだけは既定で毎回新しく振る
+    if not args.fixed_ids:
+        for trace in traces:
+            trace["id"] = str(uuid.uuid4())
+            for span in trace["spans"]:
+                span["id"] = str(uuid.uuid4())
+
+    requests = []
+    for i in range(0, len(traces), args.batch_size):
+        chunk = traces[i:i + args.batch_size]
+        body = chunk[0] if args.batch_size == 1 else chunk
+        requests.append((json.dumps(body).encode(), sum(len(t["spans"]) for t in chunk)))
+    return requests
+
+
+async def run_worker(args, requests: List[Tuple[bytes, int]], rate: float) -> Dict:
+    """1プロセス分の送信ループ（asyncio で concurrency 本を並行実行）"""
+    path = "/api/v1/traces" if args.batch_size == 1 else "/api/v1/traces/batch"
+    headers = {"Content-Type": "application/json", "X-API-KEY": args.api_key}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    latencies: List[float] = []
+    errors = 0
+    sent_spans = 0
+    next_index = 0
+    interval = args.batch_size / rate if rate > 0 else 0.0
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        started = time.perf_counter()
+
+        async def loop():
+            nonlocal next_index, errors, sent_spans
+            while next_index < len(requests):
+                index = next_index
+                next_index += 1
+                body, span_count = requests[index]
+
+                # オープンループ：予定送信時刻まで待つ（遅れている場合は即送信）
+                if interval:
+                    delay = started + index * interval - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                t0 = time.perf_counter()
+                try:
+                    response = await client.post(path, content=body, headers=headers)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append((time.perf_counter() - t0) * 1000)
+                if ok:
+                    sent_spans += span_count
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(loop() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"latencies": latencies, "errors": errors, "spans": sent_spans, "elapsed": elapsed}
+
+
+def worker_main(args, worker_index: int, trace_count: int) -> Dict:
+    """プロセスのエントリポイント"""
+    requests = build_requests(args, worker_index, trace_count)
+    rate = args.rate / args.processes if args.rate else 0.0
+    return asyncio.run(run_worker(args, requests, rate))
+
+
+def report(args, results: List[Dict]) -> Dict:
+    """各ワーカーの結果を集計"""
+    latencies = sorted(l for r in results for l in r["latencies"])
+    requests = len(latencies)
+    errors = sum(r["errors"] for r in results)
+    elapsed = max(r["elapsed"] for r in results) if results else 0.0
+    ok_requests = requests - errors
+    traces = ok_requests * args.batch_size
+
+    return {
+        "config": {
+            "traces": args.traces,
+            "concurrency": args.concurrency,
+            "processes": args.processes,
+            "rate": args.rate,
+            "batch_size": args.batch_size,
+            "spans": args.spans,
+            "payload_bytes": args.payload_bytes,
+            "seed": args.seed,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "requests": requests,
+        "errors": errors,
+        "traces_per_s": round(traces / elapsed, 1) if elapsed else 0.0,
+        "spans_per_s": round(sum(r["spans"] for r in results) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgentScope ingest load generator")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--project-id", default=PROJECT_ID)
+    parser.add_argument("--api-key", default=API_KEY)
+    parser.add_argument("--traces", type=int, default=1000, help="送信するトレース総数")
+    parser.add_argument("--concurrency", type=int, default=16, help="プロセスあたりの同時リクエスト数")
+    parser.add_argument("--processes", type=int, default=1, help="送信プロセス数")
+    parser.add_argument("--rate", type=float, default=0.0, help="目標トレース/秒（0で無制限）")
+    parser.add_argument("--batch-size", type=int, default=1, help="1なら /traces、2以上なら /traces/batch")
+    parser.add_argument("--spans", default="2-5", help="トレースあたりのスパン数（例: 5 または 2-20）")
+    parser.add_argument("--payload-bytes", default=None, help="スパンあたりのペイロードサイズ（例: 256-4096）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード（同じシードで同じトレース列）")
+    parser.add_argument("--seed-timestamps", action="store_true", help="タイムスタンプも固定値から生成する")
+    parser.add_argument("--fixed-ids", action="store_true", help="IDもシードから生成する（再送・重複の検証用）")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    if args.batch_size < 1 or args.processes < 1 or args.concurrency < 1:
+        parser.error("--batch-size, --processes and --concurrency must be >= 1")
+
+    # 各プロセスにトレースを均等に割り当てる
+    counts = [args.traces // args.processes] * args.processes
+    for i in range(args.traces % args.processes):
+        counts[i] += 1
+
+    if args.processes == 1:
+        results = [worker_main(args, 0, counts[0])]
+    else:
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.starmap(worker_main, [(args, i, c) for i, c in enumerate(counts)])
+
+    summary = report(args, results)
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+        return
+
+    latency = summary["latency_ms"]
+    fmt = lambda v: f"{v:.1f}" if v is not None else "-"
+    print(f"requests:    {summary['requests']} ({summary['errors']} errors) in {summary['elapsed_s']}s")
+    print(f"throughput:  {summary['traces_per_s']} traces/s, {summary['spans_per_s']} spans/s")
+    print(f"latency ms:  p50={fmt(latency['p50'])} p90={fmt(latency['p90'])} "
+          f"p99={fmt(latency['p99'])} max={fmt(latency['max'])}")
+
+
+if __name__ == "__main__":
+    main()
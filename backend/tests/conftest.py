@@ -0,0 +1,44 @@
+"""
+Shared fixtures: a throwaway SQLite database for the whole test run
+"""
+import os
+import tempfile
+
+# app.db.database はインポート時にエンジンを作るので、先にテスト用のDBを指定する
+_db_dir = tempfile.mkdtemp(prefix="agentscope-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import SQLModel, Session
+
+import app.models  # noqa: F401  テーブル定義を登録する
+from app.db import search as search_index
+from app.db.database import create_db_and_tables, engine
+from app.services.releases import release_buffer
+from app.services.topk import sketch_buffer
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    create_db_and_tables()
+    yield engine
+
+
+@pytest.fixture(autouse=True)
+def clean_tables():
+    """テストごとに全テーブル（検索インデックスを含む）と集計のバッファを空にする"""
+    yield
+    sketch_buffer.flush()
+    release_buffer.flush()
+    with engine.begin() as conn:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            conn.execute(table.delete())
+        if search_index.is_supported(engine.dialect.name):
+            conn.execute(text("DELETE FROM trace_search"))
+
+
+@pytest.fixture
+def session():
+    with Session(engine) as session:
+        yield session
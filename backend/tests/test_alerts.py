@@ -0,0 +1,142 @@
+"""
+Alert delivery against a local webhook stub
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import threading
+
+import pytest
+
+from app.db.database import engine
+from app.models.trace import Project
+from app.services import alerts
+from app.services.alerts import AlertDispatcher, AlertEngine
+
+
+@pytest.fixture
+def webhook():
+    """受け取ったリクエストのボディを記録するだけのWebhook"""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            received.append(json.loads(self.rfile.read(length)))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/hook", received
+    server.shutdown()
+    server.server_close()
+
+
+def _project(session, project_id, webhook_url=None, alert_on_error=True):
+    project = Project(id=project_id, name=project_id, api_key=f"key-{project_id}",
+                      slack_webhook_url=webhook_url, alert_on_error=alert_on_error)
+    session.add(project)
+    session.commit()
+    return project
+
+
+def _alert(project_id, rule="error_rate", scope="*"):
+    return {
+        "project_id": project_id,
+        "rule": rule,
+        "scope": scope,
+        "value": 1.0,
+        "threshold": 0.2,
+        "message": f"{rule} fired",
+        "fired_at": "2026-10-19T00:00:00+00:00",
+    }
+
+
+def _deliver(batches):
+    """
+    配送ワーカーを起動して、バッチごとにアラートを積んで配送を待つ
+
+    batches は (配送前に呼ぶ関数または None, アラートのリスト) のリスト。
+    """
+    async def run():
+        dispatcher = AlertDispatcher(engine)
+        dispatcher.start()
+        try:
+            for before, items in batches:
+                if before is not None:
+                    before(dispatcher)
+                for alert in items:
+                    dispatcher.enqueue(alert)
+                await asyncio.sleep(0)  # call_soon_threadsafe で積まれるのを待つ
+                await dispatcher.drain()
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(run())
+
+
+def test_engine_alert_is_posted_to_webhook(session, webhook):
+    url, received = webhook
+    _project(session, "p1", url)
+
+    engine_ = AlertEngine()
+    fired = []
+    for _ in range(alerts.ALERT_MIN_SAMPLES):
+        fired += engine_.observe("p1", "error", 120.0, 0.0, [])
+    assert [a["rule"] for a in fired] == ["error_rate"]
+
+    _deliver([(None, fired)])
+
+    assert len(received) == 1
+    assert received[0]["text"].startswith(":rotating_light: [p1] error rate 100%")
+
+
+def test_cooldown_suppresses_repeats(session, webhook):
+    url, received = webhook
+    _project(session, "p1", url)
+
+    _deliver([(None, [_alert("p1"), _alert("p1"), _alert("p1", scope="model:gpt-4o")])])
+
+    assert [r["text"] for r in received] == [
+        ":rotating_light: [p1] error_rate fired",
+        ":rotating_light: [p1] (model:gpt-4o) error_rate fired",
+    ]
+
+
+def test_hourly_budget_limits_deliveries(session, webhook, monkeypatch):
+    url, received = webhook
+    _project(session, "p1", url)
+    monkeypatch.setattr(alerts, "ALERT_MAX_PER_HOUR", 2)
+
+    _deliver([(None, [_alert("p1", scope=f"model:m{i}") for i in range(4)])])
+
+    assert len(received) == 2
+
+
+def test_undeliverable_alerts_do_not_use_cooldown_or_budget(session, webhook, monkeypatch):
+    url, received = webhook
+    _project(session, "p1")
+    _project(session, "p2", url, alert_on_error=False)
+    monkeypatch.setattr(alerts, "ALERT_MAX_PER_HOUR", 1)
+
+    def enable(dispatcher):
+        with alerts.Session(engine) as s:
+            s.get(Project, "p1").slack_webhook_url = url
+            s.get(Project, "p2").alert_on_error = True
+            s.commit()
+        dispatcher._projects.clear()  # 設定のキャッシュを捨てる
+
+    _deliver([
+        (None, [_alert("p1"), _alert("p2")] * 3),
+        (enable, [_alert("p1"), _alert("p2")]),
+    ])
+
+    assert sorted(r["text"] for r in received) == [
+        ":rotating_light: [p1] error_rate fired",
+        ":rotating_light: [p2] error_rate fired",
+    ]
@@ -0,0 +1,73 @@
+"""
+Columnar export matches the trace and span tables
+"""
+from datetime import datetime, timedelta
+import io
+import uuid
+
+import pytest
+
+from app.services import export
+from app.services.ingest import ingest_traces
+
+pytestmark = pytest.mark.skipif(not export.HAS_PYARROW, reason="pyarrow is not installed")
+
+STARTED = datetime(2026, 10, 19, 12, 0, 0)
+
+
+def _export(session, table, fmt="parquet"):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    data = b"".join(export.iter_export(session, "p1", table=table, fmt=fmt))
+    if fmt == "arrow":
+        return pa.ipc.open_stream(data).read_all().to_pylist()
+    return pq.read_table(io.BytesIO(data)).to_pylist()
+
+
+@pytest.fixture
+def trace_id(session):
+    trace_id = str(uuid.uuid4())
+    ingest_traces(session, [{
+        "id": trace_id,
+        "project_id": "p1",
+        "name": "agent",
+        "start_time": STARTED,
+        "end_time": STARTED + timedelta(milliseconds=120),
+        "duration_ms": 120,
+        "status": "success",
+        "release": "1.2.0",
+        "spans": [{
+            "id": "span-1",
+            "name": "llm_call",
+            "span_type": "llm",
+            "start_time": STARTED,
+            "duration_ms": 1,
+            "model": "gpt-4",
+            "input_tokens": 10,
+            "cache_hit": True,
+            "saved_cost_usd": 0.02,
+            "saved_duration_ms": 800.0,
+        }],
+    }])
+    return trace_id
+
+
+@pytest.mark.parametrize("fmt", export.EXPORT_FORMATS)
+def test_trace_export_includes_release(session, trace_id, fmt):
+    [row] = _export(session, "traces", fmt)
+
+    assert row["id"] == trace_id
+    assert row["release"] == "1.2.0"
+    assert row["total_tokens"] == 10
+
+
+@pytest.mark.parametrize("fmt", export.EXPORT_FORMATS)
+def test_span_export_includes_cache_columns(session, trace_id, fmt):
+    [row] = _export(session, "spans", fmt)
+
+    assert row["trace_id"] == trace_id
+    assert row["cache_hit"] is True
+    assert row["saved_cost_usd"] == 0.02
+    assert row["saved_duration_ms"] == 800.0
+    assert row["status"] == "success"
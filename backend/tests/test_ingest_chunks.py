@@ -0,0 +1,87 @@
+"""
+Merging incrementally uploaded chunks of one trace
+"""
+from datetime import datetime, timedelta
+import uuid
+
+from sqlalchemy import func, text
+from sqlmodel import select
+
+from app.models.trace import Span, Trace
+from app.services.ingest import ingest_traces
+
+STARTED = datetime(2026, 10, 19, 12, 0, 0)
+
+
+def _span(offset_ms, duration_ms, **fields):
+    start = STARTED + timedelta(milliseconds=offset_ms)
+    return dict({
+        "id": uuid.uuid4().hex[:16],
+        "name": "step",
+        "span_type": "tool",
+        "start_time": start,
+        "end_time": start + timedelta(milliseconds=duration_ms),
+        "duration_ms": duration_ms,
+    }, **fields)
+
+
+def _chunk(trace_id, status, name, spans, end_ms=None, error_message=None):
+    return {
+        "id": trace_id,
+        "project_id": "p1",
+        "name": name,
+        "start_time": STARTED,
+        "end_time": STARTED + timedelta(milliseconds=end_ms) if end_ms is not None else None,
+        "duration_ms": end_ms,
+        "status": status,
+        "error_message": error_message,
+        "spans": spans,
+    }
+
+
+def _trace_documents(session, trace_id):
+    return session.execute(
+        text("SELECT name, error_message FROM trace_search WHERE trace_id = :id AND span_id IS NULL"),
+        {"id": trace_id}
+    ).all()
+
+
+def test_running_chunk_then_final_chunk(session):
+    trace_id = str(uuid.uuid4())
+    ingest_traces(session, [_chunk(trace_id, "running", "agent (running)", [_span(0, 100), _span(100, 200)])])
+    ingest_traces(session, [_chunk(trace_id, "error", "agent", [_span(300, 150)], end_ms=450,
+                                   error_message="tool failed")])
+
+    session.expire_all()
+    trace = session.get(Trace, trace_id)
+    assert trace.status == "error"
+    assert trace.name == "agent"
+    assert trace.error_message == "tool failed"
+    assert trace.span_count == 3
+    assert trace.duration_ms == 450
+    assert session.exec(select(func.count()).select_from(Span).where(Span.trace_id == trace_id)).one() == 3
+    assert _trace_documents(session, trace_id) == [("agent", "tool failed")]
+
+
+def test_chunks_in_one_batch_index_one_trace_document(session):
+    trace_id = str(uuid.uuid4())
+    ingest_traces(session, [
+        _chunk(trace_id, "running", "draft", [_span(0, 10)]),
+        _chunk(trace_id, "success", "agent", [_span(10, 10)], end_ms=20),
+    ])
+
+    session.expire_all()
+    trace = session.get(Trace, trace_id)
+    assert (trace.status, trace.name, trace.span_count, trace.duration_ms) == ("success", "agent", 2, 20)
+    assert _trace_documents(session, trace_id) == [("agent", None)]
+
+
+def test_final_chunk_is_not_reopened_by_a_late_running_chunk(session):
+    trace_id = str(uuid.uuid4())
+    ingest_traces(session, [_chunk(trace_id, "success", "agent", [_span(0, 50)], end_ms=50)])
+    ingest_traces(session, [_chunk(trace_id, "running", "agent (running)", [_span(10, 20)])])
+
+    session.expire_all()
+    trace = session.get(Trace, trace_id)
+    assert (trace.status, trace.name, trace.span_count) == ("success", "agent", 2)
+    assert _trace_documents(session, trace_id) == [("agent", None)]
@@ -0,0 +1,126 @@
+"""
+Resending a batch or a chunk does not double count
+"""
+from datetime import datetime, timedelta
+import uuid
+
+import pytest
+from sqlmodel import func, select
+
+from app.models.trace import ReleaseStats, Span, Trace, TraceRollup
+from app.services import ingest
+from app.services.dedup import recent_trace_ids
+from app.services.ingest import ingest_traces
+from app.services.releases import release_buffer
+
+STARTED = datetime(2026, 10, 19, 12, 0, 0)
+
+
+def _span(offset_ms, **fields):
+    start = STARTED + timedelta(milliseconds=offset_ms)
+    return dict({
+        "id": uuid.uuid4().hex[:16],
+        "name": "llm_call",
+        "span_type": "llm",
+        "start_time": start,
+        "end_time": start + timedelta(milliseconds=50),
+        "duration_ms": 50,
+        "model": "gpt-4",
+        "input_tokens": 10,
+        "output_tokens": 5,
+        "cost_usd": 0.01,
+    }, **fields)
+
+
+def _trace(trace_id, status, spans, end_ms=None):
+    return {
+        "id": trace_id,
+        "project_id": "p1",
+        "name": "agent",
+        "start_time": STARTED,
+        "end_time": STARTED + timedelta(milliseconds=end_ms) if end_ms is not None else None,
+        "duration_ms": end_ms,
+        "status": status,
+        "release": "1.0.0",
+        "spans": spans,
+    }
+
+
+def _totals(session):
+    """トレース・スパン・事前集計の現在値（リリース集計はバッファを書いてから読む）"""
+    release_buffer.flush()
+    traces = session.exec(select(Trace).order_by(Trace.id)).all()
+    rollup = session.exec(
+        select(func.sum(TraceRollup.trace_count), func.sum(TraceRollup.total_tokens),
+               func.sum(TraceRollup.total_cost_usd), func.sum(TraceRollup.duration_count))
+        .where(TraceRollup.bucket_seconds == 3600)
+    ).one()
+    release = session.exec(select(func.sum(ReleaseStats.trace_count))).one()
+    return {
+        "traces": [(t.id, t.span_count, t.total_tokens, round(t.total_cost_usd, 6), t.status) for t in traces],
+        "spans": session.exec(select(func.count()).select_from(Span)).one(),
+        "rollup": (rollup[0], rollup[1], round(rollup[2], 6), rollup[3]),
+        "release": release,
+    }
+
+
+@pytest.fixture
+def ingest_calls(monkeypatch):
+    """_ingest の trust_filter を記録（IntegrityError からの再試行を確かめる）"""
+    calls = []
+    original = ingest._ingest
+
+    def recording(session, traces_data, endpoint, trust_filter):
+        calls.append(trust_filter)
+        return original(session, traces_data, endpoint, trust_filter)
+
+    monkeypatch.setattr(ingest, "_ingest", recording)
+    return calls
+
+
+@pytest.mark.parametrize("forget_ids", [False, True], ids=["filter", "conflict_retry"])
+def test_same_batch_twice(session, ingest_calls, forget_ids):
+    batch = [
+        _trace(str(uuid.uuid4()), "success", [_span(0), _span(50)], end_ms=100),
+        _trace(str(uuid.uuid4()), "error", [_span(0)], end_ms=60),
+    ]
+    ingest_traces(session, batch)
+    session.expire_all()
+    before = _totals(session)
+
+    if forget_ids:
+        # 別ワーカー・再起動後の再送（フィルタは新規と判断し、挿入が IntegrityError になる）
+        recent_trace_ids.clear()
+    ingest_traces(session, batch)
+    session.expire_all()
+
+    assert _totals(session) == before
+    assert before["spans"] == 3
+    assert before["rollup"] == (2, 45, 0.03, 2)
+    assert ingest_calls == ([True, True, False] if forget_ids else [True, True])
+
+
+@pytest.mark.parametrize("forget_ids", [False, True], ids=["filter", "conflict_retry"])
+def test_chunked_trace_twice(session, ingest_calls, forget_ids):
+    trace_id = str(uuid.uuid4())
+    chunks = [
+        _trace(trace_id, "running", [_span(0), _span(50)]),
+        _trace(trace_id, "success", [_span(100)], end_ms=150),
+    ]
+    for chunk in chunks:
+        ingest_traces(session, [chunk])
+    session.expire_all()
+    before = _totals(session)
+
+    for chunk in chunks:
+        if forget_ids:
+            recent_trace_ids.clear()
+        ingest_traces(session, [chunk])
+    session.expire_all()
+
+    assert _totals(session) == before
+    assert before["traces"] == [(trace_id, 3, 45, 0.03, "success")]
+    assert before["rollup"] == (1, 45, 0.03, 1)
+    assert before["release"] == 1
+    # 再送ではフィルタが忘れているので、どちらのチャンクも IntegrityError から全件照合で再試行する
+    assert ingest_calls == ([True, True, True, False, True, False] if forget_ids else [True] * 4)
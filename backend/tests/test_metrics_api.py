@@ -0,0 +1,72 @@
+"""
+Time-window handling of the metrics endpoints
+"""
+from datetime import datetime, timedelta
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import analytics
+from app.services.ingest import ingest_traces
+from app.services.topk import sketch_buffer
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def recent_trace(session):
+    started = datetime.utcnow() - timedelta(minutes=5)
+    ingest_traces(session, [{
+        "id": str(uuid.uuid4()),
+        "project_id": "p1",
+        "name": "agent",
+        "start_time": started,
+        "end_time": started + timedelta(milliseconds=120),
+        "duration_ms": 120,
+        "status": "success",
+        "spans": [],
+    }])
+
+
+def _start_utc_z(hours_ago: int) -> str:
+    return (datetime.utcnow() - timedelta(hours=hours_ago)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@pytest.mark.skipif(not analytics.HAS_NUMPY, reason="numpy is not installed")
+def test_breakdown_accepts_utc_start_without_end(client, recent_trace):
+    response = client.get("/api/v1/metrics/breakdown", params={"project_id": "p1", "start": _start_utc_z(1)})
+
+    assert response.status_code == 200
+    counts = [point["count"] for series in response.json()["series"] for point in series["points"]]
+    assert sum(counts) == 1
+
+
+def test_breakdown_rejects_start_after_end(client):
+    response = client.get("/api/v1/metrics/breakdown", params={
+        "project_id": "p1", "start": "2026-10-19T10:00:00Z", "end": "2026-10-19T18:00:00+09:00"
+    })
+
+    assert response.status_code in (400, 501)
+
+
+@pytest.mark.skipif(not analytics.HAS_NUMPY, reason="numpy is not installed")
+def test_timeseries_accepts_utc_start_without_end(client, recent_trace):
+    response = client.get("/api/v1/metrics/timeseries", params={"project_id": "p1", "start": _start_utc_z(1)})
+
+    assert response.status_code == 200
+    assert sum(point["trace_count"] for point in response.json()["points"]) == 1
+
+
+def test_top_accepts_utc_start_without_end(client, recent_trace):
+    sketch_buffer.flush()
+    response = client.get("/api/v1/metrics/top", params={
+        "project_id": "p1", "dimension": "trace_name", "metric": "calls", "start": _start_utc_z(1)
+    })
+
+    assert response.status_code == 200
+    assert [(item["key"], item["value"]) for item in response.json()["items"]] == [("agent", 1.0)]
@@ -0,0 +1,48 @@
+"""
+Read endpoints run in the threadpool instead of on the event loop
+"""
+from datetime import datetime, timedelta
+import inspect
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import metrics, traces
+from app.main import app
+from app.services.ingest import ingest_traces
+
+
+@pytest.mark.parametrize("endpoint", [
+    traces.list_traces,
+    traces.search_traces,
+    traces.get_trace,
+    metrics.get_metrics,
+    metrics.get_model_usage,
+])
+def test_blocking_reads_are_sync_endpoints(endpoint):
+    # async def だとDB読み取りの間イベントループが止まる
+    assert not inspect.iscoroutinefunction(endpoint)
+
+
+def test_read_endpoints_return_ingested_trace(session):
+    trace_id = str(uuid.uuid4())
+    started = datetime.utcnow() - timedelta(minutes=5)
+    ingest_traces(session, [{
+        "id": trace_id,
+        "project_id": "p1",
+        "name": "agent",
+        "start_time": started,
+        "end_time": started + timedelta(milliseconds=120),
+        "duration_ms": 120,
+        "status": "success",
+        "spans": [],
+    }])
+    client = TestClient(app)
+
+    listed = client.get("/api/v1/traces", params={"project_id": "p1"})
+    assert [t["id"] for t in listed.json()] == [trace_id]
+    assert client.get(f"/api/v1/traces/{trace_id}").json()["name"] == "agent"
+    assert client.get("/api/v1/traces/search", params={"project_id": "p1", "q": "agent"}).status_code == 200
+    assert client.get("/api/v1/metrics", params={"project_id": "p1"}).json()["total_traces"] == 1
+    assert client.get("/api/v1/metrics/models", params={"project_id": "p1"}).json() == []
@@ -0,0 +1,193 @@
+"""
+Release comparison tests and release stats written outside ingest
+"""
+from datetime import datetime, timedelta
+import random
+import uuid
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlmodel import func, select
+
+from app.models.trace import ReleaseStats, Trace
+from app.services import releases
+from app.services.ingest import ingest_traces
+from app.services.quantiles import LogHistogram
+from app.services.releases import compare_releases, mann_whitney_p, proportion_p, release_buffer, welch_p
+
+STARTED = datetime(2026, 10, 19, 12, 0, 0)
+
+
+def _histogram(values):
+    histogram = LogHistogram()
+    for value in values:
+        histogram.add(value)
+    return histogram
+
+
+def _trace(release, duration_ms, status="success", tokens=100, name="agent"):
+    return {
+        "id": str(uuid.uuid4()),
+        "project_id": "p1",
+        "name": name,
+        "start_time": STARTED,
+        "end_time": STARTED + timedelta(milliseconds=duration_ms),
+        "duration_ms": duration_ms,
+        "status": status,
+        "release": release,
+        "spans": [{
+            "id": uuid.uuid4().hex[:16],
+            "name": "llm_call",
+            "span_type": "llm",
+            "start_time": STARTED,
+            "duration_ms": duration_ms,
+            "model": "gpt-4",
+            "input_tokens": tokens,
+            "cost_usd": tokens / 10000,
+        }],
+    }
+
+
+def _ingest_release(session, release, durations, errors=0, tokens=100):
+    ingest_traces(session, [
+        _trace(release, duration, "error" if i < errors else "success", tokens)
+        for i, duration in enumerate(durations)
+    ])
+    release_buffer.flush()
+
+
+def _regressions(comparisons):
+    return {
+        (c["trace_name"], m["metric"])
+        for c in comparisons for m in c["metrics"] if m["regression"]
+    }
+
+
+def _flushes(result):
+    return REGISTRY.get_sample_value(
+        "agentscope_aggregate_flush_total", {"aggregate": "release_stats", "result": result}
+    ) or 0.0
+
+
+# ===== 検定 =====
+
+def test_mann_whitney_detects_slower_candidate():
+    rng = random.Random(1)
+    baseline = _histogram(rng.lognormvariate(4.6, 0.3) for _ in range(200))
+    slower = _histogram(rng.lognormvariate(4.9, 0.3) for _ in range(200))
+    same = _histogram(rng.lognormvariate(4.6, 0.3) for _ in range(200))
+
+    assert mann_whitney_p(baseline, slower) < 1e-6
+    assert mann_whitney_p(baseline, same) > 0.01
+    # 片側検定なので、速くなった側は有意にならない
+    assert mann_whitney_p(slower, baseline) > 0.99
+    assert mann_whitney_p(baseline, LogHistogram()) is None
+
+
+def test_welch_and_proportion_are_one_sided():
+    assert welch_p(100, 25, 50, 110, 25, 50) < 1e-6
+    assert welch_p(110, 25, 50, 100, 25, 50) > 0.99
+    assert welch_p(100, 0, 50, 100, 0, 50) == 1.0
+
+    assert proportion_p(5, 500, 50, 500) < 1e-6
+    assert proportion_p(50, 500, 5, 500) > 0.99
+    assert proportion_p(0, 100, 0, 100) == 1.0
+
+
+# ===== リリースの比較 =====
+
+def test_clear_regression_is_flagged(session):
+    rng = random.Random(2)
+    _ingest_release(session, "1.0", [rng.uniform(90, 110) for _ in range(60)], errors=1)
+    _ingest_release(session, "1.1", [rng.uniform(180, 220) for _ in range(60)], errors=15, tokens=200)
+
+    comparisons = compare_releases(session, "p1", "1.0", "1.1")
+
+    assert [c["trace_name"] for c in comparisons] == [None, "agent"]
+    assert comparisons[0]["candidate"].trace_count == 60
+    assert {(None, "duration_ms"), (None, "error_rate"), ("agent", "duration_ms")} <= _regressions(comparisons)
+    # トークンは全トレースで同じ値（分散0）なので、平均の差だけで有意になる
+    assert (None, "tokens") in _regressions(comparisons)
+
+
+def test_identical_releases_are_not_flagged(session):
+    rng = random.Random(3)
+    durations = [rng.uniform(90, 110) for _ in range(60)]
+    _ingest_release(session, "1.0", durations, errors=3)
+    _ingest_release(session, "1.1", list(reversed(durations)), errors=3)
+
+    comparisons = compare_releases(session, "p1", "1.0", "1.1")
+
+    assert _regressions(comparisons) == set()
+    assert all(m["p_value"] is not None for c in comparisons for m in c["metrics"])
+
+
+def test_small_significant_change_is_below_min_effect(session):
+    _ingest_release(session, "1.0", [100.0] * 200)
+    _ingest_release(session, "1.1", [100.0] * 200, tokens=102)
+
+    comparisons = compare_releases(session, "p1", "1.0", "1.1")
+    tokens = next(m for m in comparisons[0]["metrics"] if m["metric"] == "tokens")
+
+    assert tokens["p_value"] < 1e-6
+    assert tokens["change"] == pytest.approx(0.02)
+    assert not tokens["regression"]
+    assert (None, "tokens") in _regressions(compare_releases(session, "p1", "1.0", "1.1", min_effect=0.01))
+
+
+def test_bonferroni_threshold_counts_every_test(session, monkeypatch):
+    _ingest_release(session, "1.0", [100.0] * 40)
+    _ingest_release(session, "1.1", [150.0] * 40)
+    # p値を alpha と alpha / (検定の数) の間に固定する（全体と agent で 4 指標ずつ、計8検定）
+    monkeypatch.setattr(releases, "mann_whitney_p", lambda a, b: 0.005)
+
+    comparisons = compare_releases(session, "p1", "1.0", "1.1", alpha=0.01)
+    assert ("agent", "duration_ms") not in _regressions(comparisons)
+
+    comparisons = compare_releases(session, "p1", "1.0", "1.1", alpha=0.05)
+    assert ("agent", "duration_ms") in _regressions(comparisons)
+
+
+def test_groups_below_min_count_are_not_tested(session):
+    _ingest_release(session, "1.0", [100.0] * 10)
+    _ingest_release(session, "1.1", [500.0] * 10)
+
+    comparisons = compare_releases(session, "p1", "1.0", "1.1")
+
+    assert all(m["p_value"] is None and not m["regression"] for c in comparisons for m in c["metrics"])
+
+
+# ===== 取り込みの外での書き込み =====
+
+def test_release_stats_conflicts_do_not_fail_ingest(session, monkeypatch):
+    # 行の取り合いが続く状況（毎回 version が合わない）
+    monkeypatch.setattr(releases, "_write", lambda session, pending: pending)
+
+    ingest_traces(session, [_trace("1.0", 100), _trace("1.0", 120)])
+    assert session.exec(select(func.count()).select_from(Trace)).one() == 2
+    conflicts = _flushes("conflict")
+    assert release_buffer.flush() == 0
+    assert _flushes("conflict") > conflicts
+    assert session.exec(select(func.count()).select_from(ReleaseStats)).one() == 0
+
+    # 競合が解けたら、溜まっていた分が書かれる
+    monkeypatch.undo()
+    ingest_traces(session, [_trace("1.0", 140)])
+    assert release_buffer.flush() == 1
+    [(_, stats)] = releases.list_releases(session, "p1")
+    assert stats.trace_count == 3
+
+
+def test_release_stats_write_errors_do_not_fail_ingest(session, monkeypatch):
+    def failing(session, pending):
+        raise RuntimeError("deadlock detected")
+
+    monkeypatch.setattr(releases, "_write", failing)
+    ingest_traces(session, [_trace("1.0", 100)])
+    errors = _flushes("error")
+    assert release_buffer.flush() == 0
+    assert _flushes("error") > errors
+
+    monkeypatch.undo()
+    assert release_buffer.flush() == 1
+    assert releases.list_releases(session, "p1")[0][1].trace_count == 1
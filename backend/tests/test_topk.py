@@ -0,0 +1,88 @@
+"""
+Top-K sketches are written outside the ingest transaction
+"""
+from datetime import datetime, timedelta
+import uuid
+
+from prometheus_client import REGISTRY
+from sqlmodel import func, select
+
+from app.models.trace import Trace
+from app.services import topk
+from app.services.ingest import ingest_traces
+from app.services.topk import sketch_buffer
+
+STARTED = datetime(2026, 10, 19, 12, 0, 0)
+
+
+def _trace(name, duration_ms):
+    return {
+        "id": str(uuid.uuid4()),
+        "project_id": "p1",
+        "name": name,
+        "start_time": STARTED,
+        "end_time": STARTED + timedelta(milliseconds=duration_ms),
+        "duration_ms": duration_ms,
+        "status": "success",
+        "spans": [],
+    }
+
+
+def _flushes(result):
+    return REGISTRY.get_sample_value(
+        "agentscope_aggregate_flush_total", {"aggregate": "topk", "result": result}
+    ) or 0.0
+
+
+def _top(session, metric="calls"):
+    _, items = topk.query_top(session, "p1", "trace_name", metric,
+                              STARTED, STARTED + timedelta(hours=1), k=10)
+    return [(key, value) for key, value, _ in items]
+
+
+def test_buffered_sketches_are_merged_on_flush(session):
+    ingest_traces(session, [_trace("a", 10), _trace("b", 30)])
+    ingest_traces(session, [_trace("a", 20)])
+    assert _top(session) == []
+
+    assert sketch_buffer.flush() > 0
+    assert _top(session) == [("a", 2.0), ("b", 1.0)]
+    assert sorted(_top(session, "duration")) == [("a", 30.0), ("b", 30.0)]
+
+    ingest_traces(session, [_trace("b", 5)])
+    sketch_buffer.flush()
+    assert sorted(_top(session)) == [("a", 2.0), ("b", 2.0)]
+
+
+def test_sketch_conflicts_do_not_fail_ingest(session, monkeypatch):
+    # 行の取り合いが続く状況（毎回 version が合わない）
+    monkeypatch.setattr(topk, "_write", lambda session, sketches: sketches)
+
+    ingest_traces(session, [_trace("a", 10)])
+    assert session.exec(select(func.count()).select_from(Trace)).one() == 1
+    conflicts = _flushes("conflict")
+    assert sketch_buffer.flush() == 0
+    assert _flushes("conflict") > conflicts
+
+    # 競合が解けたら、溜まっていた分が書かれる
+    monkeypatch.undo()
+    ingest_traces(session, [_trace("a", 10)])
+    sketch_buffer.flush()
+    assert _top(session) == [("a", 2.0)]
+
+
+def test_sketch_write_errors_are_counted_and_deferred(session, monkeypatch):
+    def failing(session, sketches):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(topk, "_write", failing)
+    ingest_traces(session, [_trace("a", 10)])
+    errors = _flushes("error")
+    assert sketch_buffer.flush() == 0
+    assert _flushes("error") > errors
+
+    monkeypatch.undo()
+    written = _flushes("written")
+    assert sketch_buffer.flush() > 0
+    assert _flushes("written") > written
+    assert _top(session) == [("a", 1.0)]
@@ -32,12 +32,10 @@ function App() {
   const fetchData = async () => {
     try {
       setLoading(true);
-      const [tracesRes, metricsRes] = await Promise.all([
-        axios.get(`${API_BASE_URL}/traces?project_id=${PROJECT_ID}`),
-        axios.get(`${API_BASE_URL}/metrics?project_id=${PROJECT_ID}`)
-      ]);
-      setTraces(tracesRes.data);
-      setMetrics(metricsRes.data);
+      // 一覧とメトリクスはサーバー側で並列に集計されて1回で返る
+      const res = await axios.get(`${API_BASE_URL}/dashboard?project_id=${PROJECT_ID}`);
+      setTraces(res.data.recent_traces);
+      setMetrics(res.data.metrics);
     } catch (error) {
       console.error('Failed to fetch data:', error);
     } finally {
@@ -47,8 +45,23 @@ function App() {
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 5000); // 5秒ごとに更新
-    return () => clearInterval(interval);
+    const interval = setInterval(fetchData, 60000); // 一覧は初期表示と再同期のみ。新着はSSEで受け取る
+
+    // 新着トレースをライブ受信
+    const source = new EventSource(`${API_BASE_URL}/traces/live?project_id=${PROJECT_ID}`);
+    source.addEventListener('trace', (event) => {
+      const trace: Trace = JSON.parse((event as MessageEvent).data);
+      setTraces((prev) => [trace, ...prev.filter((t) => t.id !== trace.id)].slice(0, 50));
+    });
+    source.addEventListener('dropped', () => {
+      // バッファ溢れで切断された場合は一覧を取り直す（EventSourceは自動で再接続する）
+      fetchData();
+    });
+
+    return () => {
+      clearInterval(interval);
+      source.close();
+    };
   }, []);
 
   return (
@@ -185,7 +198,7 @@ function App() {
                           {trace.span_count} steps
                         </td>
                         <td className="px-6 py-4 text-sm font-mono text-muted-foreground">
-                          {trace.duration_ms}ms
+                          {trace.duration_ms?.toFixed(1)}ms
                         </td>
                         <td className="px-6 py-4 text-sm font-mono text-muted-foreground">
                           ${(trace.total_cost_usd || 0).toFixed(4)}
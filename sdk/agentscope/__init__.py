@@ -1,10 +1,60 @@
 """
 AgentScope Python SDK
 AI Agent Tracing and Monitoring
+
+Public names are resolved lazily (PEP 562) so that `import agentscope` stays cheap:
+httpx is only imported once a trace is actually exported.
 """
-from agentscope.client import AgentScopeClient
-from agentscope.trace import trace, start_trace, end_trace
-from agentscope.config import init
+from typing import TYPE_CHECKING
+import sys
 
 __version__ = "0.1.0"
-__all__ = ["init", "trace", "start_trace", "end_trace", "AgentScopeClient"]
+__all__ = ["init", "trace", "start_trace", "end_trace", "AgentScopeClient", "flush"]
+
+# 公開名 -> 定義しているモジュール（最初に参照されたときに読み込む）
+_LAZY_ATTRS = {
+    "init": "agentscope.config",
+    "trace": "agentscope.trace",
+    "start_trace": "agentscope.trace",
+    "end_trace": "agentscope.trace",
+    "flush": "agentscope.exporter",
+    "AgentScopeClient": "agentscope.client",
+}
+
+if TYPE_CHECKING:
+    from agentscope.client import AgentScopeClient
+    from agentscope.config import init
+    from agentscope.exporter import flush
+    from agentscope.trace import trace, start_trace, end_trace
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # -X importtime に載るよう importlib.import_module ではなく __import__ を使う
+    value = getattr(__import__(module_name, fromlist=[name]), name)
+    # 2回目以降は通常の属性として引けるようにする
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+class _Package(type(sys)):
+    """
+    サブモジュールの読み込みで同名の公開名が上書きされないようにする
+
+    import システムは agentscope.trace（モジュール）を読み込むとパッケージの属性 trace に
+    それを入れるので、そのときはモジュールの中の trace（デコレータ）に差し替える。
+    """
+
+    def __setattr__(self, name, value):
+        if isinstance(value, type(sys)) and _LAZY_ATTRS.get(name) == value.__name__:
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
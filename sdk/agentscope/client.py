@@ -5,6 +5,7 @@ from typing import Optional, Dict, Any, List
 from datetime import datetime
 import httpx
 import json
+import os
 
 from agentscope.config import get_endpoint, get_project_id, is_enabled, get_api_key
 
@@ -45,6 +46,33 @@ class AgentScopeClient:
             print(f"[AgentScope] Failed to send trace: {e}")
             return False
     
+    def send_batch(self, traces: List[Dict[str, Any]]) -> bool:
+        """
+        複数のトレースを1リクエストで送信
+        
+        Args:
+            traces: トレースデータのリスト
+            
+        Returns:
+            送信成功したかどうか
+        """
+        if not is_enabled():
+            return False
+        
+        try:
+            response = self._client.post(
+                f"{self.endpoint}/api/v1/traces/batch",
+                json=traces,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-API-KEY": get_api_key()
+                }
+            )
+            return response.status_code == 200
+        except Exception as e:
+            print(f"[AgentScope] Failed to send {len(traces)} traces: {e}")
+            return False
+    
     def get_traces(self, limit: int = 50, status: Optional[str] = None) -> List[Dict]:
         """
         トレース一覧を取得
@@ -108,3 +136,18 @@ def get_client() -> AgentScopeClient:
     if _client is None:
         _client = AgentScopeClient()
     return _client
+
+
+def _after_fork_in_child():
+    """
+    fork() 後の子プロセスでクライアントを捨てる
+
+    httpx.Client のコネクションは親と共有されたソケットなので、子では使わず
+    （閉じると親の接続も壊しうるので閉じもせず）最初の送信時に作り直す。
+    """
+    global _client
+    _client = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
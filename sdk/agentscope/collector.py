@@ -0,0 +1,400 @@
+"""
+AgentScope host-local collector (agentscope-collector)
+
+Receives traces from SDK processes over Unix/TCP sockets, applies sampling and
+redaction, coalesces them into gzip-compressed batches spooled on disk and
+forwards them upstream with retry, so each host holds a single connection to
+the backend.
+
+Usage:
+    agentscope-collector --listen /tmp/agentscope.sock --listen tcp://127.0.0.1:4319
+    python -m agentscope.collector --sample-rate 0.2 --redact --redact-key password --redact-key api_key
+"""
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import zlib
+
+import httpx
+
+from agentscope.config import init, get_endpoint, get_api_key
+from agentscope.exporter import parse_address
+from agentscope.redaction import Redactor
+
+DEFAULT_LISTEN = os.getenv("AGENTSCOPE_COLLECTOR_SOCKET", "/tmp/agentscope.sock")
+DEFAULT_SPOOL_DIR = os.getenv("AGENTSCOPE_COLLECTOR_SPOOL_DIR", "/tmp/agentscope-spool")
+# ディスクに溜める上限。超えたら古いバッチから捨てる
+DEFAULT_SPOOL_MAX_BYTES = int(os.getenv("AGENTSCOPE_COLLECTOR_SPOOL_MAX_BYTES", str(512 * 1024 * 1024)))
+# バックエンドの /traces/batch の上限（1000件）より小さくしておく
+DEFAULT_BATCH_SIZE = int(os.getenv("AGENTSCOPE_COLLECTOR_BATCH_SIZE", "500"))
+DEFAULT_BATCH_BYTES = int(os.getenv("AGENTSCOPE_COLLECTOR_BATCH_BYTES", str(8 * 1024 * 1024)))
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("AGENTSCOPE_COLLECTOR_FLUSH_INTERVAL", "2.0"))
+# 1行（1トレース）の上限バイト数
+MAX_LINE_BYTES = int(os.getenv("AGENTSCOPE_COLLECTOR_MAX_LINE_BYTES", str(16 * 1024 * 1024)))
+
+# 再送間隔（秒）の下限と上限
+RETRY_MIN = 1.0
+RETRY_MAX = 60.0
+
+
+class Spool:
+    """
+    送信待ちバッチのディスクスプール
+
+    1バッチ = 1ファイル（gzip済みJSON配列）。ファイル名は作成順に並ぶので、
+    古いものから送る。書き込みは一時ファイル経由の rename で行い、
+    途中でプロセスが落ちても壊れたバッチを送らないようにする。
+    """
+
+    SUFFIX = ".json.gz"
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.dropped_batches = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(os.path.getsize(p) for p in self.pending())
+
+    def put(self, body: bytes):
+        """圧縮済みのバッチを書き込む"""
+        with self._lock:
+            self._seq += 1
+            name = f"{time.time_ns():020d}-{os.getpid()}-{self._seq:06d}{self.SUFFIX}"
+            path = os.path.join(self.directory, name)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            self._bytes += len(body)
+            self._enforce_limit()
+
+    def _enforce_limit(self):
+        while self._bytes > self.max_bytes:
+            pending = self.pending()
+            if len(pending) <= 1:
+                break
+            self._remove(pending[0])
+            self.dropped_batches += 1
+
+    def pending(self) -> List[str]:
+        """送信待ちのバッチファイル（古い順）"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, n) for n in sorted(names) if n.endswith(self.SUFFIX)]
+
+    def _remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+            self._bytes -= size
+        except FileNotFoundError:
+            pass
+
+    def remove(self, path: str):
+        """送信済み（または送信不能）のバッチを消す"""
+        with self._lock:
+            self._remove(path)
+
+
+class Uploader:
+    """スプールのバッチを古い順にバックエンドへ送る（指数バックオフで再送）"""
+
+    def __init__(self, spool: Spool, endpoint: str, api_key: Optional[str], timeout: float = 30.0):
+        self.spool = spool
+        self.url = f"{endpoint.rstrip('/')}/api/v1/traces/batch"
+        self.api_key = api_key
+        self.timeout = timeout
+        self.uploaded_batches = 0
+        self.rejected_batches = 0
+        self.failed_attempts = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="agentscope-uploader", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """新しいバッチが書かれたことを知らせる"""
+        self._wakeup.set()
+
+    def _post(self, client: httpx.Client, body: bytes) -> Optional[int]:
+        try:
+            response = client.post(
+                self.url,
+                content=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "Content-Encoding": "gzip",
+                    "X-API-KEY": self.api_key or "",
+                }
+            )
+            return response.status_code
+        except httpx.HTTPError:
+            return None
+
+    def _run(self):
+        delay = RETRY_MIN
+        with httpx.Client(timeout=self.timeout) as client:
+            while not self._stopping.is_set():
+                pending = self.spool.pending()
+                if not pending:
+                    self._wakeup.wait(1.0)
+                    self._wakeup.clear()
+                    continue
+
+                for path in pending:
+                    if self._stopping.is_set():
+                        return
+                    try:
+                        with open(path, "rb") as f:
+                            body = f.read()
+                    except FileNotFoundError:
+                        continue
+
+                    status = self._post(client, body)
+                    if status is not None and status < 300:
+                        self.spool.remove(path)
+                        self.uploaded_batches += 1
+                        delay = RETRY_MIN
+                    elif status is not None and 400 <= status < 500 and status not in (408, 429):
+                        # リクエスト自体が不正なので再送しても通らない。詰まらないよう捨てる
+                        print(f"[AgentScope] Collector: batch rejected with {status}, dropping {os.path.basename(path)}")
+                        self.spool.remove(path)
+                        self.rejected_batches += 1
+                    else:
+                        self.failed_attempts += 1
+                        # ジッター付きの指数バックオフ。停止要求があれば即座に抜ける
+                        if self._stopping.wait(delay * random.uniform(0.5, 1.0)):
+                            return
+                        delay = min(delay * 2, RETRY_MAX)
+                        break
+
+    def stop(self, timeout: float = 10.0):
+        """スプールが空になるまで（最大 timeout 秒）待ってから止める"""
+        deadline = time.monotonic() + timeout
+        while self.spool.pending() and time.monotonic() < deadline:
+            self._wakeup.set()
+            time.sleep(0.05)
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(0.0, deadline - time.monotonic()) + 1.0)
+
+
+class Collector:
+    """SDKプロセスから改行区切りJSONを受け取り、サンプリング・マスク後にバッチ化してスプールする"""
+
+    def __init__(
+        self,
+        listen: List[str],
+        spool: Spool,
+        uploader: Optional[Uploader] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        batch_bytes: int = DEFAULT_BATCH_BYTES,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        sample_rate: float = 1.0,
+        redactor: Optional[Redactor] = None
+    ):
+        self.listen = listen
+        self.spool = spool
+        self.uploader = uploader
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+        self.redactor = redactor
+        self.received = 0
+        self.sampled_out = 0
+        self.invalid = 0
+        self._batch: List[Dict[str, Any]] = []
+        self._batch_bytes = 0
+        self._servers: List[asyncio.AbstractServer] = []
+
+    def _keep(self, trace_data: Dict[str, Any]) -> bool:
+        """
+        サンプリング判定
+
+        エラーは必ず残す。それ以外はトレースIDのハッシュで決めるので、
+        同じトレースの判定はどのコレクターでも一致する。
+        """
+        if self.sample_rate >= 1.0 or trace_data.get("status") == "error":
+            return True
+        trace_id = str(trace_data.get("id", ""))
+        return zlib.crc32(trace_id.encode()) / 0x100000000 < self.sample_rate
+
+    def accept(self, line: bytes):
+        """1行分のトレースを取り込む"""
+        try:
+            trace_data = json.loads(line)
+        except ValueError:
+            self.invalid += 1
+            return
+        if not isinstance(trace_data, dict):
+            self.invalid += 1
+            return
+        self.received += 1
+        if not self._keep(trace_data):
+            self.sampled_out += 1
+            return
+        if self.redactor is not None:
+            trace_data = self.redactor.redact_trace(trace_data)
+        self._batch.append(trace_data)
+        self._batch_bytes += len(line)
+        if len(self._batch) >= self.batch_size or self._batch_bytes >= self.batch_bytes:
+            self.flush()
+
+    def flush(self):
+        """溜まったトレースを圧縮してスプールに書く"""
+        if not self._batch:
+            return
+        batch, self._batch, self._batch_bytes = self._batch, [], 0
+        body = gzip.compress(json.dumps(batch, default=str).encode(), compresslevel=6)
+        self.spool.put(body)
+        if self.uploader is not None:
+            self.uploader.notify()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 上限を超えた行は読み捨てて接続を切る
+                    self.invalid += 1
+                    break
+                if not line:
+                    break
+                self.accept(line)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def start(self):
+        """すべての待ち受けアドレスを開く"""
+        for address in self.listen:
+            family, target = parse_address(address)
+            if family == socket.AF_UNIX:
+                if os.path.exists(target):
+                    os.unlink(target)
+                server = await asyncio.start_unix_server(self._handle, path=target, limit=MAX_LINE_BYTES)
+            else:
+                host, port = target
+                server = await asyncio.start_server(self._handle, host=host, port=port, limit=MAX_LINE_BYTES)
+            self._servers.append(server)
+
+    async def serve(self, stop: asyncio.Event):
+        """stop がセットされるまで受け付ける"""
+        await self.start()
+        flusher = asyncio.ensure_future(self._flush_periodically())
+        try:
+            await stop.wait()
+        finally:
+            flusher.cancel()
+            for server in self._servers:
+                server.close()
+                await server.wait_closed()
+            self.flush()
+
+    def close(self):
+        """Unixソケットのファイルを片付ける"""
+        for address in self.listen:
+            family, target = parse_address(address)
+            if family == socket.AF_UNIX and os.path.exists(target):
+                os.unlink(target)
+
+    def stats(self) -> Dict[str, int]:
+        stats = {
+            "received": self.received,
+            "sampled_out": self.sampled_out,
+            "invalid": self.invalid,
+            "spool_dropped_batches": self.spool.dropped_batches,
+        }
+        if self.uploader is not None:
+            stats.update(
+                uploaded_batches=self.uploader.uploaded_batches,
+                rejected_batches=self.uploader.rejected_batches,
+                failed_attempts=self.uploader.failed_attempts,
+            )
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgentScope host-local collector")
+    parser.add_argument("--listen", action="append", default=None,
+                        help="待ち受けアドレス（Unixソケットのパスまたは tcp://host:port）。複数指定可")
+    parser.add_argument("--endpoint", default=None, help="AgentScopeサーバーのURL（既定: AGENTSCOPE_ENDPOINT）")
+    parser.add_argument("--api-key", default=None, help="APIキー（既定: AGENTSCOPE_API_KEY）")
+    parser.add_argument("--spool-dir", default=DEFAULT_SPOOL_DIR, help="送信待ちバッチの保存先")
+    parser.add_argument("--spool-max-bytes", type=int, default=DEFAULT_SPOOL_MAX_BYTES)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="1バッチの最大トレース数")
+    parser.add_argument("--flush-interval", type=float, default=DEFAULT_FLUSH_INTERVAL, help="バッチを書き出す間隔（秒）")
+    parser.add_argument("--sample-rate", type=float, default=float(os.getenv("AGENTSCOPE_COLLECTOR_SAMPLE_RATE", "1.0")),
+                        help="残すトレースの割合（エラーは常に残す）")
+    parser.add_argument("--redact", action="store_true",
+                        help="メールアドレス・APIキー・カード番号をペイロードからマスクする")
+    parser.add_argument("--redact-key", action="append", default=[],
+                        help="値をマスクするペイロードのキー。複数指定可")
+    parser.add_argument("--allow-key", action="append", default=[],
+                        help="マスクの検査をせずそのまま送るキー。複数指定可")
+    parser.add_argument("--max-string-length", type=int, default=None,
+                        help="ペイロード内の文字列をこの長さで切り詰める")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+
+    init(api_key=args.api_key, endpoint=args.endpoint, debug=args.debug, exporter="sync")
+    spool = Spool(args.spool_dir, args.spool_max_bytes)
+    uploader = Uploader(spool, get_endpoint(), get_api_key())
+    collector = Collector(
+        listen=args.listen or [DEFAULT_LISTEN],
+        spool=spool,
+        uploader=uploader,
+        batch_size=args.batch_size,
+        flush_interval=args.flush_interval,
+        sample_rate=args.sample_rate,
+        redactor=Redactor.from_config({
+            "redact": args.redact,
+            "redact_keys": args.redact_key,
+            "redact_allow_keys": args.allow_key,
+            "max_payload_chars": args.max_string_length,
+        }),
+    )
+
+    async def run():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await collector.serve(stop)
+
+    uploader.start()
+    print(f"[AgentScope] Collector listening on {', '.join(collector.listen)} -> {uploader.url}")
+    try:
+        asyncio.run(run())
+    finally:
+        collector.close()
+        uploader.stop()
+        print(f"[AgentScope] Collector stopped: {collector.stats()}")
+
+
+if __name__ == "__main__":
+    main()
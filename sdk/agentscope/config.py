@@ -1,16 +1,32 @@
 """
 AgentScope Configuration
 """
-from typing import Optional
+from typing import List, Optional
 import os
 
 # グローバル設定
 _config = {
     "api_key": None,
     "project_id": None,
+    "release": os.getenv("AGENTSCOPE_RELEASE") or None,
     "endpoint": "http://localhost:8000",
     "enabled": True,
-    "debug": False
+    "debug": False,
+    "exporter": "batch",
+    "socket_path": None,
+    "flush_span_count": int(os.getenv("AGENTSCOPE_FLUSH_SPAN_COUNT", "200")),
+    "flush_interval": float(os.getenv("AGENTSCOPE_FLUSH_INTERVAL", "30")),
+    "redact": os.getenv("AGENTSCOPE_REDACT", "").lower() in ("1", "true", "yes"),
+    "redact_keys": [k for k in os.getenv("AGENTSCOPE_REDACT_KEYS", "").split(",") if k],
+    "redact_allow_keys": [k for k in os.getenv("AGENTSCOPE_REDACT_ALLOW_KEYS", "").split(",") if k],
+    "max_payload_chars": int(os.getenv("AGENTSCOPE_MAX_PAYLOAD_CHARS", "0")) or None,
+    "cache_responses": os.getenv("AGENTSCOPE_CACHE_RESPONSES", "").lower() in ("1", "true", "yes"),
+    "cache_max_bytes": int(os.getenv("AGENTSCOPE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    "cache_ttl": float(os.getenv("AGENTSCOPE_CACHE_TTL", "3600")),
+    "cache_path": os.getenv("AGENTSCOPE_CACHE_PATH") or None,
+    "flight_recorder": int(os.getenv("AGENTSCOPE_FLIGHT_RECORDER", "0")),
+    "flight_recorder_path": os.getenv("AGENTSCOPE_FLIGHT_RECORDER_PATH") or None,
+    "flight_recorder_port": int(os.getenv("AGENTSCOPE_FLIGHT_RECORDER_PORT", "0")) or None
 }
 
 
@@ -18,8 +34,24 @@ def init(
     api_key: Optional[str] = None,
     project_id: Optional[str] = None,
     endpoint: Optional[str] = None,
+    release: Optional[str] = None,
     enabled: bool = True,
-    debug: bool = False
+    debug: bool = False,
+    exporter: Optional[str] = None,
+    socket_path: Optional[str] = None,
+    flush_span_count: Optional[int] = None,
+    flush_interval: Optional[float] = None,
+    redact: Optional[bool] = None,
+    redact_keys: Optional[List[str]] = None,
+    redact_allow_keys: Optional[List[str]] = None,
+    max_payload_chars: Optional[int] = None,
+    cache_responses: Optional[bool] = None,
+    cache_max_bytes: Optional[int] = None,
+    cache_ttl: Optional[float] = None,
+    cache_path: Optional[str] = None,
+    flight_recorder: Optional[int] = None,
+    flight_recorder_path: Optional[str] = None,
+    flight_recorder_port: Optional[int] = None
 ):
     """
     AgentScopeを初期化
@@ -28,8 +60,38 @@ def init(
         api_key: APIキー（環境変数 AGENTSCOPE_API_KEY からも取得可能）
         project_id: プロジェクトID（環境変数 AGENTSCOPE_PROJECT_ID からも取得可能）
         endpoint: AgentScopeサーバーのURL
+        release: デプロイしたバージョン（git のコミットやタグなど。環境変数 AGENTSCOPE_RELEASE）。
+            すべてのトレースに付き、/metrics/releases/compare でリリース間を比較できる
         enabled: トレースを有効化するか
         debug: デバッグモード
+        exporter: 送信方式（環境変数 AGENTSCOPE_EXPORTER からも取得可能）
+            "batch"  - バックグラウンドスレッドでまとめて送信（デフォルト）
+            "socket" - ホストローカルのコレクター（agentscope-collector）へソケットで渡す
+            "sync"   - 呼び出し元スレッドで都度送信
+        socket_path: exporter="socket" のときの接続先。Unixソケットのパスまたは "tcp://host:port"
+            （環境変数 AGENTSCOPE_COLLECTOR_SOCKET）
+        flush_span_count: 実行中のトレースでも、完了したスパンがこの件数溜まったら途中送信する
+            （環境変数 AGENTSCOPE_FLUSH_SPAN_COUNT、デフォルト200。0で無効）
+        flush_interval: 実行中のトレースを途中送信する間隔（秒）
+            （環境変数 AGENTSCOPE_FLUSH_INTERVAL、デフォルト30。0で無効）
+        redact: メールアドレス・APIキー・カード番号をペイロードからマスクする
+            （環境変数 AGENTSCOPE_REDACT=1）
+        redact_keys: 値を丸ごとマスクするキー（環境変数 AGENTSCOPE_REDACT_KEYS、カンマ区切り）
+        redact_allow_keys: マスクの検査をせずそのまま送るキー（環境変数 AGENTSCOPE_REDACT_ALLOW_KEYS）
+        max_payload_chars: ペイロード内の文字列をこの長さで切り詰める（環境変数 AGENTSCOPE_MAX_PAYLOAD_CHARS）
+            マスクと切り詰めは呼び出し元ではなく送信スレッドで行う。exporter="socket" の場合は
+            コレクター側（--redact など）で行う
+        cache_responses: temperature=0 の同一パラメータの OpenAI 呼び出しをキャッシュから返す
+            （環境変数 AGENTSCOPE_CACHE_RESPONSES=1）。ヒットは cache_hit=True のスパンとして記録される
+        cache_max_bytes: メモリに保持する応答の合計バイト数（環境変数 AGENTSCOPE_CACHE_MAX_BYTES、デフォルト64MiB）
+        cache_ttl: 応答を使い回す秒数（環境変数 AGENTSCOPE_CACHE_TTL、デフォルト3600）
+        cache_path: 実行をまたいで共有する SQLite ファイル（環境変数 AGENTSCOPE_CACHE_PATH）
+        flight_recorder: 直近のトレースをこの件数だけプロセス内に残す（環境変数 AGENTSCOPE_FLIGHT_RECORDER、
+            デフォルト0で無効）。agentscope.recorder.get_recorder() から参照できる
+        flight_recorder_path: 未捕捉の例外・SIGUSR1 のときに記録を JSON Lines で追記するファイル
+            （環境変数 AGENTSCOPE_FLIGHT_RECORDER_PATH）
+        flight_recorder_port: 記録を返すローカルHTTPエンドポイントのポート（127.0.0.1 で待ち受ける、
+            環境変数 AGENTSCOPE_FLIGHT_RECORDER_PORT）
     
     Example:
         >>> from agentscope import init
@@ -38,8 +100,45 @@ def init(
     _config["api_key"] = api_key or os.getenv("AGENTSCOPE_API_KEY")
     _config["project_id"] = project_id or os.getenv("AGENTSCOPE_PROJECT_ID", "default")
     _config["endpoint"] = endpoint or os.getenv("AGENTSCOPE_ENDPOINT", "http://localhost:8000")
+    _config["release"] = release or os.getenv("AGENTSCOPE_RELEASE") or None
     _config["enabled"] = enabled
     _config["debug"] = debug
+    _config["exporter"] = exporter or os.getenv("AGENTSCOPE_EXPORTER", "batch")
+    _config["socket_path"] = socket_path or os.getenv("AGENTSCOPE_COLLECTOR_SOCKET")
+    if flush_span_count is not None:
+        _config["flush_span_count"] = flush_span_count
+    if flush_interval is not None:
+        _config["flush_interval"] = flush_interval
+    if redact is not None:
+        _config["redact"] = redact
+    if redact_keys is not None:
+        _config["redact_keys"] = list(redact_keys)
+    if redact_allow_keys is not None:
+        _config["redact_allow_keys"] = list(redact_allow_keys)
+    if max_payload_chars is not None:
+        _config["max_payload_chars"] = max_payload_chars or None
+    if cache_responses is not None:
+        _config["cache_responses"] = cache_responses
+    if cache_max_bytes is not None:
+        _config["cache_max_bytes"] = cache_max_bytes
+    if cache_ttl is not None:
+        _config["cache_ttl"] = cache_ttl
+    if cache_path is not None:
+        _config["cache_path"] = cache_path or None
+    if flight_recorder is not None:
+        _config["flight_recorder"] = flight_recorder
+    if flight_recorder_path is not None:
+        _config["flight_recorder_path"] = flight_recorder_path or None
+    if flight_recorder_port is not None:
+        _config["flight_recorder_port"] = flight_recorder_port or None
+    
+    # 送信方式やマスク設定が変わりうるので、既存のエクスポーターは作り直す
+    from agentscope.exporter import reset_exporter
+    reset_exporter()
+    from agentscope.response_cache import reset_response_cache
+    reset_response_cache()
+    from agentscope.recorder import reset_recorder
+    reset_recorder()
     
     if _config["debug"]:
         print(f"[AgentScope] Initialized with project_id={_config['project_id']}, endpoint={_config['endpoint']}")
@@ -60,6 +159,16 @@ def get_project_id() -> str:
     return _config["project_id"] or "default"
 
 
+def get_release() -> Optional[str]:
+    """リリース（バージョン）を取得"""
+    return _config["release"]
+
+
 def get_endpoint() -> str:
     """エンドポイントを取得"""
     return _config["endpoint"]
+
+
+def get_api_key() -> Optional[str]:
+    """APIキーを取得"""
+    return _config["api_key"] or os.getenv("AGENTSCOPE_API_KEY")
@@ -0,0 +1,302 @@
+"""
+AgentScope Exporters
+Hand finished traces off the caller's thread (background batching or a host-local collector)
+"""
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+import atexit
+import os
+import queue
+import threading
+import time
+
+from agentscope.config import get_config
+
+if TYPE_CHECKING:
+    from agentscope.redaction import Redactor
+
+# 終了を伝える番兵
+_STOP = object()
+
+
+class SyncExporter:
+    """呼び出し元スレッドでそのまま送信する（従来の動作）"""
+
+    def __init__(self, redactor: Optional["Redactor"] = None):
+        self.redactor = redactor
+
+    def submit(self, trace_data: Dict[str, Any]) -> bool:
+        from agentscope.client import get_client
+
+        if self.redactor is not None:
+            trace_data = self.redactor.redact_trace(trace_data)
+        return get_client().send_trace(trace_data)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return True
+
+    def shutdown(self, timeout: Optional[float] = None):
+        pass
+
+
+class BatchExporter:
+    """
+    バックグラウンドスレッドでトレースをまとめて送信する
+
+    submit はキューに積むだけなので呼び出し元をブロックしない。
+    キューが溢れた場合はトレースを捨てる（アプリケーションを止めないことを優先）。
+    マスク・切り詰め（redactor）も送信スレッドで行う。
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = 2048,
+        max_batch_size: int = 50,
+        flush_interval: float = 1.0,
+        redactor: Optional["Redactor"] = None
+    ):
+        self.redactor = redactor
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_thread(self):
+        """送信スレッドを必要になった時点で起動"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="agentscope-exporter", daemon=True)
+                self._thread.start()
+
+    def submit(self, trace_data: Dict[str, Any]) -> bool:
+        """トレースを送信キューに積む"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(trace_data)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if get_config().get("debug"):
+                print("[AgentScope] Export queue full, dropping trace")
+            return False
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                self._export(batch)
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _export(self, batch: List[Dict[str, Any]]):
+        """バッチを送信（1件ならそのまま /traces に送る）"""
+        from agentscope.client import get_client
+
+        try:
+            if self.redactor is not None:
+                # 元の辞書はフライトレコーダーと共有しているので、マスクはコピーに対して行う
+                batch = [self.redactor.redact_trace(trace_data) for trace_data in batch]
+            client = get_client()
+            if len(batch) == 1:
+                client.send_trace(batch[0])
+            else:
+                client.send_batch(batch)
+        except Exception as e:
+            if get_config().get("debug"):
+                print(f"[AgentScope] Failed to export {len(batch)} traces: {e}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """キューが空になるまで待つ"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._queue.unfinished_tasks:
+            if self._thread is None or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            time.sleep(0.005)
+        return True
+
+    def shutdown(self, timeout: Optional[float] = 5.0):
+        """残りを送信してスレッドを止める"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+def parse_address(address: str):
+    """
+    コレクターのアドレスを (ファミリー, 接続先) に変換
+
+    "tcp://host:port" ならTCP、それ以外（"unix://path" またはパス）はUnixソケット。
+    """
+    import socket
+
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    if address.startswith("unix://"):
+        address = address[len("unix://"):]
+    return socket.AF_UNIX, address
+
+
+class SocketExporter:
+    """
+    ホストローカルのコレクタープロセスへソケット（Unix または TCP）で渡す
+
+    1トレース = 1行のJSON（改行区切り）。接続できない場合は BatchExporter にフォールバックする。
+    マスクはコレクター側で行うので、redactor はフォールバック時にだけ使う。
+    """
+
+    # ソケットのバッファが詰まったときに呼び出し元を待たせる上限（秒）
+    SEND_TIMEOUT = 0.05
+    # 接続に失敗した後、再接続を試みるまでの間隔（秒）
+    RECONNECT_INTERVAL = 5.0
+
+    def __init__(self, socket_path: str, redactor: Optional["Redactor"] = None):
+        import json
+
+        self._dumps = json.dumps
+        self.socket_path = socket_path
+        self.redactor = redactor
+        self._sock = None
+        self._lock = threading.Lock()
+        self._fallback: Optional[BatchExporter] = None
+        self._next_connect = 0.0
+
+    def _connect(self):
+        import socket
+
+        if time.monotonic() < self._next_connect:
+            return None
+        family, address = parse_address(self.socket_path)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.SEND_TIMEOUT)
+            sock.connect(address)
+            return sock
+        except OSError as e:
+            sock.close()
+            self._next_connect = time.monotonic() + self.RECONNECT_INTERVAL
+            if get_config().get("debug"):
+                print(f"[AgentScope] Collector not reachable at {self.socket_path}: {e}")
+            return None
+
+    def submit(self, trace_data: Dict[str, Any]) -> bool:
+        """トレースをコレクターに送る"""
+        line = self._dumps(trace_data, default=str).encode() + b"\n"
+        with self._lock:
+            for _ in range(2):
+                if self._sock is None:
+                    self._sock = self._connect()
+                    if self._sock is None:
+                        break
+                try:
+                    self._sock.sendall(line)
+                    return True
+                except OSError:
+                    # 切断・タイムアウト時は一度だけ再接続して送り直す
+                    self._sock.close()
+                    self._sock = None
+
+        if self._fallback is None:
+            self._fallback = BatchExporter(redactor=self.redactor)
+        return self._fallback.submit(trace_data)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        if self._fallback is not None:
+            return self._fallback.flush(timeout)
+        return True
+
+    def shutdown(self, timeout: Optional[float] = 5.0):
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+        if self._fallback is not None:
+            self._fallback.shutdown(timeout)
+
+
+# シングルトンエクスポーター
+_exporter = None
+
+
+def get_exporter():
+    """設定に応じたグローバルエクスポーターを取得"""
+    global _exporter
+    if _exporter is None:
+        config = get_config()
+        from agentscope.redaction import Redactor
+
+        mode = config.get("exporter") or "batch"
+        redactor = Redactor.from_config(config)
+        if mode == "sync":
+            _exporter = SyncExporter(redactor)
+        elif mode == "socket" and config.get("socket_path"):
+            _exporter = SocketExporter(config["socket_path"], redactor)
+        else:
+            _exporter = BatchExporter(redactor=redactor)
+    return _exporter
+
+
+def reset_exporter():
+    """エクスポーターを作り直す（init() で設定が変わったとき）"""
+    global _exporter
+    exporter, _exporter = _exporter, None
+    if exporter is not None:
+        exporter.shutdown()
+
+
+def flush(timeout: Optional[float] = 5.0) -> bool:
+    """未送信のトレースを送り切る"""
+    if _exporter is None:
+        return True
+    return _exporter.flush(timeout)
+
+
+def _after_fork_in_child():
+    """
+    fork() 後の子プロセスでエクスポーターを捨てる
+
+    親のスレッドは子には存在せず、キューのロックやソケットは親と共有されたままなので、
+    子は何も触らずに参照だけを外し、最初の送信時に自分用のものを作り直す。
+    """
+    global _exporter
+    _exporter = None
+
+
+def _shutdown_at_exit():
+    exporter = _exporter
+    if exporter is not None:
+        exporter.shutdown(timeout=5.0)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(_shutdown_at_exit)
@@ -0,0 +1,37 @@
+"""
+AgentScope ID generation
+
+W3C Trace Context compatible IDs (32 hex chars for traces, 16 for spans) drawn from a
+per-process PRNG instead of uuid4(), which reads the OS RNG on every call.
+"""
+import os
+import random
+
+# プロセスごとのPRNG。IDは推測されても困らない（認証には使わない）ので暗号論的な乱数は不要
+_rng = random.Random(os.urandom(16))
+_getrandbits = _rng.getrandbits
+
+
+def generate_trace_id() -> str:
+    """128bitのトレースID（小文字16進32桁、全ゼロは W3C で無効なので避ける）"""
+    value = _getrandbits(128)
+    while not value:
+        value = _getrandbits(128)
+    return "%032x" % value
+
+
+def generate_span_id() -> str:
+    """64bitのスパンID（小文字16進16桁）"""
+    value = _getrandbits(64)
+    while not value:
+        value = _getrandbits(64)
+    return "%016x" % value
+
+
+def _reseed_after_fork():
+    """fork() した子が親と同じ系列のIDを出さないよう、種を取り直す"""
+    _rng.seed(os.urandom(16))
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_after_fork)
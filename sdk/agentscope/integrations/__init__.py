@@ -1,4 +1,21 @@
 # AgentScope Integrations
-from agentscope.integrations.openai import patch_openai
+# 計装対象のライブラリ（openai、langchain など）は使うときに初めて読み込む
 
-__all__ = ["patch_openai"]
+__all__ = ["patch_openai", "patch_httpx", "patch_requests", "AgentScopeCallbackHandler"]
+
+_LAZY_ATTRS = {
+    "patch_openai": "agentscope.integrations.openai",
+    "patch_httpx": "agentscope.integrations.http",
+    "patch_requests": "agentscope.integrations.http",
+    "AgentScopeCallbackHandler": "agentscope.integrations.langchain",
+}
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # -X importtime に載るよう importlib.import_module ではなく __import__ を使う
+    value = getattr(__import__(module_name, fromlist=[name]), name)
+    globals()[name] = value
+    return value
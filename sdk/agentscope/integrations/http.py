@@ -0,0 +1,96 @@
+"""
+HTTP client integration for AgentScope
+Adds a W3C traceparent header to outgoing httpx / requests calls made inside a span
+"""
+from typing import Iterable, Optional
+from functools import wraps
+from urllib.parse import urlsplit
+
+from agentscope.config import get_config, is_enabled
+from agentscope.propagation import TRACEPARENT_HEADER, current_traceparent
+
+
+def _host_filter(hosts: Optional[Iterable[str]]):
+    """
+    ヘッダを付ける宛先の判定関数（None ならすべての宛先）
+
+    "tools.internal" は tools.internal とそのサブドメインに一致する。
+    外部のAPI（OpenAI など）にトレースIDを渡したくない場合に絞り込む。
+    """
+    if hosts is None:
+        return None
+    allowed = tuple(h.lower().lstrip(".") for h in hosts)
+
+    def matches(host: Optional[str]) -> bool:
+        if not host:
+            return False
+        host = host.lower()
+        return any(host == h or host.endswith("." + h) for h in allowed)
+
+    return matches
+
+
+def _inject_into(headers, host: Optional[str], matches) -> None:
+    if not is_enabled() or TRACEPARENT_HEADER in headers:
+        return
+    if matches is not None and not matches(host):
+        return
+    value = current_traceparent()
+    if value is not None:
+        headers[TRACEPARENT_HEADER] = value
+
+
+def patch_httpx(hosts: Optional[Iterable[str]] = None):
+    """
+    httpx の Client / AsyncClient の送信に traceparent を付ける
+
+    Args:
+        hosts: ヘッダを付ける宛先のホスト名（省略するとすべての宛先）
+
+    Example:
+        >>> from agentscope.integrations import patch_httpx
+        >>> patch_httpx(hosts=["tools.internal"])
+    """
+    import httpx
+
+    matches = _host_filter(hosts)
+    for client_class in (httpx.Client, httpx.AsyncClient):
+        original_send = getattr(client_class.send, "__wrapped__", client_class.send)
+
+        def make(original_send):
+            @wraps(original_send)
+            def patched_send(self, request, *args, **kwargs):
+                _inject_into(request.headers, request.url.host, matches)
+                return original_send(self, request, *args, **kwargs)
+            return patched_send
+
+        # AsyncClient.send はコルーチン関数だが、ヘッダを書いてから元の関数のコルーチンを返せばよい
+        client_class.send = make(original_send)
+
+    if get_config().get("debug"):
+        print("[AgentScope] httpx patched for trace propagation")
+
+
+def patch_requests(hosts: Optional[Iterable[str]] = None):
+    """
+    requests の Session の送信に traceparent を付ける
+
+    requests.get() なども内部で Session.send を通るので、これだけで全部に付く。
+
+    Args:
+        hosts: ヘッダを付ける宛先のホスト名（省略するとすべての宛先）
+    """
+    import requests
+
+    matches = _host_filter(hosts)
+    original_send = getattr(requests.Session.send, "__wrapped__", requests.Session.send)
+
+    @wraps(original_send)
+    def patched_send(self, request, **kwargs):
+        _inject_into(request.headers, urlsplit(request.url).hostname, matches)
+        return original_send(self, request, **kwargs)
+
+    requests.Session.send = patched_send
+
+    if get_config().get("debug"):
+        print("[AgentScope] requests patched for trace propagation")
@@ -0,0 +1,289 @@
+"""
+LangChain / LangGraph Integration for AgentScope
+Callback handler that records chain, LLM, tool and retriever runs as spans
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+import threading
+import time
+
+from agentscope.config import is_enabled
+from agentscope.integrations.openai import OPENAI_PRICING, calculate_cost
+from agentscope.trace import (
+    TraceContext, _elapsed_ms, _get_current_span, _get_current_trace, _send_trace, _to_datetime
+)
+from agentscope.ids import generate_span_id
+
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+    HAS_LANGCHAIN = True
+except ImportError:
+    # langchain がなくてもコールバックを直接呼べば動く（ベンチマークなど）
+    BaseCallbackHandler = object
+    HAS_LANGCHAIN = False
+
+# LangGraph が内部処理（チャネルへの書き込みなど）に付けるタグ。スパンにせず親に畳む
+_HIDDEN_TAG = "langsmith:hidden"
+
+# 入出力として記録する文字列の長さ（@trace と同じ）
+_MAX_INPUT_CHARS = 500
+_MAX_OUTPUT_CHARS = 1000
+
+
+class _Run:
+    """実行中の1 run（スパン1つ分。辞書にするのは終了時だけ）"""
+
+    __slots__ = (
+        "run_id", "span_id", "parent_span_id", "trace", "name", "span_type", "start_ns",
+        "model", "input_tokens", "output_tokens", "input_data", "is_root",
+    )
+
+    def __init__(self, run_id, span_id, parent_span_id, trace, name, span_type, start_ns, input_data, is_root):
+        self.run_id = run_id
+        self.span_id = span_id
+        self.parent_span_id = parent_span_id
+        self.trace = trace
+        self.name = name
+        self.span_type = span_type
+        self.start_ns = start_ns
+        self.model = None
+        self.input_tokens = None
+        self.output_tokens = None
+        self.input_data = input_data
+        self.is_root = is_root
+
+
+class _RunTrace:
+    """ルート run に対応するトレース（@trace の中から呼ばれたときは、そのトレースに相乗りする）"""
+
+    __slots__ = ("context", "owned", "lock")
+
+    def __init__(self, context: TraceContext, owned: bool):
+        self.context = context
+        self.owned = owned
+        self.lock = threading.Lock()
+
+
+def _run_name(serialized: Optional[Dict], kwargs: Dict, default: str) -> str:
+    name = kwargs.get("name")
+    if name:
+        return name
+    if serialized:
+        name = serialized.get("name")
+        if name:
+            return name
+        path = serialized.get("id")
+        if path:
+            return path[-1]
+    return default
+
+
+def _summary(value: Any, limit: int) -> Dict:
+    try:
+        return {"value": str(value)[:limit]}
+    except Exception:
+        return {"value": None}
+
+
+def _model_name(kwargs: Dict, metadata: Optional[Dict]) -> Optional[str]:
+    """on_*_start の引数からモデル名を取る"""
+    params = kwargs.get("invocation_params")
+    if params:
+        model = params.get("model") or params.get("model_name")
+        if model:
+            return model
+    if metadata:
+        return metadata.get("ls_model_name")
+    return None
+
+
+def _token_usage(response) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """
+    LLMResult から (model, input_tokens, output_tokens) を取る
+
+    新しい ChatModel はメッセージの usage_metadata に、古い LLM は llm_output["token_usage"] に入れる。
+    """
+    input_tokens = output_tokens = None
+    llm_output = getattr(response, "llm_output", None) or {}
+    usage = llm_output.get("token_usage") or llm_output.get("usage")
+    if usage:
+        input_tokens = usage.get("prompt_tokens", usage.get("input_tokens"))
+        output_tokens = usage.get("completion_tokens", usage.get("output_tokens"))
+    model = llm_output.get("model_name") or llm_output.get("model")
+    if input_tokens is None:
+        for generations in getattr(response, "generations", None) or ():
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    input_tokens = (input_tokens or 0) + (usage.get("input_tokens") or 0)
+                    output_tokens = (output_tokens or 0) + (usage.get("output_tokens") or 0)
+                if model is None and message is not None:
+                    model = (getattr(message, "response_metadata", None) or {}).get("model_name")
+    return model, input_tokens, output_tokens
+
+
+def _output_text(response) -> Optional[str]:
+    try:
+        return response.generations[0][0].text[:_MAX_OUTPUT_CHARS]
+    except (AttributeError, IndexError, TypeError):
+        return None
+
+
+class AgentScopeCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain / LangGraph のコールバックをスパンとして記録するハンドラ
+
+    親を持たない run（invoke した Runnable やグラフ）ごとに1つのトレースを作り、その run が
+    終わったときに送信する。@trace の中から呼ばれたときは、新しいトレースを作らずに
+    その時点のスパンの子として記録する。
+
+    run_id ごとの状態は __slots__ のオブジェクトに持ち、スパンの辞書は run の終了時に1回だけ作る。
+    複数の run が並行して（async で、あるいはスレッドをまたいで）進んでも、状態は run_id で
+    引くので混ざらない。
+
+    Args:
+        capture_io: 入出力を記録するか（大きな入力を毎回文字列にするのを避けたいときは False）
+
+    Example:
+        >>> from agentscope.integrations import AgentScopeCallbackHandler
+        >>> handler = AgentScopeCallbackHandler()
+        >>> chain.invoke({"question": "..."}, config={"callbacks": [handler]})
+    """
+
+    # 処理は辞書の操作だけなので、async の run でもスレッドプールに回さずその場で呼ばせる
+    run_inline = True
+    raise_error = False
+
+    def __init__(self, capture_io: bool = True):
+        self.capture_io = capture_io
+        # run_id -> _Run。非表示の run は親の _Run を指す
+        self._runs: Dict[UUID, _Run] = {}
+
+    # ===== run の開始と終了 =====
+
+    def _start(
+        self,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        name: str,
+        span_type: str,
+        tags: Optional[List[str]],
+        input_value: Any
+    ) -> Optional[_Run]:
+        if not is_enabled():
+            return None
+        parent = self._runs.get(parent_run_id) if parent_run_id is not None else None
+        if parent is not None:
+            if tags and _HIDDEN_TAG in tags:
+                self._runs[run_id] = parent
+                return None
+            trace, parent_span_id = parent.trace, parent.span_id
+        else:
+            context = _get_current_trace()
+            if context is not None:
+                span = _get_current_span()
+                trace = _RunTrace(context, owned=False)
+                parent_span_id = span.span_id if span else context.remote_parent_span_id
+            else:
+                context = TraceContext(name=name)
+                trace, parent_span_id = _RunTrace(context, owned=True), context.remote_parent_span_id
+        input_data = _summary(input_value, _MAX_INPUT_CHARS) if self.capture_io and input_value is not None else None
+        run = _Run(run_id, generate_span_id(), parent_span_id, trace, name, span_type,
+                   time.perf_counter_ns(), input_data, is_root=parent is None)
+        self._runs[run_id] = run
+        return run
+
+    def _end(self, run_id: UUID, output_data: Optional[Dict], error: Optional[BaseException] = None):
+        run = self._runs.pop(run_id, None)
+        if run is None or run.run_id != run_id:
+            return  # 記録していない run か、親に畳んだ非表示の run
+        end_ns = time.perf_counter_ns()
+        trace = run.trace
+        context = trace.context
+        offset = context._epoch_offset_ns
+        cost = None
+        if run.model in OPENAI_PRICING and run.input_tokens and run.output_tokens:
+            cost = calculate_cost(run.model, run.input_tokens, run.output_tokens)
+        span = {
+            "id": run.span_id,
+            "parent_span_id": run.parent_span_id,
+            "name": run.name,
+            "span_type": run.span_type,
+            "start_time": _to_datetime(run.start_ns + offset).isoformat(),
+            "end_time": _to_datetime(end_ns + offset).isoformat(),
+            "duration_ms": _elapsed_ms(run.start_ns, end_ns),
+            "model": run.model,
+            "input_tokens": run.input_tokens,
+            "output_tokens": run.output_tokens,
+            "cost_usd": cost,
+            "input_data": run.input_data,
+            "output_data": output_data if self.capture_io else None,
+            "status": "error" if error is not None else "success",
+            "error_message": str(error) if error is not None else None,
+        }
+        # 並行する run が同じトレースに追記し、途中送信が走ることもあるのでトレース単位でロックする
+        with trace.lock:
+            context.add_span(span)
+        if trace.owned and run.is_root:
+            if error is not None:
+                context.finish(status="error", error_message=str(error))
+            else:
+                context.finish(status="success")
+            _send_trace(context)
+
+    # ===== chain（LangGraph のグラフとノードを含む） =====
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        span_type = "agent" if metadata and "langgraph_node" in metadata else "chain"
+        self._start(run_id, parent_run_id, _run_name(serialized, kwargs, "chain"), span_type, tags, inputs)
+
+    def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, _summary(outputs, _MAX_OUTPUT_CHARS) if self.capture_io else None)
+
+    def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, None, error)
+
+    # ===== LLM / ChatModel =====
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        run = self._start(run_id, parent_run_id, _run_name(serialized, kwargs, "llm"), "llm", tags, prompts)
+        if run is not None:
+            run.model = _model_name(kwargs, metadata)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                            **kwargs):
+        run = self._start(run_id, parent_run_id, _run_name(serialized, kwargs, "chat_model"), "llm", tags, messages)
+        if run is not None:
+            run.model = _model_name(kwargs, metadata)
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run.run_id == run_id:
+            model, run.input_tokens, run.output_tokens = _token_usage(response)
+            run.model = run.model or model
+        self._end(run_id, {"content": _output_text(response)} if self.capture_io else None)
+
+    def on_llm_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, None, error)
+
+    # ===== tool / retriever =====
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self._start(run_id, parent_run_id, _run_name(serialized, kwargs, "tool"), "tool", tags, input_str)
+
+    def on_tool_end(self, output, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, _summary(output, _MAX_OUTPUT_CHARS) if self.capture_io else None)
+
+    def on_tool_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, None, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                           **kwargs):
+        self._start(run_id, parent_run_id, _run_name(serialized, kwargs, "retriever"), "retriever", tags, query)
+
+    def on_retriever_end(self, documents, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, {"documents": len(documents)} if self.capture_io else None)
+
+    def on_retriever_error(self, error, *, run_id, parent_run_id=None, **kwargs):
+        self._end(run_id, None, error)
@@ -2,17 +2,11 @@
 OpenAI Integration for AgentScope
 Automatic instrumentation for OpenAI API calls
 """
-from typing import Optional, Any
+from typing import Any, Dict, Optional
 from functools import wraps
 import time
 
-try:
-    import openai
-    HAS_OPENAI = True
-except ImportError:
-    HAS_OPENAI = False
-
-from agentscope.trace import _get_current_trace, SpanContext, add_span
+from agentscope.trace import _get_current_trace, _elapsed_ms, SpanContext, add_span
 from agentscope.config import is_enabled, get_config
 
 
@@ -46,21 +40,35 @@ def patch_openai():
         >>> # これ以降のOpenAI呼び出しは自動でトレースされる
         >>> response = openai.chat.completions.create(...)
     """
-    if not HAS_OPENAI:
+    # openai はここで初めて読み込む（import agentscope.integrations だけでは読み込まない）
+    try:
+        import openai
+    except ImportError:
         print("[AgentScope] OpenAI not installed, skipping patch")
         return
     
-    _patch_chat_completions()
+    _patch_chat_completions(openai)
     
     config = get_config()
     if config.get("debug"):
         print("[AgentScope] OpenAI patched successfully")
 
 
-def _patch_chat_completions():
+def _input_summary(messages) -> Dict:
+    return {"messages": [{"role": m.get("role"), "content": m.get("content", "")[:200]} for m in messages[:3]]}
+
+
+def _output_summary(response) -> Dict:
+    output_content = None
+    if response.choices:
+        output_content = response.choices[0].message.content
+    return {"content": output_content[:500] if output_content else None}
+
+
+def _patch_chat_completions(openai):
     """Chat Completions APIをパッチ"""
-    if not HAS_OPENAI:
-        return
+    # キャッシュは hashlib などを読み込むので、パッチするときに初めて読み込む
+    from agentscope.response_cache import cache_key, get_response_cache
     
     original_create = openai.resources.chat.Completions.create
     
@@ -69,15 +77,39 @@ def _patch_chat_completions():
         if not is_enabled():
             return original_create(self, *args, **kwargs)
         
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         model = kwargs.get("model", "unknown")
         messages = kwargs.get("messages", [])
         
+        # 決定的な呼び出しは応答キャッシュを引く（接続先ごとに分ける）
+        cache = get_response_cache()
+        key = None
+        if cache is not None and not args:
+            key = cache_key(kwargs, namespace=str(getattr(self._client, "base_url", "")))
+        if key is not None:
+            response_type = openai.types.chat.ChatCompletion
+            cached = cache.get(key)
+            if cached is not None:
+                payload, meta = cached
+                response = response_type.model_validate_json(payload)
+                duration_ms = _elapsed_ms(start_ns, time.perf_counter_ns())
+                add_span(
+                    name="openai.chat.completions.create",
+                    span_type="llm",
+                    model=meta.get("model") or model,
+                    input_data=_input_summary(messages),
+                    output_data=_output_summary(response),
+                    duration_ms=duration_ms,
+                    cache_hit=True,
+                    saved_cost_usd=meta.get("cost_usd"),
+                    saved_duration_ms=max(0.0, (meta.get("duration_ms") or 0.0) - duration_ms)
+                )
+                return response
+        
         try:
             response = original_create(self, *args, **kwargs)
             
-            end_time = time.time()
-            duration_ms = int((end_time - start_time) * 1000)
+            duration_ms = _elapsed_ms(start_ns, time.perf_counter_ns())
             
             # トークン数を取得
             usage = getattr(response, 'usage', None)
@@ -89,10 +121,14 @@ def _patch_chat_completions():
             if input_tokens and output_tokens:
                 cost = calculate_cost(model, input_tokens, output_tokens)
             
-            # 出力を取得
-            output_content = None
-            if response.choices:
-                output_content = response.choices[0].message.content
+            if key is not None and isinstance(response, response_type):
+                cache.put(key, response.model_dump_json().encode(), {
+                    "model": model,
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "cost_usd": cost,
+                    "duration_ms": duration_ms,
+                })
             
             # スパンを追加
             add_span(
@@ -102,9 +138,10 @@ def _patch_chat_completions():
                 input_tokens=input_tokens,
                 output_tokens=output_tokens,
                 cost_usd=cost,
-                input_data={"messages": [{"role": m.get("role"), "content": m.get("content", "")[:200]} for m in messages[:3]]},
-                output_data={"content": output_content[:500] if output_content else None},
-                duration_ms=duration_ms
+                input_data=_input_summary(messages),
+                output_data=_output_summary(response),
+                duration_ms=duration_ms,
+                cache_hit=False if key is not None else None
             )
             
             return response
@@ -115,7 +152,8 @@ def _patch_chat_completions():
                 span_type="llm",
                 model=model,
                 input_data={"messages": [{"role": m.get("role")} for m in messages[:3]]},
-                output_data={"error": str(e)}
+                output_data={"error": str(e)},
+                duration_ms=_elapsed_ms(start_ns, time.perf_counter_ns())
             )
             raise
     
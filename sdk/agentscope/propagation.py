@@ -0,0 +1,112 @@
+"""
+AgentScope cross-service propagation
+
+W3C Trace Context (`traceparent`) helpers. The calling service injects the
+current trace and span ids into outgoing request headers; the called service
+extracts them and continues the same trace, so spans from both services are
+merged under one trace id by the backend.
+
+    # 呼び出し元
+    httpx.post(url, headers=inject())
+
+    # 呼び出し先
+    with continue_trace(request.headers):
+        handle(request)   # この中の @trace は呼び出し元のトレースの一部になる
+"""
+from contextlib import contextmanager
+from typing import Dict, Mapping, NamedTuple, Optional
+import re
+
+from agentscope.trace import _get_current_span, _get_current_trace, _get_remote_parent, _set_remote_parent
+
+TRACEPARENT_HEADER = "traceparent"
+
+# version-traceid-parentid-flags（version 00 以外も後方互換のため同じ形で読む。ff は無効）
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?$")
+
+
+class RemoteParent(NamedTuple):
+    """呼び出し元のトレースIDとスパンID"""
+    trace_id: str
+    span_id: str
+    sampled: bool
+
+
+def format_traceparent(trace_id: str, span_id: str, sampled: bool = True) -> str:
+    """traceparent ヘッダの値を作る（UUID 形式のトレースIDはハイフンを除く）"""
+    return f"00-{trace_id.replace('-', '')}-{span_id}-{'01' if sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[RemoteParent]:
+    """traceparent ヘッダの値を読む（不正な値は None）"""
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return None
+    version, trace_id, span_id, flags, rest = match.groups()
+    if version == "ff" or (version == "00" and rest):
+        return None
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return RemoteParent(trace_id, span_id, bool(int(flags, 16) & 0x01))
+
+
+def current_traceparent() -> Optional[str]:
+    """実行中のスパンを親とする traceparent（スパンの外では None）"""
+    trace_ctx = _get_current_trace()
+    span = _get_current_span()
+    if trace_ctx is None or span is None:
+        return None
+    return format_traceparent(trace_ctx.trace_id, span.span_id)
+
+
+def inject(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    送信するリクエストのヘッダに traceparent を加えて返す
+
+    headers を渡すとそれに書き込む（既に traceparent があれば上書きしない）。
+    スパンの外で呼んだときは何も加えない。
+    """
+    if headers is None:
+        headers = {}
+    if TRACEPARENT_HEADER not in headers:
+        value = current_traceparent()
+        if value is not None:
+            headers[TRACEPARENT_HEADER] = value
+    return headers
+
+
+def extract(headers: Mapping[str, str]) -> Optional[RemoteParent]:
+    """受信したリクエストのヘッダから呼び出し元を読む（大文字小文字を区別しない）"""
+    value = headers.get(TRACEPARENT_HEADER)
+    if value is None and isinstance(headers, dict):
+        # フレームワークの Headers と違い、普通の dict は大文字小文字を区別するので探し直す
+        for key, candidate in headers.items():
+            if key.lower() == TRACEPARENT_HEADER:
+                value = candidate
+                break
+    return parse_traceparent(value)
+
+
+@contextmanager
+def continue_trace(headers_or_parent):
+    """
+    ブロックの中で始まるトレースを、呼び出し元のトレースの続きにする
+
+    ヘッダ（dict や Starlette/Flask の Headers）か RemoteParent を受け取る。traceparent が
+    なければ何もしない（通常どおり新しいトレースになる）。
+    """
+    if isinstance(headers_or_parent, RemoteParent) or headers_or_parent is None:
+        remote = headers_or_parent
+    else:
+        remote = extract(headers_or_parent)
+    if remote is None:
+        yield None
+        return
+    previous = _get_remote_parent()
+    _set_remote_parent((remote.trace_id, remote.span_id))
+    try:
+        yield remote
+    finally:
+        _set_remote_parent(previous)
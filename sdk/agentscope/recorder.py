@@ -0,0 +1,246 @@
+"""
+AgentScope flight recorder
+
+Keeps the last N exported traces in a fixed-size ring buffer inside the process so
+they can be inspected when the backend is unreachable: through the API below, an
+optional local HTTP endpoint, or a JSONL dump written on crash or signal.
+Recording stores a reference to the dict that is exported anyway, so the cost per
+trace is a few slot assignments. Exporters redact into a copy, so a recorded dict
+never changes after it is recorded (and holds the payload before redaction).
+"""
+from array import array
+from typing import Any, Dict, IO, Iterator, List, Optional, Union
+import sys
+import threading
+
+from agentscope.config import get_config
+
+
+class FlightRecorder:
+    """
+    直近のトレースのリングバッファ
+
+    送信用に作ったトレースの辞書をそのまま参照で持つ（コピーしない）。エクスポーターはマスクを
+    コピーに対して行うので、記録した辞書は後から書き換わらない（マスク前の内容が残る）。途中送信したチャンクも
+    1件として記録される。所要時間とエラーの有無は別の配列に持ち、絞り込みで辞書を触らない。
+
+    Args:
+        capacity: 保持するトレース数
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._traces: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._durations = array("d", bytes(8 * capacity))
+        self._errors = bytearray(capacity)
+        self._next = 0  # 次に書く位置（書いた総数）
+        self._lock = threading.Lock()
+
+    def record(self, trace_data: Dict[str, Any]):
+        """トレースを記録（一番古いものを上書きする）"""
+        with self._lock:
+            i = self._next % self.capacity
+            self._traces[i] = trace_data
+            self._durations[i] = trace_data.get("duration_ms") or 0.0
+            self._errors[i] = trace_data.get("status") == "error"
+            self._next += 1
+
+    def __len__(self) -> int:
+        return min(self._next, self.capacity)
+
+    def _indices(self, errors_only: bool, slowest: Optional[int]) -> List[int]:
+        """条件に合うスロット（新しい順、slowest 指定時は遅い順）"""
+        with self._lock:
+            count = min(self._next, self.capacity)
+            newest = self._next - 1
+        indices = [(newest - k) % self.capacity for k in range(count)]
+        if errors_only:
+            errors = self._errors
+            indices = [i for i in indices if errors[i]]
+        if slowest is not None:
+            import heapq
+
+            durations = self._durations
+            indices = heapq.nlargest(slowest, indices, key=durations.__getitem__)
+        return indices
+
+    def iter_traces(self, errors_only: bool = False, slowest: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """記録したトレースを新しい順（slowest 指定時は遅い順）に返す。辞書はコピーしない"""
+        traces = self._traces
+        for i in self._indices(errors_only, slowest):
+            trace_data = traces[i]
+            if trace_data is not None:
+                yield trace_data
+
+    def traces(
+        self,
+        errors_only: bool = False,
+        slowest: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        記録したトレースを取得
+
+        Args:
+            errors_only: status="error" のものだけ
+            slowest: 所要時間の長い順に上位K件
+            limit: 最大件数
+        """
+        result = list(self.iter_traces(errors_only, slowest))
+        return result[:limit] if limit is not None else result
+
+    def dump(
+        self,
+        target: Union[str, IO[str]],
+        errors_only: bool = False,
+        slowest: Optional[int] = None
+    ) -> int:
+        """
+        JSON Lines で書き出し、書いた件数を返す
+
+        1件ずつストリームに書くので、バッファ全体の文字列やリストは作らない。
+        """
+        import json
+
+        if isinstance(target, str):
+            with open(target, "a", encoding="utf-8") as f:
+                return self.dump(f, errors_only, slowest)
+        count = 0
+        for trace_data in self.iter_traces(errors_only, slowest):
+            json.dump(trace_data, target, default=str, ensure_ascii=False)
+            target.write("\n")
+            count += 1
+        target.flush()
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._traces = [None] * self.capacity
+            self._errors = bytearray(self.capacity)
+            self._next = 0
+
+
+# シングルトン（init() で作り直す）
+_recorder: Optional[FlightRecorder] = None
+_recorder_loaded = False
+# 例外・シグナル時の書き出し先と、ローカルHTTPサーバー（プロセスで1つ）
+_dump_path: Optional[str] = None
+_server = None
+
+
+def get_recorder() -> Optional[FlightRecorder]:
+    """設定に応じたグローバルレコーダー（無効なら None）"""
+    global _recorder, _recorder_loaded
+    if not _recorder_loaded:
+        _recorder_loaded = True
+        config = get_config()
+        capacity = config.get("flight_recorder") or 0
+        if capacity > 0:
+            _recorder = FlightRecorder(capacity)
+            if config.get("flight_recorder_path"):
+                install_dump_handlers(config["flight_recorder_path"])
+            if config.get("flight_recorder_port") and _server is None:
+                host, port = serve(port=config["flight_recorder_port"])
+                if config.get("debug"):
+                    print(f"[AgentScope] Flight recorder listening on http://{host}:{port}/traces")
+    return _recorder
+
+
+def reset_recorder():
+    """レコーダーを作り直す（init() で設定が変わったとき）"""
+    global _recorder, _recorder_loaded
+    _recorder, _recorder_loaded = None, False
+
+
+def _dump_on_exit():
+    recorder = get_recorder()
+    if recorder is not None and _dump_path:
+        try:
+            recorder.dump(_dump_path)
+        except Exception:
+            pass  # 書き出しの失敗で元の例外やシグナル処理を邪魔しない
+
+
+def install_dump_handlers(path: str, signals=("SIGUSR1",)):
+    """
+    未捕捉の例外で終了するとき・シグナルを受けたときに path へ書き出す
+
+    既存の sys.excepthook とシグナルハンドラは呼び続ける。2回目以降は書き出し先だけを変える。
+    シグナルはメインスレッドからしか登録できないので、それ以外から呼ばれた場合は例外時の
+    書き出しだけを設定する。
+    """
+    global _dump_path
+    installed = _dump_path is not None
+    _dump_path = path
+    if installed:
+        return
+
+    previous_hook = sys.excepthook
+
+    def excepthook(exc_type, exc, tb):
+        _dump_on_exit()
+        previous_hook(exc_type, exc, tb)
+
+    sys.excepthook = excepthook
+
+    import signal
+
+    for name in signals:
+        signum = getattr(signal, name, None)
+        if signum is None:
+            continue  # Windows には SIGUSR1 がない
+        previous = signal.getsignal(signum)
+
+        def handler(received, frame, previous=previous):
+            _dump_on_exit()
+            if callable(previous):
+                previous(received, frame)
+
+        try:
+            signal.signal(signum, handler)
+        except ValueError:
+            pass
+
+
+def serve(host: str = "127.0.0.1", port: int = 0):
+    """
+    ローカルHTTPエンドポイントを別スレッドで起動し、(host, port) を返す
+
+    GET /traces?errors=1&slowest=10&limit=50 で、その時点のレコーダーの内容を JSON の配列で返す。
+    """
+    global _server
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path not in ("/traces", "/"):
+                self.send_error(404)
+                return
+            query = parse_qs(url.query)
+            try:
+                slowest = int(query["slowest"][0]) if "slowest" in query else None
+                limit = int(query["limit"][0]) if "limit" in query else None
+            except ValueError:
+                self.send_error(400, "slowest and limit must be integers")
+                return
+            errors_only = query.get("errors", ["0"])[0].lower() in ("1", "true", "yes")
+            recorder = get_recorder()
+            traces = recorder.traces(errors_only, slowest, limit) if recorder is not None else []
+            body = json.dumps(traces, default=str, ensure_ascii=False).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # アプリのログに混ぜない
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="agentscope-recorder", daemon=True).start()
+    _server = server
+    return server.server_address[:2]
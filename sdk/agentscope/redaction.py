@@ -0,0 +1,250 @@
+"""
+AgentScope payload redaction
+
+Masks sensitive values (emails, API keys, card numbers, deny-listed keys) and truncates
+long strings in trace payloads. It runs on the exporter thread or in the collector,
+never in the traced call itself.
+"""
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional
+import re
+
+REDACTED = "[REDACTED]"
+
+# スパン内でユーザーデータを含みうるフィールド
+PAYLOAD_FIELDS = ("input_data", "output_data", "metadata")
+# 自由記述の文字列フィールド（パターンのみ適用）
+TEXT_FIELDS = ("error_message",)
+
+# 切り詰め前に余分に検査する文字数（切り詰め位置をまたぐPIIの断片を残さないため）
+_TRUNCATE_MARGIN = 128
+# これより短い文字列はどのパターンにも当たらない（最短のメールアドレス "a@b.co" 程度）
+_MIN_SCAN_LENGTH = 6
+# 結果をキャッシュする文字列の最大長（システムプロンプトやロール名など、同じ文字列が何度も来る）
+_CACHE_MAX_LENGTH = 512
+
+_EMAIL_DOMAIN = re.compile(r"@[\w-]+(?:\.[\w-]+)+")
+_EMAIL_LOCAL = re.compile(r"[\w.+-]{1,64}\Z")
+_API_KEY = re.compile(
+    r"\b(?:sk-[A-Za-z0-9_-]{20,}|AKIA[0-9A-Z]{16}|gh[pousr]_[A-Za-z0-9]{36}"
+    r"|xox[abprs]-[A-Za-z0-9-]{10,}|AIza[0-9A-Za-z_-]{35})"
+    r"|\b[Bb]earer\s+[A-Za-z0-9._~+/-]{16,}=*"
+)
+_API_KEY_TRIGGERS = ("sk-", "AKIA", "ghp_", "gho_", "ghu_", "ghs_", "ghr_", "xox", "AIza", "earer")
+# 13桁以上の数字の並びがあるかだけを見る粗い判定と、番号を切り出す本判定
+# （先頭に \b を置くと文字クラスによる高速スキャンが効かなくなるので、境界は置換時に確かめる）
+_CARD_CANDIDATE = re.compile(r"[0-9][0-9 -]{11,35}[0-9]")
+_CARD = re.compile(r"[0-9](?:[ -]?[0-9]){12,18}")
+
+
+def _luhn_ok(digits: str) -> bool:
+    """カード番号のチェックディジット（Luhn）を検証"""
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = ord(ch) - 48
+        if i % 2:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return total % 10 == 0
+
+
+def _redact_emails(text: str) -> str:
+    """
+    メールアドレスをマスク
+
+    "@" を含まなければ何もしない。ローカル部から探すと単語ごとにバックトラックして遅いので、
+    "@ドメイン" を見つけてから直前のローカル部を含めて置き換える。
+    """
+    if "@" not in text:
+        return text
+    parts = []
+    pos = 0
+    for match in _EMAIL_DOMAIN.finditer(text):
+        start = match.start()
+        local = _EMAIL_LOCAL.search(text, max(pos, start - 64), start)
+        if local is None:
+            continue
+        parts.append(text[pos:local.start()])
+        parts.append("[REDACTED:email]")
+        pos = match.end()
+    if not parts:
+        return text
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _redact_api_keys(text: str) -> str:
+    """既知の形式のAPIキー・Bearerトークンをマスク"""
+    for trigger in _API_KEY_TRIGGERS:
+        if trigger in text:
+            return _API_KEY.sub("[REDACTED:api_key]", text)
+    return text
+
+
+def _redact_cards(text: str) -> str:
+    """Luhn を満たし、前後が英数字でない13〜19桁の番号をマスク"""
+    if _CARD_CANDIDATE.search(text) is None:
+        return text
+
+    def replace(match: "re.Match") -> str:
+        start, end = match.span()
+        if (start and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum()):
+            return match.group()
+        digits = match.group().replace(" ", "").replace("-", "")
+        return "[REDACTED:card]" if _luhn_ok(digits) else match.group()
+
+    return _CARD.sub(replace, text)
+
+
+# 組み込みパターン。どれも安価な事前判定（`in` や粗い正規表現）で、PIIを含まない大半の文字列では
+# 正規表現を走らせない
+BUILTIN_PATTERNS: Dict[str, Callable[[str], str]] = {
+    "email": _redact_emails,
+    "api_key": _redact_api_keys,
+    "card": _redact_cards,
+}
+
+
+class Redactor:
+    """
+    トレースのペイロードからPIIや秘密情報を取り除く
+
+    Args:
+        keys: 値を丸ごとマスクするキー（deny リスト、大文字小文字を区別しない）
+        allow_keys: 値を検査せずそのまま残すキー（allow リスト）。deny が優先
+        patterns: 適用する組み込みパターン名（"email", "api_key", "card"）
+        custom_patterns: 追加の {名前: 正規表現}。1つの正規表現にまとめてコンパイルする
+        max_string_length: これより長い文字列を切り詰める（None で無制限）
+        cache_size: 処理済みの短い文字列を覚えておく件数（0 で無効）
+    """
+
+    def __init__(
+        self,
+        keys: Iterable[str] = (),
+        allow_keys: Iterable[str] = (),
+        patterns: Iterable[str] = (),
+        custom_patterns: Optional[Mapping[str, str]] = None,
+        max_string_length: Optional[int] = None,
+        cache_size: int = 4096
+    ):
+        self.keys = frozenset(k.lower() for k in keys)
+        self.allow_keys = frozenset(k.lower() for k in allow_keys) - self.keys
+        self.max_string_length = max_string_length or None
+
+        self._steps = []
+        for name in patterns:
+            if name not in BUILTIN_PATTERNS:
+                raise ValueError(f"Unknown redaction pattern: {name}")
+            self._steps.append(BUILTIN_PATTERNS[name])
+        if custom_patterns:
+            combined = re.compile("|".join(f"(?P<{name}>{p})" for name, p in custom_patterns.items()))
+            self._steps.append(
+                lambda text: combined.sub(lambda m: f"[REDACTED:{m.lastgroup}]", text)
+            )
+
+        self.scans_text = bool(self._steps or self.max_string_length)
+        self.enabled = bool(self.keys or self.scans_text)
+        self.cache_size = cache_size
+        self._cache: Dict[str, str] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["Redactor"]:
+        """SDK設定から作る（何も設定されていなければ None）"""
+        redactor = cls(
+            keys=config.get("redact_keys") or (),
+            allow_keys=config.get("redact_allow_keys") or (),
+            patterns=tuple(BUILTIN_PATTERNS) if config.get("redact") else (),
+            max_string_length=config.get("max_payload_chars"),
+        )
+        return redactor if redactor.enabled else None
+
+    def redact_text(self, text: str) -> str:
+        """文字列にパターンを適用し、長すぎれば切り詰める"""
+        length = len(text)
+        if length < _MIN_SCAN_LENGTH:
+            return text
+        cacheable = self.cache_size and length <= _CACHE_MAX_LENGTH
+        if cacheable:
+            cached = self._cache.get(text)
+            if cached is not None:
+                return cached
+
+        original = text
+        limit = self.max_string_length
+        truncated = limit is not None and length > limit
+        if truncated:
+            text = text[:limit + _TRUNCATE_MARGIN]
+        for step in self._steps:
+            text = step(text)
+        if truncated:
+            text = text[:limit] + "...[truncated]"
+
+        if cacheable:
+            # 上限に達したら丸ごと捨てる（LRUの管理より安い）
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[original] = text
+        return text
+
+    def _redact_value(self, value: Any) -> Any:
+        # 呼び出し元のオブジェクトを書き換えないよう、dict/list は作り直す
+        # 葉の文字列はここで処理し、要素ごとの再帰呼び出しを避ける
+        if isinstance(value, str):
+            return self.redact_text(value) if self.scans_text else value
+        scans_text = self.scans_text
+        if isinstance(value, dict):
+            keys = self.keys
+            allow_keys = self.allow_keys
+            check_keys = bool(keys or allow_keys)
+            result = {}
+            for k, v in value.items():
+                if check_keys and isinstance(k, str):
+                    name = k.lower()
+                    if name in keys:
+                        result[k] = REDACTED
+                        continue
+                    if name in allow_keys:
+                        result[k] = v
+                        continue
+                if isinstance(v, str):
+                    result[k] = self.redact_text(v) if scans_text else v
+                elif isinstance(v, (dict, list, tuple)):
+                    result[k] = self._redact_value(v)
+                else:
+                    result[k] = v
+            return result
+        if isinstance(value, (list, tuple)):
+            return [
+                (self.redact_text(v) if scans_text else v) if isinstance(v, str)
+                else self._redact_value(v) if isinstance(v, (dict, list, tuple))
+                else v
+                for v in value
+            ]
+        return value
+
+    def redact_span(self, span: Dict[str, Any]) -> Dict[str, Any]:
+        """スパン（またはトレース本体）のペイロードを処理（その場で書き換える）"""
+        for field in PAYLOAD_FIELDS:
+            if span.get(field) is not None:
+                span[field] = self._redact_value(span[field])
+        if self.scans_text:
+            for field in TEXT_FIELDS:
+                if isinstance(span.get(field), str):
+                    span[field] = self.redact_text(span[field])
+        return span
+
+    def redact_trace(self, trace_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        トレースと配下のスパンのペイロードを処理したコピーを返す
+
+        渡した辞書は書き換えない（フライトレコーダーが同じ辞書を参照で持っているため）。
+        コピーするのはトレースとスパンの辞書だけで、処理しないフィールドの値は共有する。
+        """
+        if not self.enabled:
+            return trace_data
+        redacted = self.redact_span(dict(trace_data))
+        spans = trace_data.get("spans")
+        if spans:
+            redacted["spans"] = [self.redact_span(dict(span)) for span in spans]
+        return redacted
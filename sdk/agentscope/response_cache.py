@@ -0,0 +1,216 @@
+"""
+AgentScope LLM response cache
+
+Opt-in memoization of deterministic LLM calls (temperature 0, identical
+parameters). Responses are kept as serialized bytes in an in-memory LRU with a
+byte budget and TTL, optionally backed by a SQLite file shared across runs.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import json
+import threading
+import time
+
+from agentscope.config import get_config
+
+# キーに含めない引数（応答の内容に影響しない）
+_IGNORED_PARAMS = frozenset(("timeout", "extra_headers"))
+
+# (シリアライズ済みの応答, 元の呼び出しの情報 {model, input_tokens, output_tokens, cost_usd, duration_ms})
+CacheEntry = Tuple[bytes, Dict[str, Any]]
+
+
+def cache_key(params: Dict[str, Any], namespace: str = "") -> Optional[str]:
+    """
+    呼び出しパラメータからキャッシュキーを作る（キャッシュしてはいけない呼び出しは None）
+
+    temperature=0 を明示した、ストリーミングでない1候補の呼び出しだけを対象にする
+    （temperature の省略時の既定値は 1 なので、省略された呼び出しは決定的ではない）。
+    """
+    if params.get("temperature") != 0 or params.get("stream") or params.get("n") not in (None, 1):
+        return None
+    key_params = {k: v for k, v in params.items() if k not in _IGNORED_PARAMS}
+    try:
+        encoded = json.dumps(key_params, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None  # JSON にできない引数（関数オブジェクトなど）を含む呼び出しは対象外
+    return hashlib.sha256(f"{namespace}\n{encoded}".encode()).hexdigest()
+
+
+class _DiskTier:
+    """
+    SQLite ファイルの二次キャッシュ（プロセス・実行をまたいで共有する）
+
+    読み出しは mmap 経由にして、評価パイプラインのように同じ応答を何度も引く場合の
+    システムコールを減らす。
+    """
+
+    def __init__(self, path: str, mmap_bytes: int = 256 * 1024 * 1024):
+        import sqlite3
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+            "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, payload BLOB NOT NULL, meta TEXT NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM llm_response_cache WHERE expires_at <= ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[Tuple[float, bytes, Dict[str, Any]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, payload, meta FROM llm_response_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], bytes(row[1]), json.loads(row[2])
+
+    def put(self, key: str, expires_at: float, payload: bytes, meta: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (key, expires_at, payload, meta) VALUES (?, ?, ?, ?)",
+                (key, expires_at, payload, json.dumps(meta)),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_response_cache")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    LLM応答のキャッシュ（メモリのLRU + 任意でSQLiteファイル）
+
+    Args:
+        max_bytes: メモリ上に保持する応答の合計バイト数の上限
+        ttl: 応答を使い回す秒数
+        path: SQLite ファイルのパス（None ならメモリのみ）
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600.0, path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (有効期限, 応答, 情報)。末尾が最近使ったもの
+        self._entries: "OrderedDict[str, Tuple[float, bytes, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._disk = _DiskTier(path) if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["ResponseCache"]:
+        """SDK設定から作る（無効なら None）"""
+        if not config.get("cache_responses"):
+            return None
+        return cls(
+            max_bytes=config.get("cache_max_bytes") or 64 * 1024 * 1024,
+            ttl=config.get("cache_ttl") or 3600.0,
+            path=config.get("cache_path"),
+        )
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """キャッシュされた応答（なければ None）。ディスクで見つかったものはメモリに載せる"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], entry[2]
+                self._remove(key)
+
+        found = self._disk.get(key) if self._disk is not None else None
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._insert(key, *found)
+        return found[1], found[2]
+
+    def put(self, key: str, payload: bytes, meta: Dict[str, Any]):
+        """応答を保存（メモリの上限を超えたら古いものから捨てる）"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._insert(key, expires_at, payload, meta)
+        if self._disk is not None:
+            self._disk.put(key, expires_at, payload, meta)
+
+    def _insert(self, key: str, expires_at: float, payload: bytes, meta: Dict[str, Any]):
+        if key in self._entries:
+            self._remove(key)
+        size = len(payload)
+        if size > self.max_bytes:
+            return  # 1件で上限を超える応答はメモリに載せない（ディスクには残る）
+        self._entries[key] = (expires_at, payload, meta)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, payload, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット数などの統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """メモリとディスクの両方を空にする"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+
+# シングルトンキャッシュ（init() で作り直す）
+_cache: Optional[ResponseCache] = None
+_cache_loaded = False
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """設定に応じたグローバルキャッシュ（無効なら None）"""
+    global _cache, _cache_loaded
+    if not _cache_loaded:
+        _cache = ResponseCache.from_config(get_config())
+        _cache_loaded = True
+    return _cache
+
+
+def reset_response_cache():
+    """キャッシュを作り直す（init() で設定が変わったとき）"""
+    global _cache, _cache_loaded
+    cache, _cache, _cache_loaded = _cache, None, False
+    if cache is not None:
+        cache.close()
@@ -3,22 +3,33 @@ AgentScope Tracing
 Core tracing functionality with @trace decorator
 """
 from typing import Optional, Callable, Any, Dict, List
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 from contextlib import contextmanager
-import uuid
 import time
-import json
 import threading
-import atexit
 
-from agentscope.config import get_project_id, is_enabled, get_config
-from agentscope.client import get_client
+from agentscope.config import get_project_id, get_release, is_enabled, get_config
+from agentscope.exporter import get_exporter
+from agentscope.ids import generate_span_id, generate_trace_id
+from agentscope.recorder import get_recorder
 
 
 # スレッドローカルでトレースコンテキストを管理
 _trace_context = threading.local()
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _to_datetime(epoch_ns: int) -> datetime:
+    """エポックからのナノ秒をUTCのdatetimeに変換（マイクロ秒精度）"""
+    return _EPOCH + timedelta(microseconds=epoch_ns // 1000)
+
+
+def _elapsed_ms(start_ns: int, end_ns: int) -> float:
+    """perf_counter_ns の差をミリ秒に変換（マイクロ秒精度）"""
+    return round((end_ns - start_ns) / 1_000_000, 3)
+
 
 def _get_current_trace() -> Optional[Dict]:
     """現在のトレースを取得"""
@@ -40,43 +51,114 @@ def _set_current_span(span: Optional[Dict]):
     _trace_context.current_span = span
 
 
+def _get_remote_parent() -> Optional[tuple]:
+    """他サービスから引き継いだ (trace_id, parent_span_id)。propagation.continue_trace で設定する"""
+    return getattr(_trace_context, 'remote_parent', None)
+
+
+def _set_remote_parent(remote_parent: Optional[tuple]):
+    _trace_context.remote_parent = remote_parent
+
+
 class TraceContext:
     """トレースコンテキストを管理するクラス"""
     
-    def __init__(self, name: str, trace_id: Optional[str] = None):
-        self.trace_id = trace_id or str(uuid.uuid4())
+    def __init__(self, name: str, trace_id: Optional[str] = None, remote_parent_span_id: Optional[str] = None):
+        # 呼び出し元サービスのトレースを引き継ぐ（continue_trace の中で始まったトレース）
+        if trace_id is None and remote_parent_span_id is None:
+            remote_parent = _get_remote_parent()
+            if remote_parent is not None:
+                trace_id, remote_parent_span_id = remote_parent
+        self.trace_id = trace_id or generate_trace_id()
         self.name = name
-        self.start_time = datetime.now(timezone.utc)
+        # 親のいないスパンは、呼び出し元サービスのこのスパンの子になる
+        self.remote_parent_span_id = remote_parent_span_id
+        # 壁時計はトレース開始時に1回だけ読み、以降の時刻と実行時間は単調時計からの差分で出す
+        # （時計の補正で実行時間が狂わず、ミリ秒未満まで測れる）
+        self._start_ns = time.perf_counter_ns()
+        self._epoch_offset_ns = time.time_ns() - self._start_ns
+        self.start_time = _to_datetime(self._start_ns + self._epoch_offset_ns)
+        self.end_time: Optional[datetime] = None
+        self.duration_ms: Optional[float] = None
         self.spans: List[Dict] = []
         self.status = "running"
         self.error_message = None
         self.metadata = {}
+        
+        # 途中送信（長時間実行のトレースでメモリを溜め込まず、途中経過を見えるようにする）
+        config = get_config()
+        self._flush_span_count = config.get("flush_span_count") or 0
+        self._flush_interval = config.get("flush_interval") or 0
+        self._last_flush = time.monotonic()
+        self.flushed_span_count = 0
     
     def add_span(self, span: Dict):
-        """スパンを追加"""
+        """スパンを追加（閾値を超えたら完了済みスパンを途中送信）"""
         self.spans.append(span)
+        if self._flush_span_count and len(self.spans) >= self._flush_span_count:
+            self.flush_partial()
+        elif self._flush_interval and time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush_partial()
+    
+    def flush_partial(self):
+        """
+        溜まっている完了済みスパンを status="running" のチャンクとして送信
+
+        バックエンドは同じトレースIDのチャンクを追記・集計するので、送ったスパンは手元から捨てる。
+        最後のチャンクは終了時の _send_trace で送られ、ステータスが確定する。
+        """
+        self._last_flush = time.monotonic()
+        if not self.spans or not is_enabled():
+            return
+        chunk = self.to_dict()
+        chunk["status"] = "running"
+        chunk["end_time"] = None
+        chunk["duration_ms"] = None
+        chunk["error_message"] = None
+        self.flushed_span_count += len(self.spans)
+        self.spans = []
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record(chunk)
+        try:
+            get_exporter().submit(chunk)
+        except Exception as e:
+            if get_config().get("debug"):
+                print(f"[AgentScope] Failed to send partial trace: {e}")
+    
+    def now(self) -> datetime:
+        """このトレースの時計での現在時刻"""
+        return _to_datetime(time.perf_counter_ns() + self._epoch_offset_ns)
     
     def finish(self, status: str = "success", error_message: Optional[str] = None):
         """トレースを終了"""
-        self.end_time = datetime.now(timezone.utc)
-        self.duration_ms = int((self.end_time - self.start_time).total_seconds() * 1000)
+        end_ns = time.perf_counter_ns()
+        self.end_time = _to_datetime(end_ns + self._epoch_offset_ns)
+        self.duration_ms = _elapsed_ms(self._start_ns, end_ns)
         self.status = status
         self.error_message = error_message
     
     def to_dict(self) -> Dict:
         """辞書に変換"""
-        return {
+        data = {
             "id": self.trace_id,
             "project_id": get_project_id(),
             "name": self.name,
             "start_time": self.start_time.isoformat(),
-            "end_time": getattr(self, 'end_time', datetime.now(timezone.utc)).isoformat(),
-            "duration_ms": getattr(self, 'duration_ms', None),
+            "end_time": (self.end_time or self.now()).isoformat(),
+            "duration_ms": self.duration_ms,
             "status": self.status,
             "error_message": self.error_message,
             "metadata": self.metadata if self.metadata else None,
             "spans": self.spans
         }
+        release = get_release()
+        if release is not None:
+            data["release"] = release
+        # 下流サービスのチャンク（トレースの状態は呼び出し元のチャンクが決める）
+        if self.remote_parent_span_id is not None:
+            data["remote_parent_span_id"] = self.remote_parent_span_id
+        return data
 
 
 class SpanContext:
@@ -86,13 +168,21 @@ class SpanContext:
         self,
         name: str,
         span_type: str = "function",
-        parent_span_id: Optional[str] = None
+        parent_span_id: Optional[str] = None,
+        trace_ctx: Optional[TraceContext] = None
     ):
-        self.span_id = str(uuid.uuid4())
+        self.span_id = generate_span_id()
         self.name = name
         self.span_type = span_type
         self.parent_span_id = parent_span_id
-        self.start_time = datetime.now(timezone.utc)
+        # 時刻はトレースの壁時計の基準を共有し、単調時計の値だけを記録する
+        self._start_ns = time.perf_counter_ns()
+        if trace_ctx is not None:
+            self._epoch_offset_ns = trace_ctx._epoch_offset_ns
+        else:
+            self._epoch_offset_ns = time.time_ns() - self._start_ns
+        self._end_ns: Optional[int] = None
+        self.duration_ms: Optional[float] = None
         self.model = None
         self.input_tokens = None
         self.output_tokens = None
@@ -101,6 +191,10 @@ class SpanContext:
         self.output_data = None
         self.status = "running"
         self.error_message = None
+        # 応答キャッシュのヒット（None ならキャッシュを使っていない呼び出し）
+        self.cache_hit: Optional[bool] = None
+        self.saved_cost_usd: Optional[float] = None
+        self.saved_duration_ms: Optional[float] = None
     
     def set_llm_info(
         self,
@@ -130,23 +224,34 @@ class SpanContext:
         except:
             self.output_data = None
     
+    @property
+    def start_time(self) -> datetime:
+        return _to_datetime(self._start_ns + self._epoch_offset_ns)
+    
+    @property
+    def end_time(self) -> Optional[datetime]:
+        if self._end_ns is None:
+            return None
+        return _to_datetime(self._end_ns + self._epoch_offset_ns)
+    
     def finish(self, status: str = "success", error_message: Optional[str] = None):
         """スパンを終了"""
-        self.end_time = datetime.now(timezone.utc)
-        self.duration_ms = int((self.end_time - self.start_time).total_seconds() * 1000)
+        self._end_ns = time.perf_counter_ns()
+        self.duration_ms = _elapsed_ms(self._start_ns, self._end_ns)
         self.status = status
         self.error_message = error_message
     
     def to_dict(self) -> Dict:
         """辞書に変換"""
-        return {
+        end_ns = self._end_ns if self._end_ns is not None else time.perf_counter_ns()
+        data = {
             "id": self.span_id,
             "parent_span_id": self.parent_span_id,
             "name": self.name,
             "span_type": self.span_type,
-            "start_time": self.start_time.isoformat(),
-            "end_time": getattr(self, 'end_time', datetime.now(timezone.utc)).isoformat(),
-            "duration_ms": getattr(self, 'duration_ms', None),
+            "start_time": _to_datetime(self._start_ns + self._epoch_offset_ns).isoformat(),
+            "end_time": _to_datetime(end_ns + self._epoch_offset_ns).isoformat(),
+            "duration_ms": self.duration_ms,
             "model": self.model,
             "input_tokens": self.input_tokens,
             "output_tokens": self.output_tokens,
@@ -156,6 +261,12 @@ class SpanContext:
             "status": self.status,
             "error_message": self.error_message
         }
+        # キャッシュ関連の項目は使ったときだけ送る
+        if self.cache_hit is not None:
+            data["cache_hit"] = self.cache_hit
+            data["saved_cost_usd"] = self.saved_cost_usd
+            data["saved_duration_ms"] = self.saved_duration_ms
+        return data
 
 
 def trace(
@@ -202,7 +313,8 @@ def trace(
             span_ctx = SpanContext(
                 name=trace_name,
                 span_type=span_type,
-                parent_span_id=parent_span.span_id if parent_span else None
+                parent_span_id=parent_span.span_id if parent_span else trace_ctx.remote_parent_span_id,
+                trace_ctx=trace_ctx
             )
             
             # 入力を記録
@@ -301,11 +413,17 @@ def add_span(
     cost_usd: Optional[float] = None,
     input_data: Optional[Dict] = None,
     output_data: Optional[Dict] = None,
-    duration_ms: Optional[int] = None
+    duration_ms: Optional[float] = None,
+    cache_hit: Optional[bool] = None,
+    saved_cost_usd: Optional[float] = None,
+    saved_duration_ms: Optional[float] = None
 ):
     """
     現在のトレースにスパンを手動で追加
     
+    cache_hit=True のスパンは応答キャッシュから返した呼び出しで、saved_cost_usd と
+    saved_duration_ms に本来かかったはずのコストと時間（との差）を入れる。
+    
     Example:
         >>> add_span(
         ...     name="openai_call",
@@ -323,7 +441,8 @@ def add_span(
     span = SpanContext(
         name=name,
         span_type=span_type,
-        parent_span_id=parent_span.span_id if parent_span else None
+        parent_span_id=parent_span.span_id if parent_span else trace_ctx.remote_parent_span_id,
+        trace_ctx=trace_ctx
     )
     
     if model:
@@ -332,10 +451,16 @@ def add_span(
         span.set_input(input_data)
     if output_data:
         span.set_output(output_data)
+    if cache_hit is not None:
+        span.cache_hit = cache_hit
+        span.saved_cost_usd = saved_cost_usd
+        span.saved_duration_ms = saved_duration_ms
     
     span.finish(status="success")
-    if duration_ms:
+    if duration_ms is not None:
+        # 計測済みの区間として、終了時刻から逆算した開始時刻にする
         span.duration_ms = duration_ms
+        span._start_ns = span._end_ns - int(duration_ms * 1_000_000)
     
     trace_ctx.add_span(span.to_dict())
 
@@ -348,12 +473,16 @@ def _send_trace(trace_ctx: TraceContext):
     config = get_config()
     if config.get("debug"):
         print(f"[AgentScope] Sending trace: {trace_ctx.name}")
-        print(f"  Spans: {len(trace_ctx.spans)}")
+        print(f"  Spans: {trace_ctx.flushed_span_count + len(trace_ctx.spans)}")
         print(f"  Duration: {getattr(trace_ctx, 'duration_ms', 'N/A')}ms")
     
+    trace_data = trace_ctx.to_dict()
+    # 送信の成否に関係なく手元にも残す（バックエンドに届かないときの調査用）
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.record(trace_data)
     try:
-        client = get_client()
-        client.send_trace(trace_ctx.to_dict())
+        get_exporter().submit(trace_data)
     except Exception as e:
         if config.get("debug"):
             print(f"[AgentScope] Failed to send trace: {e}")
@@ -0,0 +1,109 @@
+"""
+SDK import-time regression check
+
+Runs each import statement in a fresh interpreter with `-X importtime`, reports the
+cumulative time spent in agentscope modules, and fails when a statement pulls in a
+heavy dependency (httpx, openai) or exceeds the time budget.
+
+Usage:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --max-ms 20 --runs 10
+"""
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+SDK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# (import文, 読み込まれてはいけないモジュール)
+SCENARIOS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("import agentscope", ("httpx", "openai", "agentscope.trace", "agentscope.client")),
+    ("from agentscope import trace, init", ("httpx", "openai", "agentscope.client", "socket")),
+    ("from agentscope.integrations import patch_openai", ("httpx", "openai")),
+]
+
+
+def _importtime(statement: str) -> Tuple[float, Dict[str, int]]:
+    """
+    新しいインタプリタで import 文を実行し、agentscope 配下の累積時間（ms）と
+    モジュールごとの累積時間（µs）を返す
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=SDK_DIR, capture_output=True, text=True, check=True,
+    )
+    modules: Dict[str, int] = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        try:
+            cumulative_us = int(cumulative)
+        except ValueError:
+            continue  # ヘッダー行
+        module = name.strip()
+        modules[module] = cumulative_us
+        # 最上位（インデントなし）のエントリだけを足す（入れ子を二重に数えない）
+        if name[1:2] != " " and module.split(".")[0] == "agentscope":
+            total_us += cumulative_us
+    return total_us / 1000, modules
+
+
+def _loaded(statement: str, modules: Tuple[str, ...]) -> List[str]:
+    """import 文の実行後に sys.modules に入っている禁止モジュール"""
+    probe = f"{statement}\nimport sys\nprint(' '.join(m for m in {modules!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", probe], cwd=SDK_DIR, capture_output=True, text=True, check=True,
+    )
+    return result.stdout.split()
+
+
+def run(runs: int, max_ms: Optional[float]) -> int:
+    """全シナリオを計測し、問題のあった数を返す"""
+    # バイトコードのコンパイル時間を計測に含めない（インストール済みパッケージと同じ条件にする）
+    compileall.compile_dir(os.path.join(SDK_DIR, "agentscope"), quiet=1)
+
+    failures = 0
+    for statement, forbidden in SCENARIOS:
+        timings = []
+        breakdown: Dict[str, int] = {}
+        for _ in range(runs):
+            total_ms, modules = _importtime(statement)
+            timings.append(total_ms)
+            breakdown = modules
+        best = min(timings)
+        loaded = _loaded(statement, forbidden)
+
+        flags = []
+        if loaded:
+            flags.append(f"LOADED {', '.join(loaded)}")
+        if max_ms is not None and best > max_ms:
+            flags.append(f"OVER {max_ms:g} ms")
+        failures += bool(flags)
+
+        print(f"{statement:52s} {best:8.2f} ms  {'  '.join(flags)}", file=sys.stderr)
+        top = sorted(
+            ((us, m) for m, us in breakdown.items() if m.startswith("agentscope")), reverse=True
+        )[:3]
+        for us, module in top:
+            print(f"    {module:48s} {us / 1000:8.2f} ms (cumulative)", file=sys.stderr)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgentScope SDK import-time check")
+    parser.add_argument("--runs", type=int, default=5, help="各import文の計測回数（最小値を使う）")
+    parser.add_argument("--max-ms", type=float, default=25.0,
+                        help="agentscope 配下の累積import時間の上限（ms）。0 で時間は見ない")
+    args = parser.parse_args()
+
+    failures = run(args.runs, args.max_ms or None)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
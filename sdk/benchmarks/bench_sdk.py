@@ -0,0 +1,542 @@
+"""
+SDK overhead micro-benchmarks
+
+Measures the per-call cost of the SDK hot paths (ns/call and memory per call)
+and stores the results as JSON so that versions can be compared.
+
+Usage:
+    python benchmarks/bench_sdk.py                       # 実行して results/<version>.json に保存
+    python benchmarks/bench_sdk.py --quick               # ループ回数を減らして実行
+    python benchmarks/bench_sdk.py --compare results/0.1.0.json
+    python benchmarks/bench_sdk.py --filter trace_
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# (名前, セットアップ関数, 1回あたりのループ数)
+# セットアップ関数は計測対象の呼び出し（引数なし）を返す
+BENCHMARKS: List[Tuple[str, Callable[[], Callable[[], object]], int]] = []
+
+
+def benchmark(name: str, loops: int):
+    """ベンチマークを登録するデコレータ"""
+    def decorator(setup: Callable[[], Callable[[], object]]):
+        BENCHMARKS.append((name, setup, loops))
+        return setup
+    return decorator
+
+
+# ===== Stubs =====
+
+class StubExporter:
+    """送信せずに破棄するエクスポーター（エクスポート経路のコストだけを残す）"""
+
+    def submit(self, trace_data: Dict) -> bool:
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return True
+
+    def shutdown(self, timeout: Optional[float] = None):
+        pass
+
+
+def _install_stub_exporter():
+    """グローバルエクスポーターをスタブに差し替える"""
+    from agentscope import exporter
+
+    exporter._exporter = StubExporter()
+
+
+def _install_fake_openai():
+    """
+    openai パッケージの代わりに最小限の偽モジュールを登録する
+
+    patch_openai が差し替える Completions.create と、レスポンスの usage/choices だけを持つ。
+    """
+    if "openai" in sys.modules and not getattr(sys.modules["openai"], "_agentscope_fake", False):
+        return
+
+    usage = types.SimpleNamespace(prompt_tokens=120, completion_tokens=40)
+    message = types.SimpleNamespace(content="Hello! How can I help you today?")
+    response = types.SimpleNamespace(usage=usage, choices=[types.SimpleNamespace(message=message)])
+
+    class Completions:
+        def create(self, *args, **kwargs):
+            return response
+
+    openai = types.ModuleType("openai")
+    openai._agentscope_fake = True
+    openai.resources = types.SimpleNamespace(chat=types.SimpleNamespace(Completions=Completions))
+    sys.modules["openai"] = openai
+
+
+def _init(enabled: bool = True, flight_recorder: int = 0):
+    import agentscope
+
+    agentscope.init(project_id="bench", api_key="bench", enabled=enabled, flight_recorder=flight_recorder)
+    _install_stub_exporter()
+
+
+# ===== Benchmarks =====
+
+@benchmark("trace_disabled", loops=20_000)
+def setup_trace_disabled():
+    from agentscope import trace
+
+    _init(enabled=False)
+
+    @trace
+    def work(x):
+        return x
+
+    return lambda: work(1)
+
+
+@benchmark("trace_enabled_stub_exporter", loops=5_000)
+def setup_trace_enabled():
+    from agentscope import trace
+
+    _init()
+
+    @trace
+    def work(x):
+        return x
+
+    return lambda: work(1)
+
+
+# リングバッファへの記録は参照の代入だけ（差分の大半は、保持したトレースをGCが走査するコスト）
+@benchmark("trace_enabled_flight_recorder", loops=5_000)
+def setup_trace_flight_recorder():
+    from agentscope import trace
+
+    _init(flight_recorder=1000)
+
+    @trace
+    def work(x):
+        return x
+
+    return lambda: work(1)
+
+
+def _nested(depth: int):
+    from agentscope import trace
+
+    _init()
+
+    @trace
+    def leaf(x):
+        return x
+
+    func = leaf
+    for _ in range(depth - 1):
+        def make(inner):
+            @trace
+            def level(x):
+                return inner(x)
+            return level
+        func = make(func)
+
+    return lambda: func(1)
+
+
+@benchmark("trace_nested_1", loops=5_000)
+def setup_nested_1():
+    return _nested(1)
+
+
+@benchmark("trace_nested_10", loops=500)
+def setup_nested_10():
+    return _nested(10)
+
+
+@benchmark("trace_nested_100", loops=50)
+def setup_nested_100():
+    return _nested(100)
+
+
+@benchmark("add_span", loops=10_000)
+def setup_add_span():
+    from agentscope.trace import TraceContext, add_span, _set_current_trace
+
+    _init()
+    trace_ctx = TraceContext(name="bench")
+    _set_current_trace(trace_ctx)
+
+    def call():
+        add_span(
+            name="openai.chat.completions.create",
+            span_type="llm",
+            model="gpt-4o",
+            input_tokens=120,
+            output_tokens=40,
+            cost_usd=0.0012,
+            input_data={"messages": [{"role": "user", "content": "hello"}]},
+            output_data={"content": "hi"},
+        )
+        # スパンを溜め続けないよう定期的に捨てる
+        if len(trace_ctx.spans) >= 1000:
+            trace_ctx.spans.clear()
+
+    return call
+
+
+def _trace_with_spans(span_count: int):
+    from agentscope.trace import TraceContext, SpanContext
+
+    _init()
+    trace_ctx = TraceContext(name="bench")
+    for i in range(span_count):
+        span = SpanContext(name=f"step_{i}", span_type="tool")
+        span.set_input({"query": "hello"})
+        span.set_output({"result": "world"})
+        span.finish()
+        # add_span は閾値で途中送信してしまうので直接積む
+        trace_ctx.spans.append(span.to_dict())
+    trace_ctx.finish()
+    return trace_ctx.to_dict
+
+
+@benchmark("trace_to_dict_100_spans", loops=2_000)
+def setup_to_dict_100():
+    return _trace_with_spans(100)
+
+
+@benchmark("trace_to_dict_10000_spans", loops=50)
+def setup_to_dict_10000():
+    return _trace_with_spans(10_000)
+
+
+@benchmark("openai_create_unpatched", loops=20_000)
+def setup_openai_unpatched():
+    _install_fake_openai()
+    import openai
+
+    completions = openai.resources.chat.Completions()
+    messages = [{"role": "user", "content": "hello"}]
+    return lambda: completions.create(model="gpt-4o-mini", messages=messages)
+
+
+@benchmark("openai_create_patched", loops=5_000)
+def setup_openai_patched():
+    _install_fake_openai()
+    import openai
+    from agentscope.integrations.openai import patch_openai
+    from agentscope.trace import TraceContext, _set_current_trace
+
+    _init()
+    if not getattr(openai.resources.chat.Completions.create, "__wrapped__", None):
+        patch_openai()
+
+    trace_ctx = TraceContext(name="bench")
+    _set_current_trace(trace_ctx)
+    completions = openai.resources.chat.Completions()
+    messages = [{"role": "user", "content": "hello"}]
+
+    def call():
+        completions.create(model="gpt-4o-mini", messages=messages)
+        if len(trace_ctx.spans) >= 1000:
+            trace_ctx.spans.clear()
+
+    return call
+
+
+def _redactor(cache_size: int = 0):
+    from agentscope.redaction import Redactor, BUILTIN_PATTERNS
+
+    # cache_size=0 で毎回すべての文字列を検査する（最悪ケース）
+    return Redactor(
+        keys=["password", "api_key"],
+        allow_keys=["model"],
+        patterns=tuple(BUILTIN_PATTERNS),
+        max_string_length=2000,
+        cache_size=cache_size,
+    )
+
+
+def _llm_span(content: str) -> Dict:
+    return {
+        "id": "span",
+        "name": "openai.chat.completions.create",
+        "span_type": "llm",
+        "model": "gpt-4o",
+        "input_data": {"messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": content},
+        ]},
+        "output_data": {"content": "Sure, here is a summary of the order status for you."},
+        "status": "success",
+        "error_message": None,
+    }
+
+
+# マスクは送信スレッドで走るので呼び出し元のコストではないが、スパンあたり数µsに収まっていることを見る
+@benchmark("redact_span_clean", loops=20_000)
+def setup_redact_span_clean():
+    redactor = _redactor()
+    span = _llm_span("What is the status of order 12345? It was placed last Tuesday.")
+    return lambda: redactor.redact_span(dict(span))
+
+
+@benchmark("redact_span_pii", loops=20_000)
+def setup_redact_span_pii():
+    redactor = _redactor()
+    span = _llm_span(
+        "I'm john.doe@example.com, card 4111 1111 1111 1111, key sk-abcdefghijklmnopqrstuvwx"
+    )
+    return lambda: redactor.redact_span(dict(span))
+
+
+@benchmark("redact_trace_100_spans", loops=500)
+def setup_redact_trace_100():
+    # システムプロンプトなど繰り返し現れる文字列はキャッシュに当たる（通常の設定）
+    redactor = _redactor(cache_size=4096)
+    spans = [_llm_span(f"step {i}: summarize the previous answer in two sentences") for i in range(100)]
+
+    def call():
+        redactor.redact_trace({"id": "trace", "metadata": None, "spans": [dict(s) for s in spans]})
+
+    return call
+
+
+# キャッシュヒットはLLM呼び出しの代わりになるので、キー計算と参照が数µsに収まっていることを見る
+@benchmark("response_cache_lookup_hit", loops=20_000)
+def setup_response_cache_hit():
+    from agentscope.response_cache import ResponseCache, cache_key
+
+    cache = ResponseCache(max_bytes=1024 * 1024, ttl=3600)
+    params = {
+        "model": "gpt-4o-mini",
+        "temperature": 0,
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": "Classify the sentiment of: the delivery was late again."},
+        ],
+    }
+    cache.put(cache_key(params), b"{}" * 500, {"model": "gpt-4o-mini"})
+    return lambda: cache.get(cache_key(params))
+
+
+class _NoopCallbackHandler:
+    """何もしない LangChain コールバックハンドラ（比較の基準）"""
+
+    def _noop(self, *args, **kwargs):
+        pass
+
+    on_chain_start = on_chain_end = on_chat_model_start = on_llm_end = _noop
+    on_tool_start = on_tool_end = on_retriever_start = on_retriever_end = _noop
+
+
+def _langchain_run(handler):
+    """
+    1回の invoke で LangChain が呼ぶのと同じ順序のコールバック（10 run・20 回）
+
+    chain(ルート) > [retriever, chain > chat_model, chain > tool x2, chain x3]
+    langchain がなくても動くよう、コールバックを直接呼ぶ。
+    """
+    import uuid
+
+    usage = {"input_tokens": 120, "output_tokens": 40, "total_tokens": 160}
+    message = types.SimpleNamespace(usage_metadata=usage, response_metadata={"model_name": "gpt-4o-mini"})
+    generation = types.SimpleNamespace(message=message, text="Hello! How can I help you today?")
+    llm_result = types.SimpleNamespace(llm_output=None, generations=[[generation]])
+    serialized = {"id": ["langchain", "schema", "runnable", "RunnableSequence"]}
+    inputs = {"question": "What is the status of order 12345?"}
+    params = {"invocation_params": {"model": "gpt-4o-mini"}}
+
+    def call():
+        root = uuid.uuid4()
+        handler.on_chain_start(serialized, inputs, run_id=root, parent_run_id=None)
+        retriever = uuid.uuid4()
+        handler.on_retriever_start(serialized, "order 12345", run_id=retriever, parent_run_id=root)
+        handler.on_retriever_end([], run_id=retriever, parent_run_id=root)
+        step = uuid.uuid4()
+        handler.on_chain_start(serialized, inputs, run_id=step, parent_run_id=root, name="prompt")
+        llm = uuid.uuid4()
+        handler.on_chat_model_start(serialized, [[]], run_id=llm, parent_run_id=step, **params)
+        handler.on_llm_end(llm_result, run_id=llm, parent_run_id=step)
+        handler.on_chain_end({"text": "ok"}, run_id=step, parent_run_id=root)
+        step = uuid.uuid4()
+        handler.on_chain_start(serialized, inputs, run_id=step, parent_run_id=root, name="tools")
+        for _ in range(2):
+            tool = uuid.uuid4()
+            handler.on_tool_start(serialized, "12345", run_id=tool, parent_run_id=step, name="lookup_order")
+            handler.on_tool_end("shipped", run_id=tool, parent_run_id=step)
+        handler.on_chain_end({"text": "ok"}, run_id=step, parent_run_id=root)
+        for i in range(3):
+            step = uuid.uuid4()
+            handler.on_chain_start(serialized, inputs, run_id=step, parent_run_id=root, name=f"parse_{i}")
+            handler.on_chain_end({"text": "ok"}, run_id=step, parent_run_id=root)
+        handler.on_chain_end({"answer": "shipped"}, run_id=root, parent_run_id=None)
+
+    return call
+
+
+# 1トレース（10 run）あたりの差が、ハンドラが足すコスト
+@benchmark("langchain_callbacks_noop", loops=5_000)
+def setup_langchain_noop():
+    return _langchain_run(_NoopCallbackHandler())
+
+
+@benchmark("langchain_callbacks_agentscope", loops=2_000)
+def setup_langchain_agentscope():
+    from agentscope.integrations.langchain import AgentScopeCallbackHandler
+
+    _init()
+    return _langchain_run(AgentScopeCallbackHandler())
+
+
+# ===== Harness =====
+
+def _reset_context():
+    """ベンチマーク間でスレッドローカルのトレース状態を消す"""
+    from agentscope.trace import _set_current_trace, _set_current_span
+
+    _set_current_trace(None)
+    _set_current_span(None)
+
+
+def measure(func: Callable[[], object], loops: int, repeats: int) -> Dict:
+    """
+    1回あたりの実行時間とメモリを計測
+
+    時間は repeats 回の計測の中央値と最小値（GCは停止）。
+    メモリは tracemalloc による1回あたりのピーク増分と、呼び出し後も残る増分。
+    """
+    # ウォームアップ
+    for _ in range(max(1, loops // 10)):
+        func()
+
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter_ns()
+            for _ in range(loops):
+                func()
+            timings.append((time.perf_counter_ns() - start) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    alloc_loops = max(1, min(loops, 1000))
+    tracemalloc.start()
+    try:
+        func()
+        base_current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        peak_bytes = max(0, peak - base_current)
+
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(alloc_loops):
+            func()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "loops": loops,
+        "repeats": repeats,
+        "ns_per_call": round(statistics.median(timings), 1),
+        "ns_per_call_min": round(min(timings), 1),
+        "ns_per_call_stdev": round(statistics.stdev(timings), 1) if len(timings) > 1 else 0.0,
+        "peak_bytes_per_call": peak_bytes,
+        "retained_bytes_per_call": round(max(0, after - before) / alloc_loops, 1),
+    }
+
+
+def run(filter_text: Optional[str], quick: bool) -> Dict:
+    """登録済みのベンチマークを実行"""
+    import agentscope
+
+    results = {}
+    for name, setup, loops in BENCHMARKS:
+        if filter_text and filter_text not in name:
+            continue
+        _reset_context()
+        func = setup()
+        if quick:
+            loops = max(1, loops // 10)
+        results[name] = measure(func, loops=loops, repeats=3 if quick else 7)
+        _reset_context()
+        r = results[name]
+        print(f"{name:32s} {r['ns_per_call']:>14,.0f} ns/call  "
+              f"peak {r['peak_bytes_per_call']:>9,} B  retained {r['retained_bytes_per_call']:>9,.0f} B",
+              file=sys.stderr)
+
+    return {
+        "version": agentscope.__version__,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline_path: str, threshold: float) -> int:
+    """ベースラインとの差分を表示し、閾値を超えた退行の数を返す"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = 0
+    print(f"\nvs {baseline.get('version')} ({baseline_path})", file=sys.stderr)
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = result["ns_per_call"] / base["ns_per_call"] if base["ns_per_call"] else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:32s} {base['ns_per_call']:>12,.0f} -> {result['ns_per_call']:>12,.0f} ns "
+              f"({(ratio - 1) * 100:+.1f}%){flag}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AgentScope SDK micro-benchmarks")
+    parser.add_argument("--filter", default=None, help="名前にこの文字列を含むベンチマークだけ実行")
+    parser.add_argument("--quick", action="store_true", help="ループ回数を1/10にする")
+    parser.add_argument("--output", default=None, help="結果の保存先（既定: results/<version>.json）")
+    parser.add_argument("--no-save", action="store_true", help="結果を保存しない")
+    parser.add_argument("--compare", default=None, help="比較するベースラインのJSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="退行とみなす悪化率（既定10%%）")
+    args = parser.parse_args()
+
+    current = run(args.filter, args.quick)
+
+    if not args.no_save:
+        output = args.output or os.path.join(RESULTS_DIR, f"{current['version']}.json")
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nSaved to {output}", file=sys.stderr)
+
+    if args.compare:
+        regressions = compare(current, args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
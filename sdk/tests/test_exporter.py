@@ -0,0 +1,90 @@
+"""
+Redaction must not touch the dicts the flight recorder holds
+"""
+import copy
+
+import pytest
+
+import agentscope.client
+from agentscope.exporter import BatchExporter, SyncExporter
+from agentscope.recorder import FlightRecorder
+from agentscope.redaction import REDACTED, Redactor
+
+
+class _CapturingClient:
+    def __init__(self):
+        self.sent = []
+
+    def send_trace(self, trace_data):
+        self.sent.append(trace_data)
+        return True
+
+    def send_batch(self, traces):
+        self.sent.extend(traces)
+        return True
+
+
+@pytest.fixture
+def client(monkeypatch):
+    captured = _CapturingClient()
+    monkeypatch.setattr(agentscope.client, "get_client", lambda: captured)
+    return captured
+
+
+def _trace():
+    return {
+        "id": "t1",
+        "name": "agent",
+        "status": "error",
+        "error_message": "login failed for alice@example.com",
+        "metadata": {"password": "hunter2", "user": "alice@example.com"},
+        "spans": [{
+            "id": "s1",
+            "name": "llm_call",
+            "input_data": {"prompt": "mail bob@example.com", "token": "abc"},
+            "output_data": None,
+            "error_message": None,
+        }],
+    }
+
+
+def _redactor():
+    return Redactor(keys=["password", "token"], patterns=["email"])
+
+
+@pytest.mark.parametrize("make_exporter", [
+    lambda redactor: BatchExporter(flush_interval=0.01, redactor=redactor),
+    SyncExporter,
+])
+def test_redaction_leaves_recorded_trace_untouched(client, make_exporter):
+    recorder = FlightRecorder(4)
+    trace_data = _trace()
+    original = copy.deepcopy(trace_data)
+    recorder.record(trace_data)
+
+    exporter = make_exporter(_redactor())
+    exporter.submit(trace_data)
+    assert exporter.flush(timeout=5.0)
+    exporter.shutdown(timeout=5.0)
+
+    assert recorder.traces() == [original]
+    assert recorder.traces()[0] is trace_data
+
+    [sent] = client.sent
+    assert sent is not trace_data
+    assert sent["metadata"]["password"] == REDACTED
+    assert "alice@example.com" not in sent["error_message"]
+    assert sent["spans"][0]["input_data"]["token"] == REDACTED
+    assert "bob@example.com" not in sent["spans"][0]["input_data"]["prompt"]
+    assert sent["spans"][0]["id"] == "s1"
+
+
+def test_redact_trace_returns_copy():
+    trace_data = _trace()
+    original = copy.deepcopy(trace_data)
+
+    redacted = _redactor().redact_trace(trace_data)
+
+    assert trace_data == original
+    assert redacted["spans"][0] is not trace_data["spans"][0]
+    assert redacted["metadata"]["password"] == REDACTED
@@ -0,0 +1,38 @@
+"""
+Importing the SDK must not pull in heavy dependencies
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+SDK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY_MODULES = ("httpx", "openai")
+
+
+def _imported_modules(statement: str):
+    """新しいインタプリタで import 文を実行し、HEAVY_MODULES のうち読み込まれたものと importtime の出力を返す"""
+    check = f"import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"{statement}; {check}"],
+        cwd=SDK_DIR, capture_output=True, text=True, check=True,
+    )
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return loaded, result.stderr
+
+
+@pytest.mark.parametrize("statement", [
+    "import agentscope",
+    "from agentscope import trace, init",
+    "from agentscope.integrations import patch_openai",
+])
+def test_import_does_not_load_heavy_dependencies(statement):
+    loaded, importtime = _imported_modules(statement)
+
+    assert loaded == []
+    # -X importtime の行は "import time: self | cumulative | モジュール名"
+    imported = {line.rsplit("|", 1)[-1].strip() for line in importtime.splitlines() if "|" in line}
+    assert "agentscope" in imported
+    assert not imported & set(HEAVY_MODULES)